@@ -0,0 +1,95 @@
+import os
+import sys
+import json
+import torch
+import tempfile
+import argparse
+import subprocess
+from common import create_vocab, create_model
+from gpt2.misc import serializing
+
+# The cold start is measured in a fresh interpreter, so the import time of the
+# benchmark process is not included.
+_COLD_START = '''
+import sys, time, json, torch
+sys.path.insert(0, {src!r})
+from gpt2.modeling.transformer import Transformer
+from gpt2.misc import serializing
+
+start = time.perf_counter()
+config = {config!r}
+model = Transformer(layers=config['layers'], pad_idx=0,
+                    words=config['words'], seq_len=config['seq_len'],
+                    heads=config['heads'], dims=config['dims'],
+                    rate=config['rate'], dropout=0, bidirectional=False)
+model.eval()
+serializing.load_model(model, {path!r})
+loaded = time.perf_counter()
+
+with torch.inference_mode():
+    model(torch.randint(config['words'], (1, 16)))
+forwarded = time.perf_counter()
+
+with open('/proc/self/status') as fp:
+    rss = [int(line.split()[1]) for line in fp if line.startswith('VmHWM')][0]
+print(json.dumps({{'load': loaded - start, 'forward': forwarded - start,
+                  'rss': rss / 1024}}))
+'''
+
+
+def _drop_page_cache(path: str):
+    # Evict the file pages, so the first access reads from disk. This is best
+    # effort and silently ignored if it is not supported.
+    if hasattr(os, 'posix_fadvise'):
+        with open(path, 'rb') as fp:
+            os.posix_fadvise(fp.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def _benchmark_checkpoint(args: argparse.Namespace):
+    vocab = create_vocab()
+    model = create_model(vocab, seq_len=args.seq_len, layers=args.layers,
+                         dims=args.dims, heads=args.heads)
+    config = {'layers': args.layers, 'heads': args.heads, 'dims': args.dims,
+              'rate': 4, 'seq_len': args.seq_len, 'words': len(vocab)}
+
+    directory = tempfile.mkdtemp()
+    paths = {'pickle': os.path.join(directory, 'ckpt.pth'),
+             'mmap': os.path.join(directory, 'ckpt.tensors')}
+    torch.save({'model': model.state_dict()}, paths['pickle'])
+    serializing.save_tensors(paths['mmap'], model.state_dict(), config)
+
+    src = os.path.join(os.path.dirname(__file__), '..', 'src')
+    for name, path in paths.items():
+        results = []
+        for _ in range(args.repeat):
+            if args.cold:
+                _drop_page_cache(path)
+
+            code = _COLD_START.format(src=src, config=config, path=path)
+            output = subprocess.check_output([sys.executable, '-c', code])
+            results.append(json.loads(output))
+
+        results.sort(key=lambda r: r['forward'])
+        median = results[len(results) // 2]
+        print(f'[{name:6s}] size: {os.path.getsize(path) / 2 ** 20:.1f}MB, '
+              f'load: {median["load"] * 1000:.1f}ms, '
+              f'first forward: {median["forward"] * 1000:.1f}ms, '
+              f'peak rss: {median["rss"]:.1f}MB')
+
+    for path in paths.values():
+        os.remove(path)
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='benchmark cold start of pickle and tensor checkpoints')
+    parser.add_argument('--seq_len', default=128, type=int)
+    parser.add_argument('--layers', default=8, type=int)
+    parser.add_argument('--heads', default=8, type=int)
+    parser.add_argument('--dims', default=512, type=int)
+    parser.add_argument('--repeat', default=5, type=int)
+    parser.add_argument('--cold', action='store_true',
+                        help='evict checkpoint from page cache before runs')
+
+    _benchmark_checkpoint(parser.parse_args())
@@ -0,0 +1,119 @@
+import time
+import torch
+import argparse
+import torch.optim as optim
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from common import create_vocab, create_model
+from gpt2.misc.objective import LMObjective
+from gpt2.misc.training import Trainer
+from gpt2.utils import distributing
+from torch.distributed.algorithms.ddp_comm_hooks import default_hooks
+
+
+class _CountingDataset(object):
+    def __init__(self, words: int, batch: int, seq_len: int, offset: int):
+        self.words = words
+        self.batch = batch
+        self.seq_len = seq_len
+        self.offset = offset
+
+    def skip(self, count: int):
+        pass
+
+    def fetch(self, batch=None, device=None):
+        # Each sequence counts up the words from a random start, so the loss
+        # decreases as the model learns it.
+        start = torch.randint(self.words, (self.batch, 1))
+        data = (start + torch.arange(self.seq_len + 1)) % self.words
+        data = data + self.offset
+        return {'input': data[:, :-1], 'output': data[:, 1:]}
+
+    def state_dict(self):
+        return {}
+
+
+def _count_all_reduce(counter: list):
+    # Count the bytes of the tensors which are all-reduced by the hooks.
+    def _modified_all_reduce(tensor, *args, **kwargs):
+        counter[0] += tensor.numel() * tensor.element_size()
+        return _old_all_reduce(tensor, *args, **kwargs)
+
+    _old_all_reduce = dist.all_reduce
+    dist.all_reduce = _modified_all_reduce
+
+
+def _benchmark_worker(rank: int, hook: str, port: int,
+                      args: argparse.Namespace):
+    distributing.initialize(rank, args.workers, backend='gloo',
+                            init_method=f'tcp://127.0.0.1:{port}',
+                            threads=1)
+
+    torch.manual_seed(0)
+    vocab = create_vocab(args.words)
+    model = create_model(vocab, seq_len=args.seq_len, layers=args.layers,
+                         dims=args.dims).train()
+    objective = LMObjective(model, pad_idx=vocab.pad_idx)
+    optimizer = optim.AdamW(model.parameters(), lr=args.lr)
+    scheduler = optim.lr_scheduler.LambdaLR(optimizer, lambda step: 1)
+
+    torch.manual_seed(rank + 1)
+    dataset = _CountingDataset(len(vocab.words) - vocab.eos_idx - 1,
+                               args.batch, args.seq_len, vocab.eos_idx + 1)
+    trainer = Trainer(model, optimizer, scheduler, dataset, dataset,
+                      train_objective=objective, eval_objective=objective)
+    distributing.apply(trainer)
+
+    # The uncompressed gradients are all-reduced through the default hook in
+    # python, so their bytes are counted in the same way.
+    if hook == 'none':
+        trainer.model.register_comm_hook(None, default_hooks.allreduce_hook)
+    else:
+        distributing.register_comm_hook(
+            trainer, hook, powersgd_rank=args.powersgd_rank,
+            powersgd_start=args.powersgd_start)
+
+    counter = [0]
+    _count_all_reduce(counter)
+
+    elapsed = []
+    for step in range(args.steps):
+        start_time = time.perf_counter()
+        trainer.train(batch=args.batch * args.workers)
+        elapsed.append(time.perf_counter() - start_time)
+
+    # Measure the communicated bytes and the step time after the gradients
+    # are compressed.
+    elapsed = sorted(elapsed[args.powersgd_start:])
+    losses = trainer.batch_metrics['train/loss'][-args.average:]
+    final_loss = sum(losses).item() / args.average
+
+    if rank == 0:
+        print(f'[{hook:>8}] median step time: '
+              f'{elapsed[len(elapsed) // 2] * 1000:.1f}ms, all-reduced: '
+              f'{counter[0] / args.steps / 2 ** 20:.2f}MB/step, '
+              f'final loss: {final_loss:.4f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='benchmark gradient communication hooks.')
+    parser.add_argument('--words', default=2000, type=int)
+    parser.add_argument('--seq_len', default=32, type=int)
+    parser.add_argument('--layers', default=2, type=int)
+    parser.add_argument('--dims', default=256, type=int)
+    parser.add_argument('--batch', default=8, type=int)
+    parser.add_argument('--lr', default=1e-3, type=float)
+    parser.add_argument('--steps', default=300, type=int)
+    parser.add_argument('--average', default=20, type=int)
+    parser.add_argument('--powersgd_rank', default=4, type=int)
+    parser.add_argument('--powersgd_start', default=20, type=int)
+    parser.add_argument('--workers', default=2, type=int)
+    parser.add_argument('--hooks', default=['none', 'fp16', 'bf16',
+                                            'powersgd'], nargs='+')
+    parser.add_argument('--port', default=29541, type=int)
+    args = parser.parse_args()
+
+    for i, hook in enumerate(args.hooks):
+        mp.spawn(_benchmark_worker, args=(hook, args.port + i, args),
+                 nprocs=args.workers)
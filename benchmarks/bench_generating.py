@@ -0,0 +1,50 @@
+import torch
+import argparse
+from common import (create_vocab, create_tokenizer, create_model,
+                    suppress_words, measure)
+from gpt2.misc.generating import Generator, BeamSearchGenerator
+
+
+def _benchmark_best_of_n(args: argparse.Namespace):
+    vocab = create_vocab()
+    model = create_model(vocab, seq_len=args.seq_len, layers=args.layers,
+                         dims=args.dims)
+    generator = Generator(vocab, create_tokenizer(vocab), model,
+                          seq_len=args.seq_len)
+
+    suppress_words(model, vocab)
+
+    context = ' '.join(f'w{i}' for i in range(args.context))
+
+    def _sequential():
+        for _ in range(args.samples):
+            generator.generate(context, samples=1)
+
+    def _batched():
+        generator.generate(context, samples=args.samples)
+
+    beam_search = BeamSearchGenerator(vocab, create_tokenizer(vocab), model,
+                                      seq_len=args.seq_len,
+                                      beam_size=args.samples)
+
+    def _beam_search():
+        beam_search.generate_nbest(context, nbest=args.samples)
+
+    torch.manual_seed(0)
+    for name, func in [('sequential', _sequential), ('batched', _batched),
+                       ('beam', _beam_search)]:
+        median, best = measure(func, repeat=args.repeat)
+        print(f'[{name:>10}] samples: {args.samples}, '
+              f'median: {median * 1000:.1f}ms, best: {best * 1000:.1f}ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', default=20, type=int)
+    parser.add_argument('--context', default=16, type=int)
+    parser.add_argument('--seq_len', default=64, type=int)
+    parser.add_argument('--layers', default=4, type=int)
+    parser.add_argument('--dims', default=256, type=int)
+    parser.add_argument('--repeat', default=3, type=int)
+
+    _benchmark_best_of_n(parser.parse_args())
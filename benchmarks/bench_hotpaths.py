@@ -0,0 +1,60 @@
+import os
+import json
+import pytest
+import common  # noqa: F401
+from gpt2.misc import benchmarking
+
+# Run this module with pytest to measure the hot paths, e.g.
+#
+#     $ python -m pytest -s benchmarks/bench_hotpaths.py
+#
+# If `GPT2_BENCH_BASELINE` is set to the results of `gpt2 bench`, the
+# benchmarks fail on regressions beyond `GPT2_BENCH_THRESHOLD`.
+
+
+@pytest.fixture(scope='module')
+def fixtures(tmp_path_factory):
+    return benchmarking.create_fixtures(str(tmp_path_factory.mktemp('bench')))
+
+
+def _check_results(name: str, results: dict):
+    print(f'[{name}] ' + ', '.join(f'{metric}: {value:.2f}'
+                                   for metric, value in results.items()))
+    assert all(value > 0 for value in results.values())
+
+    if not os.environ.get('GPT2_BENCH_BASELINE'):
+        return
+
+    with open(os.environ['GPT2_BENCH_BASELINE'], 'r') as fp:
+        baseline = json.load(fp)['results']
+
+    threshold = float(os.environ.get('GPT2_BENCH_THRESHOLD', 0.1))
+    regressions = [(metric, base, value) for metric, base, value, regressed
+                   in benchmarking.compare({name: results}, baseline,
+                                           threshold)
+                   if regressed]
+    assert not regressions
+
+
+def test_tokenizer_encode(fixtures):
+    vocab_path, text_path, _ = fixtures
+    _check_results('tokenizer/encode',
+                   benchmarking.bench_tokenizer(vocab_path, text_path))
+
+
+def test_dataset_fetch(fixtures):
+    vocab_path, _, corpus_path = fixtures
+    _check_results('dataset/fetch',
+                   benchmarking.bench_dataset(vocab_path, corpus_path))
+
+
+@pytest.mark.parametrize('size', list(benchmarking.MODEL_SIZES))
+def test_transformer(fixtures, size):
+    _check_results(f'transformer/{size}',
+                   benchmarking.bench_transformer(fixtures[0], size))
+
+
+@pytest.mark.parametrize('size', list(benchmarking.MODEL_SIZES))
+def test_generator(fixtures, size):
+    _check_results(f'generator/{size}',
+                   benchmarking.bench_generator(fixtures[0], size))
@@ -0,0 +1,58 @@
+import io
+import time
+import torch
+import tempfile
+import argparse
+import common  # noqa: F401
+from gpt2.misc.recording import Recordable, MetricsLog
+
+# The metrics recorded by the trainer every stamp.
+_METRICS = ['loss', 'tokens_per_sec', 'real_tokens_per_sec',
+            'samples_per_sec', 'tflops', 'data_ms', 'forward_ms',
+            'backward_ms', 'optimizer_ms', 'peak_memory_mb']
+
+
+def _benchmark_recorder(steps: int, directory: str = None):
+    recorder = Recordable()
+    if directory:
+        recorder.metrics_log = MetricsLog(directory)
+
+    # Stamp the metrics of the given training steps.
+    start_time = time.perf_counter()
+    for step in range(steps):
+        recorder.record('train', **{name: float(step) for name in _METRICS})
+        recorder.stamp(step)
+    stamp = (time.perf_counter() - start_time) / steps
+
+    # Serialize the training states of the recorder as in `preserve`.
+    state = {'metrics': recorder.metrics}
+    if directory:
+        state['metrics_log'] = recorder.metrics_log.state_dict()
+
+    buffer = io.BytesIO()
+    start_time = time.perf_counter()
+    torch.save(state, buffer)
+    save = time.perf_counter() - start_time
+
+    return stamp, save, buffer.tell()
+
+
+def _benchmark_metrics_log(args: argparse.Namespace):
+    for steps in args.steps:
+        with tempfile.TemporaryDirectory() as directory:
+            for name, log in [('lists', None), ('log', directory)]:
+                stamp, save, size = _benchmark_recorder(steps, log)
+                print(f'[{name:>5}] steps: {steps:>6}, '
+                      f'stamp: {stamp * 1e6:.1f}us, '
+                      f'save: {save * 1000:.2f}ms, '
+                      f'size: {size / 1024:.1f}KB')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='benchmark checkpointed metrics of long training runs.')
+    parser.add_argument('--steps', default=[1000, 10000, 100000], type=int,
+                        nargs='+')
+    args = parser.parse_args()
+
+    _benchmark_metrics_log(args)
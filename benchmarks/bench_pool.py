@@ -0,0 +1,74 @@
+import os
+import time
+import argparse
+from common import create_vocab, create_tokenizer, create_model, suppress_words
+from gpt2.misc.generating import Generator
+from gpt2.misc.pooling import GeneratorPool
+
+
+def _proportional_memory(pids) -> float:
+    # Sum the proportional set sizes, which divide the shared pages by the
+    # number of processes sharing them.
+    total = 0
+    for pid in pids:
+        with open(f'/proc/{pid}/smaps_rollup', 'r') as fp:
+            for line in fp:
+                if line.startswith('Pss:'):
+                    total += int(line.split()[1])
+    return total / 1024
+
+
+def _benchmark_pool(args: argparse.Namespace):
+    vocab = create_vocab()
+    model = create_model(vocab, seq_len=args.seq_len, layers=args.layers,
+                         dims=args.dims)
+    suppress_words(model, vocab)
+
+    contexts = [' '.join(f'w{i + j}' for i in range(args.context))
+                for j in range(args.batches * args.batch_size)]
+    batches = [(contexts[i:i + args.batch_size],
+                list(range(i, i + args.batch_size)))
+               for i in range(0, len(contexts), args.batch_size)]
+
+    params = sum(p.numel() * p.element_size() for p in model.parameters())
+    print(f'[model] parameters: {params / 2 ** 20:.1f}MB, '
+          f'cores: {len(os.sched_getaffinity(0))}')
+
+    for workers in args.workers:
+        generator = Generator(vocab, create_tokenizer(vocab), model,
+                              seq_len=args.seq_len)
+        pool = GeneratorPool(generator, workers=workers,
+                             pin_cores=args.pin_cores)
+
+        # Warm up every worker before measuring.
+        pool.generate_batches(batches[:workers])
+        generator.stats['generated_words'] = 0
+
+        start_time = time.perf_counter()
+        pool.generate_batches(batches)
+        elapsed = time.perf_counter() - start_time
+
+        memory = _proportional_memory(
+            [os.getpid()] + [worker.pid for worker in pool.workers])
+        pool.close()
+
+        print(f'[workers: {workers}] '
+              f'prompts/s: {len(contexts) / elapsed:.1f}, '
+              f'words/s: {generator.stats["generated_words"] / elapsed:.1f}, '
+              f'total memory (pss): {memory:.1f}MB')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='benchmark multi-process generator pool.')
+    parser.add_argument('--seq_len', default=64, type=int)
+    parser.add_argument('--layers', default=4, type=int)
+    parser.add_argument('--dims', default=512, type=int)
+    parser.add_argument('--context', default=16, type=int)
+    parser.add_argument('--batches', default=16, type=int)
+    parser.add_argument('--batch_size', default=8, type=int)
+    parser.add_argument('--workers', default=[1, 2, 4], nargs='+', type=int)
+    parser.add_argument('--pin_cores', action='store_true')
+    args = parser.parse_args()
+
+    _benchmark_pool(args)
@@ -0,0 +1,67 @@
+import time
+import torch
+import argparse
+from common import create_vocab, create_tokenizer, create_model, suppress_words
+from gpt2.misc.generating import Generator
+
+
+def _benchmark_pruning(args: argparse.Namespace):
+    vocab = create_vocab()
+    model = create_model(vocab, seq_len=args.seq_len, layers=args.layers,
+                         dims=args.dims)
+    generator = Generator(vocab, create_tokenizer(vocab), model,
+                          seq_len=args.seq_len, temp=args.temp, topk=0)
+
+    suppress_words(model, vocab)
+
+    torch.manual_seed(0)
+    contexts = [' '.join(f'w{i + j}' for i in range(args.context))
+                for j in range(args.contexts)]
+
+    # Generate the candidates without pruning as a reference.
+    references = []
+    for seed, context in enumerate(contexts):
+        words = generator._encode_context(context)
+        references.append(generator._sample(words, args.samples, seed)[1])
+
+    for margin in [None] + args.margins:
+        generator.prune_margin = margin
+        generator.stats = {'generated_words': 0, 'pruned': 0}
+
+        # Compare the chosen candidates with the best ones of the reference.
+        agreed, regret = 0, 0.0
+        start_time = time.perf_counter()
+        for seed, context in enumerate(contexts):
+            words = generator._encode_context(context)
+            _, mean_log_probs = generator._sample(words, args.samples, seed)
+
+            best = max(range(args.samples), key=lambda i: mean_log_probs[i])
+            agreed += references[seed][best] == max(references[seed])
+            regret += max(references[seed]) - references[seed][best]
+        elapsed = time.perf_counter() - start_time
+
+        total = args.contexts * args.samples * (args.seq_len - args.context - 1)
+        print(f'[margin: {str(margin):>5}] '
+              f'generated words: {generator.stats["generated_words"]} '
+              f'({1 - generator.stats["generated_words"] / total:.1%} saved), '
+              f'pruned: {generator.stats["pruned"]}, '
+              f'agreement: {agreed / args.contexts:.1%}, '
+              f'regret: {regret / args.contexts:.4f}, '
+              f'time: {elapsed * 1000 / args.contexts:.1f}ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='benchmark early pruning in best-of-N generation.')
+    parser.add_argument('--seq_len', default=64, type=int)
+    parser.add_argument('--layers', default=4, type=int)
+    parser.add_argument('--dims', default=256, type=int)
+    parser.add_argument('--context', default=8, type=int)
+    parser.add_argument('--contexts', default=8, type=int)
+    parser.add_argument('--samples', default=20, type=int)
+    parser.add_argument('--temp', default=1.0, type=float)
+    parser.add_argument('--margins', default=[2.0, 1.5, 1.0, 0.5],
+                        nargs='+', type=float)
+    args = parser.parse_args()
+
+    _benchmark_pruning(args)
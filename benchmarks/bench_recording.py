@@ -0,0 +1,88 @@
+import time
+import torch
+import argparse
+import torch.nn as nn
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.nn.parallel import DistributedDataParallel
+from common import create_vocab, create_model
+from gpt2.misc.recording import Recordable
+from gpt2.utils import distributing
+
+
+def _train_steps(rank: int, args: argparse.Namespace, deferred: bool):
+    torch.manual_seed(0)
+
+    vocab = create_vocab()
+    model = create_model(vocab, seq_len=args.seq_len, layers=args.layers,
+                         dims=args.dims).train()
+    model = DistributedDataParallel(model)
+    optimizer = torch.optim.SGD(model.parameters(), lr=1e-3)
+    criterion = nn.CrossEntropyLoss(ignore_index=vocab.pad_idx)
+
+    recorder = Recordable()
+    if deferred:
+        distributing._modify_recordable(recorder, args.workers)
+
+    torch.manual_seed(rank)
+    data = torch.randint(len(vocab.words), (args.batch, args.seq_len + 1))
+
+    elapsed = []
+    for step in range(args.steps):
+        start_time = time.perf_counter()
+
+        optimizer.zero_grad()
+        logits, _ = model(data[:, :-1], None)
+        loss = criterion(logits.transpose(1, 2), data[:, 1:])
+        loss.backward()
+        optimizer.step()
+
+        if deferred:
+            # Record the loss tensor and reduce it only in `stamp`.
+            recorder.record('train', loss=loss)
+        else:
+            # Synchronize and reduce the loss every step as before.
+            reduced = loss.detach().clone()
+            dist.all_reduce(reduced, op=dist.ReduceOp.SUM)
+            recorder.record('train', loss=reduced.item() / args.workers)
+
+        if (step + 1) % args.stamp_iters == 0:
+            recorder.stamp(step)
+
+        elapsed.append(time.perf_counter() - start_time)
+
+    return sorted(elapsed)[len(elapsed) // 2], recorder.metrics['train/loss']
+
+
+def _benchmark_worker(rank: int, args: argparse.Namespace):
+    torch.set_num_threads(1)
+    dist.init_process_group('gloo', init_method=args.init_method,
+                            world_size=args.workers, rank=rank)
+
+    results = {name: _train_steps(rank, args, deferred)
+               for name, deferred in [('per-step', False),
+                                      ('deferred', True)]}
+
+    if rank == 0:
+        for name, (median, _) in results.items():
+            print(f'[{name:>8}] median step time: {median * 1000:.2f}ms')
+
+        diff = max(abs(a[1] - b[1]) for a, b in zip(
+            results['per-step'][1], results['deferred'][1]))
+        print(f'[metrics] max difference: {diff:.2e}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='benchmark sync-free metric recording.')
+    parser.add_argument('--seq_len', default=32, type=int)
+    parser.add_argument('--layers', default=2, type=int)
+    parser.add_argument('--dims', default=64, type=int)
+    parser.add_argument('--batch', default=4, type=int)
+    parser.add_argument('--steps', default=200, type=int)
+    parser.add_argument('--stamp_iters', default=50, type=int)
+    parser.add_argument('--workers', default=2, type=int)
+    parser.add_argument('--init_method', default='tcp://127.0.0.1:29531')
+    args = parser.parse_args()
+
+    mp.spawn(_benchmark_worker, args=(args,), nprocs=args.workers)
@@ -0,0 +1,47 @@
+import torch
+import argparse
+import numpy as np
+from common import measure
+from gpt2.misc.sampling import Sampler
+
+
+def _sample_with_numpy(logits: torch.Tensor, temp: float, topk: int):
+    # Sample each row on CPU by using NumPy, as in the previous generator.
+    for row in logits:
+        probs = (row / temp).softmax(-1).numpy()
+        targets = probs.argsort()[-topk:][::-1]
+        np.random.choice(targets, p=(probs[targets] / probs[targets].sum()))
+
+
+def _benchmark_sampling(args: argparse.Namespace):
+    # Language models usually predict peaked distributions.
+    logits = torch.randn((args.batch, args.words)) * 5
+    history = torch.randint(args.words, (args.batch, 64))
+
+    samplers = [
+        ('top-k', Sampler(temp=0.8, topk=40)),
+        ('top-p', Sampler(temp=0.8, topk=None, topp=0.9)),
+        ('penalized', Sampler(temp=0.8, topk=40, repetition_penalty=1.2,
+                              presence_penalty=0.5)),
+        ('greedy', Sampler(greedy=True))]
+    generators = [torch.Generator().manual_seed(i) for i in range(args.batch)]
+
+    median, _ = measure(lambda: _sample_with_numpy(logits, 0.8, 40),
+                        repeat=args.repeat)
+    print(f'[{"numpy":>10}] batch: {args.batch}, words: {args.words}, '
+          f'per token: {median / args.batch * 1e6:.1f}us')
+
+    for name, sampler in samplers:
+        median, _ = measure(lambda: sampler(logits, history, generators),
+                            repeat=args.repeat)
+        print(f'[{name:>10}] batch: {args.batch}, words: {args.words}, '
+              f'per token: {median / args.batch * 1e6:.1f}us')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch', default=20, type=int)
+    parser.add_argument('--words', default=32000, type=int)
+    parser.add_argument('--repeat', default=20, type=int)
+
+    _benchmark_sampling(parser.parse_args())
@@ -0,0 +1,71 @@
+import time
+import torch
+import argparse
+from common import (create_vocab, create_tokenizer, create_model,
+                    suppress_words)
+from gpt2.misc.generating import Generator, SpeculativeGenerator
+from gpt2.misc.sampling import Sampler
+
+
+def _benchmark_speculative_decoding(args: argparse.Namespace):
+    vocab = create_vocab()
+    tokenizer = create_tokenizer(vocab)
+    model = create_model(vocab, seq_len=args.seq_len, layers=args.layers,
+                         dims=args.dims)
+
+    suppress_words(model, vocab)
+
+    # Since the models are not trained, build a draft which approximates the
+    # target by making the upper target layers nearly identity mappings.
+    aligned = create_model(vocab, seq_len=args.seq_len, layers=1,
+                           dims=args.dims)
+    for layer in model.transformers[1:]:
+        for linear in (layer.attn.linear, layer.ff[-1]):
+            torch.nn.init.normal_(linear.weight, std=args.noise)
+            torch.nn.init.zeros_(linear.bias)
+    aligned.load_state_dict(model.state_dict(), strict=False)
+
+    sampler = Sampler(temp=args.temp, topk=args.topk)
+    generators = {
+        'target only': Generator(vocab, tokenizer, model, seq_len=args.seq_len,
+                                 sampler=sampler),
+        'random draft': SpeculativeGenerator(
+            vocab, tokenizer, model,
+            create_model(vocab, seq_len=args.seq_len, layers=1, dims=128),
+            seq_len=args.seq_len, draft_tokens=args.draft_tokens,
+            sampler=sampler),
+        'aligned draft': SpeculativeGenerator(
+            vocab, tokenizer, model, aligned, seq_len=args.seq_len,
+            draft_tokens=args.draft_tokens, sampler=sampler)}
+
+    context = ' '.join(f'w{i}' for i in range(args.context))
+    for name, generator in generators.items():
+        generator.generate(context, samples=1, seed=0)
+
+        start = time.perf_counter()
+        for i in range(args.repeat):
+            generator.generate(context, samples=1, seed=i)
+        elapsed = (time.perf_counter() - start) / args.repeat
+        tokens = args.seq_len - args.context - 1
+
+        line = f'[{name:>15}] per token: {elapsed / tokens * 1000:.2f}ms'
+        if isinstance(generator, SpeculativeGenerator):
+            stats = generator.stats
+            line += (f', acceptance rate: '
+                     f'{stats["accepted"] / stats["proposed"]:.2%}')
+        print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--context', default=16, type=int)
+    parser.add_argument('--seq_len', default=64, type=int)
+    parser.add_argument('--layers', default=6, type=int)
+    parser.add_argument('--dims', default=512, type=int)
+    parser.add_argument('--temp', default=0.8, type=float)
+    parser.add_argument('--topk', default=40, type=int)
+    parser.add_argument('--draft_tokens', default=4, type=int)
+    parser.add_argument('--noise', default=0.001, type=float)
+    parser.add_argument('--repeat', default=3, type=int)
+
+    _benchmark_speculative_decoding(parser.parse_args())
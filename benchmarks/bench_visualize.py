@@ -0,0 +1,76 @@
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+import matplotlib
+import common  # noqa: F401
+from gpt2.misc.recording import MetricsLog
+from gpt2 import visualize
+
+matplotlib.use('Agg')
+
+
+def _write_metrics(metrics_log: MetricsLog, start: int, end: int):
+    # Write the losses of the given steps at once, as they are written by
+    # the trainer one record per stamp.
+    steps = np.arange(start, end)
+    for name, scale in [('train/loss', 1.0), ('eval/loss', 1.1)]:
+        records = np.zeros(len(steps), dtype=[('step', '<i8'),
+                                              ('value', '<f8')])
+        records['step'] = steps
+        records['value'] = scale * (3 + np.exp(-steps / 1e5)
+                                    + 0.05 * np.sin(steps))
+        with open(metrics_log._path(name), 'ab') as fp:
+            fp.write(records.tobytes())
+
+
+def _benchmark_visualize(args: argparse.Namespace):
+    for steps in args.steps:
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, 'ckpt')
+            metrics_log = MetricsLog(f'{checkpoint}.metrics')
+            _write_metrics(metrics_log, 0, steps)
+
+            options = argparse.Namespace(
+                figure=os.path.join(directory, 'figure.png'),
+                throughput_figure=None, interactive=False)
+
+            # Render the whole metrics and the downsampled ones.
+            results = {}
+            for name, points in [('full', steps), ('lttb', args.points)]:
+                options.points = points
+                start_time = time.perf_counter()
+                visualize._render(options, visualize._load_metrics(checkpoint))
+                results[name] = time.perf_counter() - start_time
+
+            # Refresh the plot with the appended metrics in follow mode.
+            tail = visualize._MetricsTail(metrics_log, points=args.points)
+            tail.update()
+
+            elapsed = []
+            for i in range(args.refreshes):
+                _write_metrics(metrics_log, steps + i * 100,
+                               steps + (i + 1) * 100)
+
+                start_time = time.perf_counter()
+                tail.update()
+                visualize._render(options, tail.metrics)
+                elapsed.append(time.perf_counter() - start_time)
+            results['follow'] = sorted(elapsed)[len(elapsed) // 2]
+
+            print(f'[steps: {steps:>7}] ' + ', '.join(
+                f'{name}: {value * 1000:.0f}ms'
+                for name, value in results.items()))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='benchmark rendering metrics of long training runs.')
+    parser.add_argument('--steps', default=[10000, 100000, 1000000],
+                        type=int, nargs='+')
+    parser.add_argument('--points', default=2000, type=int)
+    parser.add_argument('--refreshes', default=5, type=int)
+    args = parser.parse_args()
+
+    _benchmark_visualize(args)
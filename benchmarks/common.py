@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from gpt2.data.vocabulary import Vocab  # noqa: E402
+from gpt2.data.tokenization import Tokenizer  # noqa: E402
+from gpt2.modeling.transformer import Transformer  # noqa: E402
+from gpt2.misc.benchmarking import measure, write_vocab  # noqa: E402, F401
+
+
+def create_vocab(words: int = 8000) -> Vocab:
+    # Create synthetic vocabulary which consists of random-like subwords.
+    fd, path = tempfile.mkstemp(suffix='.txt')
+    os.close(fd)
+    write_vocab(path, words)
+
+    vocab = Vocab(vocab_path=path)
+    os.remove(path)
+    return vocab
+
+
+def create_tokenizer(vocab: Vocab) -> Tokenizer:
+    return Tokenizer(vocab,
+                     special_tokens=[vocab.unk_token] + vocab.additional_tokens)
+
+
+def create_model(vocab: Vocab, seq_len: int = 64, layers: int = 4,
+                 heads: int = 8, dims: int = 256, rate: int = 4
+                 ) -> Transformer:
+    return Transformer(layers=layers, pad_idx=vocab.pad_idx, words=len(vocab),
+                       seq_len=seq_len, heads=heads, dims=dims, rate=rate,
+                       dropout=0, bidirectional=False).eval()
+
+
+def suppress_words(model: Transformer, vocab: Vocab):
+    # Prevent the model from predicting end-of-sentence token and the padded
+    # vocabulary, so every generation has the same length.
+    def _hook(module, inputs, outputs):
+        logits, present = outputs
+        logits[..., len(vocab.words):] = -1e4
+        logits[..., vocab.eos_idx] = -1e4
+        return logits, present
+
+    model.register_forward_hook(_hook)
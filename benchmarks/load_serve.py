@@ -0,0 +1,88 @@
+import json
+import time
+import random
+import asyncio
+import argparse
+from typing import Dict, Any, Tuple
+
+
+async def _post(host: str, port: int, body: Dict[str, Any]
+                ) -> Tuple[int, Dict[str, Any]]:
+    reader, writer = await asyncio.open_connection(host, port)
+
+    content = json.dumps(body).encode()
+    writer.write(f'POST /generate HTTP/1.1\r\n'
+                 f'Host: {host}\r\n'
+                 f'Content-Type: application/json\r\n'
+                 f'Content-Length: {len(content)}\r\n\r\n'.encode() + content)
+    await writer.drain()
+
+    response = await reader.read()
+    writer.close()
+
+    header, body = response.split(b'\r\n\r\n', 1)
+    return int(header.split()[1]), json.loads(body.decode())
+
+
+def _percentile(values, p: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+async def _run_load(args: argparse.Namespace):
+    contexts = [' '.join(f'w{random.randrange(args.words)}'
+                         for _ in range(random.randint(1, args.context)))
+                for _ in range(args.requests)]
+    queue = asyncio.Queue()
+    for context in contexts:
+        queue.put_nowait(context)
+
+    latencies, first_word_latencies, statuses = [], [], {}
+    generated_words = 0
+
+    async def _client():
+        nonlocal generated_words
+        while not queue.empty():
+            context = queue.get_nowait()
+            status, result = await _post(
+                args.host, args.port,
+                {'context': context, 'max_words': args.max_words,
+                 'seed': random.randrange(1 << 31)})
+
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append(result['latency'])
+                first_word_latencies.append(result['first_word_latency'])
+                generated_words += result['words']
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*[_client() for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - start_time
+
+    print(f'[load] requests: {args.requests}, '
+          f'concurrency: {args.concurrency}, statuses: {statuses}')
+    print(f'[throughput] requests/s: {len(latencies) / elapsed:.2f}, '
+          f'words/s: {generated_words / elapsed:.1f}')
+    if latencies:
+        print(f'[latency] p50: {_percentile(latencies, 0.5) * 1000:.1f}ms, '
+              f'p99: {_percentile(latencies, 0.99) * 1000:.1f}ms')
+        print(f'[first word] '
+              f'p50: {_percentile(first_word_latencies, 0.5) * 1000:.1f}ms, '
+              f'p99: {_percentile(first_word_latencies, 0.99) * 1000:.1f}ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='generate load on `gpt2 serve` server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', default=8000, type=int)
+    parser.add_argument('--requests', default=128, type=int)
+    parser.add_argument('--concurrency', default=16, type=int)
+    parser.add_argument('--context', default=16, type=int)
+    parser.add_argument('--words', default=100, type=int)
+    parser.add_argument('--max_words', default=32, type=int)
+    args = parser.parse_args()
+
+    random.seed(0)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(_run_load(args))
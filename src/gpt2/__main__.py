@@ -1,5 +1,6 @@
 import argparse
-from . import train, generate, visualize
+from . import train, generate, generate_batch, serve, score, visualize, \
+    convert, bench
 
 
 if __name__ == '__main__':
@@ -14,9 +15,24 @@ if __name__ == '__main__':
     # Add `generate` keyword to the parser.
     generate.add_subparser(subparsers)
 
+    # Add `generate-batch` keyword to the parser.
+    generate_batch.add_subparser(subparsers)
+
+    # Add `serve` keyword to the parser.
+    serve.add_subparser(subparsers)
+
+    # Add `score` keyword to the parser.
+    score.add_subparser(subparsers)
+
     # Add `visualize` keyword to the parser.
     visualize.add_subparser(subparsers)
 
+    # Add `convert` keyword to the parser.
+    convert.add_subparser(subparsers)
+
+    # Add `bench` keyword to the parser.
+    bench.add_subparser(subparsers)
+
     # Parse passed arguments and call corresponding function.
     args = parser.parse_args()
     args.func(args)
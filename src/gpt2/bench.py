@@ -0,0 +1,66 @@
+import sys
+import json
+import torch
+import argparse
+import tempfile
+from .misc import benchmarking
+
+
+def _run_benchmarks(args: argparse.Namespace):
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    # Measure the hot paths on the synthetic vocabulary and corpus.
+    with tempfile.TemporaryDirectory() as directory:
+        results = benchmarking.run_benchmarks(directory, sizes=args.sizes,
+                                              repeat=args.repeat)
+
+    for name, metrics in results.items():
+        print(f'[{name}] ' + ', '.join(f'{metric}: {value:.2f}'
+                                       for metric, value in metrics.items()))
+
+    with open(args.output, 'w') as fp:
+        json.dump({'environment': benchmarking.environment(),
+                   'results': results}, fp, indent=2)
+
+    if args.baseline is None:
+        return
+
+    # Compare the results with the baseline and exit with an error if there
+    # are regressions.
+    with open(args.baseline, 'r') as fp:
+        baseline = json.load(fp)['results']
+
+    regressions = 0
+    for name, base, value, regressed in benchmarking.compare(
+            results, baseline, threshold=args.threshold):
+        print(f'[compare] {name}: {base:.2f} -> {value:.2f} '
+              f'({benchmarking.relative_change(base, value):+.1%})'
+              + (' REGRESSION' if regressed else ''))
+        regressions += regressed
+
+    if regressions:
+        print(f'[compare] {regressions} regressions beyond '
+              f'{args.threshold:.0%}.')
+        sys.exit(1)
+
+
+def add_subparser(subparsers: argparse._SubParsersAction):
+    parser = subparsers.add_parser(
+        'bench', help='benchmark hot paths on synthetic data.')
+
+    parser.add_argument('--output', default='bench.json',
+                        help='json file to write benchmark results')
+    parser.add_argument('--baseline', default=None,
+                        help='json file of previous results to compare')
+    parser.add_argument('--threshold', default=0.1, type=float,
+                        help='relative slowdown flagged as regression')
+    parser.add_argument('--sizes', default=['small', 'medium', 'large'],
+                        nargs='+', choices=list(benchmarking.MODEL_SIZES),
+                        help='model sizes to benchmark')
+    parser.add_argument('--repeat', default=5, type=int,
+                        help='number of measurements of each benchmark')
+    parser.add_argument('--threads', default=None, type=int,
+                        help='number of intra-op threads')
+
+    parser.set_defaults(func=_run_benchmarks)
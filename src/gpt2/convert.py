@@ -0,0 +1,43 @@
+import torch
+import argparse
+from .misc import serializing
+
+
+def _to_tensor_file(args: argparse.Namespace):
+    ckpt = torch.load(args.checkpoint, map_location='cpu')
+    state_dict = ckpt['model']
+
+    # Store the model configuration, which is inferred from the parameters,
+    # with them.
+    config = serializing.infer_config(state_dict, heads=args.heads)
+    serializing.save_tensors(args.output, state_dict, config)
+
+
+def _to_pickle(args: argparse.Namespace):
+    tensors, _ = serializing.load_tensors(args.checkpoint)
+    torch.save({'model': {k: v.clone() for k, v in tensors.items()}},
+               args.output)
+
+
+def _convert_checkpoint(args: argparse.Namespace):
+    if serializing.is_tensor_file(args.checkpoint):
+        _to_pickle(args)
+    elif args.heads is None:
+        raise ValueError('`--heads` is required to convert to tensor file.')
+    else:
+        _to_tensor_file(args)
+
+
+def add_subparser(subparsers: argparse._SubParsersAction):
+    parser = subparsers.add_parser(
+        'convert', help='convert checkpoint between pickle and tensor file.')
+
+    parser.add_argument('--checkpoint', required=True,
+                        help='checkpoint file to convert')
+    parser.add_argument('--output', required=True,
+                        help='converted checkpoint file path')
+    parser.add_argument('--heads', default=None, type=int,
+                        help='number of multi-heads in attention, which is '
+                             'required to convert to tensor file')
+
+    parser.set_defaults(func=_convert_checkpoint)
@@ -1,12 +1,21 @@
-import torch
+import time
 import argparse
 from .data.vocabulary import Vocab
 from .data.tokenization import Tokenizer
 from .modeling.transformer import Transformer
-from .misc.generating import Generator
+from .misc.generating import (Generator, BeamSearchGenerator,
+                              SpeculativeGenerator)
+from .misc.caching import PrefixCache
+from .misc.sampling import Sampler
+from .misc import serializing
+from .misc import profiling
+from typing import Optional
 
 
 def _generate_sentence(args: argparse.Namespace):
+    # Use the model configuration of the checkpoint if it is stored.
+    serializing.update_args(args)
+
     # Prepare tokenizer and model.
     vocab = Vocab(vocab_path=args.vocab)
     tokenizer = Tokenizer(
@@ -18,23 +27,111 @@ def _generate_sentence(args: argparse.Namespace):
                         dropout=0, bidirectional=False)
     model.eval()
 
+    # Cache the key-value pairs of recent contexts to reuse their prefixes.
+    cache = None
+    if args.prefix_cache > 0:
+        cache = PrefixCache(max_bytes=int(args.prefix_cache * 2 ** 20))
+
     # Create integrated sentence generator.
-    generator = Generator(vocab, tokenizer, model, seq_len=args.seq_len,
-                          temp=args.temp, topk=args.topk)
+    sampler = Sampler(temp=args.temp, topk=args.topk, topp=args.topp,
+                      repetition_penalty=args.repetition_penalty,
+                      presence_penalty=args.presence_penalty,
+                      greedy=args.greedy)
+    if args.draft_checkpoint:
+        # Create small draft model which shares the vocabulary.
+        draft = Transformer(layers=args.draft_layers, pad_idx=vocab.pad_idx,
+                            words=len(vocab), seq_len=args.seq_len,
+                            heads=args.draft_heads, dims=args.draft_dims,
+                            rate=args.draft_rate, dropout=0,
+                            bidirectional=False)
+        draft.eval()
+        serializing.load_model(draft, args.draft_checkpoint)
 
-    if args.use_gpu:
-        generator.cuda()
+        generator = SpeculativeGenerator(
+            vocab, tokenizer, model, draft, seq_len=args.seq_len,
+            draft_tokens=args.draft_tokens, use_gpu=args.use_gpu,
+            sampler=sampler)
+    elif args.beam_size > 0:
+        if args.stream:
+            raise ValueError('beam search cannot stream its hypotheses.')
+        generator = BeamSearchGenerator(
+            vocab, tokenizer, model, seq_len=args.seq_len,
+            beam_size=args.beam_size, length_penalty=args.length_penalty,
+            use_gpu=args.use_gpu, cache=cache)
+    else:
+        generator = Generator(vocab, tokenizer, model, seq_len=args.seq_len,
+                              use_gpu=args.use_gpu, cache=cache,
+                              sampler=sampler, prune_margin=args.prune_margin)
 
     # Restore trained GPT-2 parameters from checkpoint.
-    ckpt = torch.load(args.checkpoint,
-                      map_location='cpu' if args.use_gpu else 'cuda')
-    model.load_state_dict(ckpt['model'])
+    serializing.load_model(model, args.checkpoint, use_gpu=args.use_gpu)
+
+    # Measure the time and memory of the modules in the given window of
+    # decoding steps. Each forward pass of the model is a step.
+    if args.profile:
+        profiler = profiling.Profiler(
+            model, start=args.profile_start, steps=args.profile_steps,
+            trace_path=args.profile_trace)
+        model.register_forward_hook(lambda *_: profiler.step())
 
     # Start generating sentence interactively.
     while True:
         context = input('>>')
-        sentence, log_prob = generator.generate(context, samples=args.samples)
-        print(f'[log prob: {log_prob:.4f}] {sentence}')
+        if args.stream:
+            _stream_sentence(generator, context, args.seed)
+        elif isinstance(generator, BeamSearchGenerator):
+            for sentence, score in generator.generate_nbest(
+                    context, nbest=args.nbest):
+                print(f'[score: {score:.4f}] {sentence}')
+        else:
+            sentence, log_prob = generator.generate(
+                context, samples=args.samples, seed=args.seed)
+            print(f'[log prob: {log_prob:.4f}] {sentence}')
+
+        if isinstance(generator, SpeculativeGenerator):
+            stats = generator.stats
+            print(f'[speculative] acceptance rate: '
+                  f'{stats["accepted"] / max(stats["proposed"], 1):.2%}, '
+                  f'target calls: {stats["target_calls"]}')
+
+        if args.prune_margin is not None and not args.stream:
+            stats = generator.stats
+            print(f'[pruning] pruned candidates: {stats["pruned"]}, '
+                  f'generated words: {stats["generated_words"]}')
+
+        if cache is not None:
+            stats = cache.stats()
+            print(f'[prefix cache] hit rate: {stats["hit_rate"]:.2%}, '
+                  f'memory: {stats["bytes"] / 2 ** 20:.1f}MB, '
+                  f'saved tokens: {stats["saved_tokens"]}')
+
+
+def _stream_sentence(generator: Generator, context: str,
+                     seed: Optional[int] = None):
+    print(context, end='', flush=True)
+
+    # Print each word as soon as it is generated and measure the latencies
+    # between the words.
+    start_time = last_time = time.perf_counter()
+    latencies = []
+    for _, fragment in generator.stream(context, seed=seed):
+        current_time = time.perf_counter()
+        latencies.append(current_time - last_time)
+        last_time = current_time
+
+        print(fragment, end='', flush=True)
+    print()
+
+    if not latencies:
+        return
+
+    inter_word = sorted(latencies[1:]) or [0]
+    print(f'[stream] words: {len(latencies)}, '
+          f'time to first word: {latencies[0] * 1000:.1f}ms, '
+          f'inter-word latency: '
+          f'p50 {inter_word[len(inter_word) // 2] * 1000:.1f}ms / '
+          f'mean {sum(inter_word) / len(inter_word) * 1000:.1f}ms, '
+          f'total: {(last_time - start_time) * 1000:.1f}ms')
 
 
 def add_subparser(subparsers: argparse._SubParsersAction):
@@ -61,6 +158,48 @@ def add_subparser(subparsers: argparse._SubParsersAction):
                         help='number of samples to generate')
     parser.add_argument('--topk', default=40, type=int,
                         help='number of next-word candidates')
+    parser.add_argument('--topp', default=1.0, type=float,
+                        help='cumulative probability of next-word nucleus')
+    parser.add_argument('--repetition_penalty', default=1.0, type=float,
+                        help='penalty factor of already generated words')
+    parser.add_argument('--presence_penalty', default=0.0, type=float,
+                        help='penalty subtracted from generated word logits')
+    parser.add_argument('--greedy', action='store_true',
+                        help='choose the most probable next word')
+    parser.add_argument('--seed', default=None, type=int,
+                        help='random seed to reproduce generated sentences')
+    parser.add_argument('--prune_margin', default=None, type=float,
+                        help='abandon samples behind the best by the margin')
+    parser.add_argument('--beam_size', default=0, type=int,
+                        help='use beam search with the given beam size')
+    parser.add_argument('--nbest', default=1, type=int,
+                        help='number of best hypotheses from beam search')
+    parser.add_argument('--length_penalty', default=1.0, type=float,
+                        help='exponent of length normalization in beam search')
+    parser.add_argument('--draft_checkpoint', default=None,
+                        help='draft model checkpoint for speculative decoding')
+    parser.add_argument('--draft_layers', default=2, type=int,
+                        help='number of decoder layers in draft model')
+    parser.add_argument('--draft_heads', default=8, type=int,
+                        help='number of multi-heads in draft model')
+    parser.add_argument('--draft_dims', default=256, type=int,
+                        help='dimension of representation in draft model')
+    parser.add_argument('--draft_rate', default=4, type=int,
+                        help='increase rate of dimensionality in draft model')
+    parser.add_argument('--draft_tokens', default=4, type=int,
+                        help='number of words proposed by draft model')
+    parser.add_argument('--prefix_cache', default=0, type=float,
+                        help='memory budget (MB) of cached context prefixes')
+    parser.add_argument('--stream', action='store_true',
+                        help='print each word as soon as it is generated')
+    parser.add_argument('--profile', action='store_true',
+                        help='profile modules in decoding steps')
+    parser.add_argument('--profile_start', default=10, type=int,
+                        help='number of decoding steps before profiling')
+    parser.add_argument('--profile_steps', default=5, type=int,
+                        help='number of profiled decoding steps')
+    parser.add_argument('--profile_trace', default='profile.json',
+                        help='chrome trace file of profiled steps')
     parser.add_argument('--use_gpu', action='store_true',
                         help='use gpu for generating sentences.')
 
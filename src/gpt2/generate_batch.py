@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import argparse
+import itertools
+from .data.vocabulary import Vocab
+from .data.tokenization import Tokenizer
+from .modeling.transformer import Transformer
+from .misc.generating import Generator
+from .misc.sampling import Sampler
+from .misc.pooling import GeneratorPool
+from .misc import serializing
+from typing import Iterator, List, Dict, Any, Optional
+
+
+def _read_prompts(path: str) -> Iterator[Dict[str, Any]]:
+    # Read the prompts from JSONL file with `context` fields or from text file
+    # with a prompt in each line.
+    with open(path, 'r', encoding='utf-8') as fp:
+        for line in fp:
+            if path.endswith('.jsonl'):
+                # Skip the blank lines, e.g. the trailing ones.
+                if line.strip():
+                    yield json.loads(line)
+            else:
+                yield {'context': line.rstrip('\n')}
+
+
+def _count_completed(path: str) -> int:
+    if not os.path.exists(path):
+        return 0
+
+    # Count the completed results and remove the partially written line of
+    # the interrupted run.
+    with open(path, 'rb+') as fp:
+        content = fp.read()
+        fp.truncate(content.rfind(b'\n') + 1)
+
+    return content.count(b'\n')
+
+
+def _generate_batches(generator: Generator,
+                      prompts: List[Dict[str, Any]],
+                      start: int,
+                      batch_size: int,
+                      seed: int,
+                      pool: Optional[GeneratorPool] = None
+                      ) -> List[Dict[str, Any]]:
+    # Sort the prompts by their lengths to reduce the padded words in each
+    # batch. The encoded contexts are passed to the generator, so they are
+    # not encoded again.
+    contexts = [generator._encode_context(prompt['context'])
+                for prompt in prompts]
+    order = sorted(range(len(prompts)), key=lambda i: len(contexts[i]))
+
+    batches = [order[i:i + batch_size]
+               for i in range(0, len(order), batch_size)]
+    inputs = [([contexts[j] for j in batch],
+               [seed + start + j for j in batch]) for batch in batches]
+
+    # Spread the batches over the workers if the pool is given.
+    if pool is not None:
+        outputs = pool.generate_batches(inputs)
+    else:
+        outputs = [generator.generate_batch(contexts, seeds)
+                   for contexts, seeds in inputs]
+
+    results = [None] * len(prompts)
+    for batch, sentences in zip(batches, outputs):
+        for j, (sentence, log_prob) in zip(batch, sentences):
+            results[j] = dict(prompts[j], sentence=sentence,
+                              log_prob=log_prob)
+
+    return results
+
+
+def _generate_sentences(args: argparse.Namespace):
+    # Use the model configuration of the checkpoint if it is stored.
+    serializing.update_args(args)
+
+    # Prepare tokenizer and model.
+    vocab = Vocab(vocab_path=args.vocab)
+    tokenizer = Tokenizer(
+        vocab, special_tokens=[vocab.unk_token] + vocab.additional_tokens)
+
+    model = Transformer(layers=args.layers, pad_idx=vocab.pad_idx,
+                        words=len(vocab), seq_len=args.seq_len,
+                        heads=args.heads, dims=args.dims, rate=args.rate,
+                        dropout=0, bidirectional=False)
+    model.eval()
+
+    # Create sentence generator which decodes the prompts in batches.
+    sampler = Sampler(temp=args.temp, topk=args.topk, topp=args.topp,
+                      repetition_penalty=args.repetition_penalty,
+                      presence_penalty=args.presence_penalty,
+                      greedy=args.greedy)
+    generator = Generator(vocab, tokenizer, model, seq_len=args.seq_len,
+                          use_gpu=args.use_gpu, sampler=sampler)
+
+    # Restore trained GPT-2 parameters from checkpoint.
+    serializing.load_model(model, args.checkpoint, use_gpu=args.use_gpu)
+
+    # Fork the workers which share the model parameters.
+    pool = None
+    if args.workers > 1:
+        pool = GeneratorPool(generator, workers=args.workers,
+                             threads=args.threads, pin_cores=args.pin_cores)
+
+    # Skip the prompts which are already generated in the previous run.
+    completed = _count_completed(args.output)
+    prompts = itertools.islice(_read_prompts(args.prompts), completed, None)
+
+    start_time, total_prompts = time.perf_counter(), 0
+    with open(args.output, 'a', encoding='utf-8') as fp:
+        while True:
+            chunk = list(itertools.islice(prompts, args.chunk_size))
+            if not chunk:
+                break
+
+            # Write the results of each chunk in input order.
+            for result in _generate_batches(generator, chunk,
+                                            completed + total_prompts,
+                                            args.batch_size, args.seed,
+                                            pool):
+                fp.write(json.dumps(result, ensure_ascii=False) + '\n')
+            fp.flush()
+
+            total_prompts += len(chunk)
+
+    if pool is not None:
+        pool.close()
+
+    elapsed = time.perf_counter() - start_time
+    total_words = generator.stats['generated_words']
+    print(f'[generate-batch] prompts: {total_prompts} '
+          f'(skipped {completed}), generated words: {total_words}, '
+          f'prompts/s: {total_prompts / max(elapsed, 1e-9):.2f}, '
+          f'words/s: {total_words / max(elapsed, 1e-9):.1f}')
+
+
+def add_subparser(subparsers: argparse._SubParsersAction):
+    parser = subparsers.add_parser(
+        'generate-batch', help='generate sentences from prompts file.')
+
+    parser.add_argument('--vocab', required=True,
+                        help='vocabulary file path')
+    parser.add_argument('--checkpoint', required=True,
+                        help='trained model checkpoint')
+    parser.add_argument('--prompts', required=True,
+                        help='text or jsonl file of prompts')
+    parser.add_argument('--output', required=True,
+                        help='jsonl file to write generated sentences')
+    parser.add_argument('--seq_len', default=64, type=int,
+                        help='maximum length of sequences')
+    parser.add_argument('--layers', default=12, type=int,
+                        help='number of decoder layers')
+    parser.add_argument('--heads', default=16, type=int,
+                        help='number of multi-heads in attention')
+    parser.add_argument('--dims', default=1024, type=int,
+                        help='dimension of representation in each layer')
+    parser.add_argument('--rate', default=4, type=int,
+                        help='increase rate of dimensionality in bottleneck')
+    parser.add_argument('--temp', default=0.8, type=float,
+                        help='scale factor of prediction logits')
+    parser.add_argument('--topk', default=40, type=int,
+                        help='number of next-word candidates')
+    parser.add_argument('--topp', default=1.0, type=float,
+                        help='cumulative probability of next-word nucleus')
+    parser.add_argument('--repetition_penalty', default=1.0, type=float,
+                        help='penalty factor of already generated words')
+    parser.add_argument('--presence_penalty', default=0.0, type=float,
+                        help='penalty subtracted from generated word logits')
+    parser.add_argument('--greedy', action='store_true',
+                        help='choose the most probable next word')
+    parser.add_argument('--seed', default=0, type=int,
+                        help='random seed added to the index of each prompt')
+    parser.add_argument('--batch_size', default=32, type=int,
+                        help='number of prompts in each batch')
+    parser.add_argument('--chunk_size', default=1024, type=int,
+                        help='number of prompts sorted by length together')
+    parser.add_argument('--workers', default=1, type=int,
+                        help='number of cpu worker processes')
+    parser.add_argument('--threads', default=None, type=int,
+                        help='number of threads in each worker')
+    parser.add_argument('--pin_cores', action='store_true',
+                        help='pin each worker to its own cpu cores')
+    parser.add_argument('--use_gpu', action='store_true',
+                        help='use gpu for generating sentences.')
+
+    parser.set_defaults(func=_generate_sentences)
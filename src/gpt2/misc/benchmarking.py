@@ -0,0 +1,208 @@
+import os
+import sys
+import math
+import time
+import torch
+import random
+import platform
+import torch.nn as nn
+from ..data.vocabulary import Vocab
+from ..data.tokenization import Tokenizer
+from ..data.serving import TokenizedCorpusDataset
+from ..modeling.transformer import Transformer
+from .generating import Generator
+from typing import Callable, Dict, List, Tuple, Any
+
+# The model sizes of the benchmarks, as `(layers, heads, dims)`.
+MODEL_SIZES = {'small': (2, 4, 128), 'medium': (4, 8, 256),
+               'large': (8, 8, 512)}
+
+
+def measure(func: Callable[[], Any], repeat: int = 5, warmup: int = 1
+            ) -> Tuple[float, float]:
+    for _ in range(warmup):
+        func()
+
+    # Use the median of the elapsed times to ignore the outliers, and the
+    # best one as the lower bound.
+    elapsed = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func()
+        elapsed.append(time.perf_counter() - start_time)
+
+    elapsed.sort()
+    return elapsed[len(elapsed) // 2], elapsed[0]
+
+
+def write_vocab(path: str, words: int = 8000):
+    # Create synthetic vocabulary which consists of words and subwords.
+    with open(path, 'w', encoding='utf-8') as fp:
+        fp.write('<unk>\n')
+        fp.write('\n'.join(f'w{i}' for i in range(words // 2)) + '\n')
+        fp.write('\n'.join(f'##{i}' for i in range(words - words // 2 - 1)))
+
+
+def create_fixtures(directory: str,
+                    words: int = 8000,
+                    lines: int = 2000,
+                    line_words: int = 40) -> Tuple[str, str, str]:
+    vocab_path = os.path.join(directory, 'vocab.txt')
+    write_vocab(vocab_path, words)
+
+    # Create the raw text to be tokenized, where half of the words are not in
+    # the vocabulary and split into subwords, and the tokenized corpus.
+    rng = random.Random(0)
+    text_path = os.path.join(directory, 'text.txt')
+    corpus_path = os.path.join(directory, 'corpus.txt')
+    with open(text_path, 'w', encoding='utf-8') as text, \
+            open(corpus_path, 'w', encoding='utf-8') as corpus:
+        for _ in range(lines):
+            text.write(' '.join(f'w{rng.randrange(words)}'
+                                for _ in range(line_words)) + '\n')
+            corpus.write(' '.join(f'w{rng.randrange(words // 2)}'
+                                  for _ in range(line_words)) + '\n')
+
+    return vocab_path, text_path, corpus_path
+
+
+def _create_model(vocab: Vocab, size: str, seq_len: int) -> Transformer:
+    layers, heads, dims = MODEL_SIZES[size]
+    return Transformer(layers=layers, pad_idx=vocab.pad_idx,
+                       words=len(vocab), seq_len=seq_len, heads=heads,
+                       dims=dims, rate=4, dropout=0, bidirectional=False)
+
+
+def bench_tokenizer(vocab_path: str, text_path: str, repeat: int = 5
+                    ) -> Dict[str, float]:
+    vocab = Vocab(vocab_path=vocab_path)
+    tokenizer = Tokenizer(vocab, special_tokens=[vocab.unk_token]
+                          + vocab.additional_tokens)
+
+    with open(text_path, 'r', encoding='utf-8') as fp:
+        texts = fp.read().splitlines()[:500]
+    words = sum(len(text.split()) for text in texts)
+
+    elapsed, _ = measure(lambda: [tokenizer.encode(t) for t in texts],
+                         repeat)
+    return {'words_per_sec': words / elapsed}
+
+
+def bench_dataset(vocab_path: str, corpus_path: str, batch: int = 32,
+                  seq_len: int = 64, repeat: int = 5) -> Dict[str, float]:
+    vocab = Vocab(vocab_path=vocab_path)
+    dataset = TokenizedCorpusDataset(vocab, corpus_path, seq_len=seq_len)
+
+    elapsed, _ = measure(lambda: dataset.fetch(batch), repeat)
+    return {'batches_per_sec': 1 / elapsed}
+
+
+def bench_transformer(vocab_path: str, size: str, batch: int = 8,
+                      seq_len: int = 64, repeat: int = 5
+                      ) -> Dict[str, float]:
+    vocab = Vocab(vocab_path=vocab_path)
+    model = _create_model(vocab, size, seq_len).train()
+    criterion = nn.CrossEntropyLoss()
+
+    x = torch.randint(vocab.specials, len(vocab.words), (batch, seq_len))
+
+    def _forward() -> torch.Tensor:
+        logits, _ = model(x)
+        return criterion(logits.transpose(1, 2), x)
+
+    # Measure the backward pass separately from its forward pass.
+    backwards = []
+
+    def _backward():
+        loss = _forward()
+        start_time = time.perf_counter()
+        loss.backward()
+        backwards.append(time.perf_counter() - start_time)
+
+    forward, _ = measure(_forward, repeat)
+    measure(_backward, repeat)
+    backward = sorted(backwards[1:])[len(backwards[1:]) // 2]
+
+    return {'forward_ms': forward * 1000, 'backward_ms': backward * 1000,
+            'tokens_per_sec': batch * seq_len / (forward + backward)}
+
+
+def bench_generator(vocab_path: str, size: str, context: int = 32,
+                    seq_len: int = 128, repeat: int = 5
+                    ) -> Dict[str, float]:
+    vocab = Vocab(vocab_path=vocab_path)
+    tokenizer = Tokenizer(vocab, special_tokens=[vocab.unk_token]
+                          + vocab.additional_tokens)
+    model = _create_model(vocab, size, seq_len).eval()
+    generator = Generator(vocab, tokenizer, model, seq_len=seq_len)
+
+    words = [vocab.bos_idx] + list(range(vocab.specials,
+                                         vocab.specials + context - 1))
+    next_word = torch.tensor([[vocab.specials]], dtype=torch.long)
+
+    with torch.no_grad():
+        prefill, _ = measure(lambda: generator._prefill(words), repeat)
+
+        # Measure the latency of predicting each next word with the cached
+        # keys and values of the context. The short steps are measured
+        # together to reduce the noise.
+        _, past = generator._prefill(words)
+        per_token, _ = measure(
+            lambda: [generator._predict_next_words(next_word, past)
+                     for _ in range(16)], repeat)
+        per_token /= 16
+
+    return {'prefill_ms': prefill * 1000, 'per_token_ms': per_token * 1000}
+
+
+def environment() -> Dict[str, Any]:
+    return {'python': sys.version.split()[0], 'torch': torch.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor() or platform.machine(),
+            'cpus': os.cpu_count(), 'threads': torch.get_num_threads()}
+
+
+def run_benchmarks(directory: str, sizes: List[str], repeat: int = 5
+                   ) -> Dict[str, Dict[str, float]]:
+    vocab_path, text_path, corpus_path = create_fixtures(directory)
+
+    results = {'tokenizer/encode': bench_tokenizer(vocab_path, text_path,
+                                                   repeat=repeat),
+               'dataset/fetch': bench_dataset(vocab_path, corpus_path,
+                                              repeat=repeat)}
+    for size in sizes:
+        results[f'transformer/{size}'] = bench_transformer(
+            vocab_path, size, repeat=repeat)
+        results[f'generator/{size}'] = bench_generator(
+            vocab_path, size, repeat=repeat)
+
+    return results
+
+
+def relative_change(base: float, value: float) -> float:
+    # The change from zero is infinite unless the value is also zero.
+    if base == 0:
+        return math.copysign(math.inf, value) if value else 0.0
+    return (value - base) / base
+
+
+def compare(results: Dict[str, Dict[str, float]],
+            baseline: Dict[str, Dict[str, float]],
+            threshold: float = 0.1) -> List[Tuple[str, float, float, bool]]:
+    # Higher is better for the throughputs and lower is better for the
+    # latencies. The change beyond the threshold is flagged as regression.
+    comparisons = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            if metric not in baseline.get(name, {}):
+                continue
+
+            base = baseline[name][metric]
+            change = relative_change(base, value)
+            if metric.endswith('_ms'):
+                change = -change
+
+            comparisons.append((f'{name}/{metric}', base, value,
+                                change < -threshold))
+
+    return comparisons
@@ -0,0 +1,115 @@
+from collections import OrderedDict
+from ..modeling.attention import Past
+from typing import Tuple, List, Dict, Optional
+
+# Define new type `Prefix` which is a tuple of token indices.
+Prefix = Tuple[int, ...]
+
+
+class _TrieNode(object):
+    def __init__(self):
+        self.children = {}
+        self.prefixes = set()
+
+
+class PrefixCache(object):
+    def __init__(self, max_bytes: int, min_length: int = 2):
+        self.max_bytes = max_bytes
+        self.min_length = min_length
+        self.root = _TrieNode()
+        self.entries = OrderedDict()
+
+        self.bytes = 0
+        self.lookups = 0
+        self.hits = 0
+        self.saved_tokens = 0
+
+    def lookup(self, words: List[int]) -> Tuple[int, Optional[List[Past]]]:
+        self.lookups += 1
+
+        # Find the deepest node which matches the given words.
+        node, length = self.root, 0
+        for word in words:
+            if word not in node.children:
+                break
+            node, length = node.children[word], length + 1
+
+        # Every context starts with the same special token, so the prefixes
+        # shorter than the minimum length are not reused.
+        if length < self.min_length:
+            return 0, None
+
+        self.hits += 1
+        self.saved_tokens += length
+
+        # Every cached prefix which passes through the node contains the
+        # keys and values of the matched words. Because the attentions are
+        # causal, the matched part is reused by slicing them.
+        prefix = next(iter(node.prefixes))
+        self.entries.move_to_end(prefix)
+
+        return length, [(k[..., :length, :], v[..., :length, :])
+                        for k, v in self.entries[prefix]]
+
+    def insert(self, words: List[int], past: List[Past]):
+        prefix = tuple(words)
+        nbytes = sum(k.numel() * k.element_size()
+                     + v.numel() * v.element_size() for k, v in past)
+
+        if nbytes > self.max_bytes:
+            return
+
+        # If a longer cached prefix already contains the words, mark it as
+        # recently used instead of inserting a duplicate.
+        node = self._find(prefix)
+        if node is not None and node.prefixes:
+            self.entries.move_to_end(next(iter(node.prefixes)))
+            return
+
+        # Remove cached prefixes of the words because the new entry covers
+        # them.
+        node = self.root
+        for length, word in enumerate(prefix, 1):
+            node = node.children.setdefault(word, _TrieNode())
+            node.prefixes.add(prefix)
+
+            for shorter in [p for p in node.prefixes
+                            if len(p) == length and p != prefix]:
+                self._remove(shorter)
+
+        self.entries[prefix] = past
+        self.bytes += nbytes
+
+        # Evict the least recently used prefixes to fit the memory budget.
+        while self.bytes > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+
+    def _find(self, prefix: Prefix) -> Optional[_TrieNode]:
+        node = self.root
+        for word in prefix:
+            if word not in node.children:
+                return None
+            node = node.children[word]
+        return node
+
+    def _remove(self, prefix: Prefix):
+        past = self.entries.pop(prefix)
+        self.bytes -= sum(k.numel() * k.element_size()
+                          + v.numel() * v.element_size() for k, v in past)
+
+        # Detach the prefix from the nodes and prune the unused ones.
+        node = self.root
+        for word in prefix:
+            child = node.children[word]
+            child.prefixes.discard(prefix)
+
+            if not child.prefixes:
+                del node.children[word]
+                break
+            node = child
+
+    def stats(self) -> Dict[str, float]:
+        return {'hit_rate': self.hits / max(self.lookups, 1),
+                'bytes': self.bytes,
+                'entries': len(self.entries),
+                'saved_tokens': self.saved_tokens}
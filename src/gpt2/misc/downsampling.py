@@ -0,0 +1,37 @@
+import numpy as np
+
+
+def lttb(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    # Keep all points if there are not more than the target.
+    if len(x) <= points or points < 3:
+        return np.arange(len(x))
+
+    x, y = x.astype(np.float64), y.astype(np.float64)
+
+    # Split the points between the first and the last ones into the buckets
+    # of the same range of `x` rather than the same number of points, so the
+    # downsampled points can be downsampled again with the new points.
+    edges = np.linspace(x[0], x[-1], points - 1)[1:-1]
+    bounds = np.clip(np.searchsorted(x, edges), 1, len(x) - 1)
+    bounds = np.concatenate(([1], bounds, [len(x) - 1]))
+    buckets = [(start, end) for start, end in zip(bounds[:-1], bounds[1:])
+               if end > start]
+
+    # Select the point of each bucket which forms the largest triangle with
+    # the previously selected point and the average of the next bucket.
+    selected, prev = [0], 0
+    for i, (start, end) in enumerate(buckets):
+        if i + 1 < len(buckets):
+            next_start, next_end = buckets[i + 1]
+            next_x = x[next_start:next_end].mean()
+            next_y = y[next_start:next_end].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+
+        area = np.abs((x[prev] - next_x) * (y[start:end] - y[prev])
+                      - (x[prev] - x[start:end]) * (next_y - y[prev]))
+        prev = start + int(np.argmax(area))
+        selected.append(prev)
+
+    selected.append(len(x) - 1)
+    return np.array(selected)
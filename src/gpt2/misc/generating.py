@@ -1,10 +1,23 @@
 import torch
 import torch.nn as nn
-import numpy as np
+import torch.nn.functional as F
 from ..data.vocabulary import Vocab
 from ..data.tokenization import Tokenizer
 from ..modeling.attention import Past
-from typing import Tuple, List, Optional
+from .caching import PrefixCache
+from .sampling import Sampler
+from typing import Tuple, List, Optional, Iterator, Union
+
+
+def _past_length(past: Optional[List[Past]]) -> int:
+    return past[0][0].size(-2) if past is not None else 0
+
+
+def _truncate_past(past: Optional[List[Past]], length: int
+                   ) -> Optional[List[Past]]:
+    if past is None:
+        return None
+    return [(k[..., :length, :], v[..., :length, :]) for k, v in past]
 
 
 class Generator(object):
@@ -15,7 +28,10 @@ class Generator(object):
                  seq_len: int,
                  temp: float = 0.8,
                  topk: int = 40,
-                 use_gpu: bool = False):
+                 use_gpu: bool = False,
+                 cache: Optional[PrefixCache] = None,
+                 sampler: Optional[Sampler] = None,
+                 prune_margin: Optional[float] = None):
         if use_gpu:
             model.cuda()
 
@@ -23,55 +39,509 @@ class Generator(object):
         self.tokenizer = tokenizer
         self.model = model
         self.seq_len = seq_len
-        self.temp = temp
-        self.topk = topk
         self.use_gpu = use_gpu
+        self.cache = cache
+        self.sampler = sampler or Sampler(temp=temp, topk=topk)
+        self.prune_margin = prune_margin
 
-    def _sample_next_word(self,
-                          words: List[int],
-                          past: Optional[Past] = None) -> int:
-        with torch.no_grad():
-            x = torch.tensor([words],
-                             dtype=torch.long,
-                             device='cuda' if self.use_gpu else 'cpu')
-            logits, past = self.model(x, past)
+        self.stats = {'generated_words': 0, 'pruned': 0}
 
-            # If tokens are predicted on GPU, move the calculated logits to
-            # CPU.
-            if self.use_gpu:
-                logits = logits.cpu()
+    def _encode_context(self, context: str) -> List[int]:
+        # Encode the given context sentence and add begin-of-sentence token.
+        words = [self.vocab[t] for t in self.tokenizer.encode(context)]
+        return [self.vocab.bos_idx] + words
 
-        probs = (logits[0, -1] / self.temp).softmax(-1).numpy()
-        targets = probs.argsort()[-self.topk:][::-1]
+    def _decode_words(self, words: List[int]) -> str:
+        return self.tokenizer.decode([self.vocab[t] for t in words])
 
-        # Sample next token from calculated distribution.
-        pred = np.random.choice(
-            targets, p=(probs[targets] / probs[targets].sum()))
+    def _predict_next_words(self,
+                            words: torch.Tensor,
+                            past: Optional[List[Past]] = None
+                            ) -> Tuple[torch.Tensor, List[Past]]:
+        logits, past = self.model(words, past)
+        return logits[:, -1].float(), past
 
-        return pred, np.log(probs[pred]), past
+    def _prefill(self, words: List[int]) -> Tuple[torch.Tensor, List[Past]]:
+        # Resume from the longest cached prefix of the context. At least the
+        # last word is calculated to predict the next word.
+        cached, past = 0, None
+        if self.cache is not None:
+            cached, past = self.cache.lookup(words[:-1])
 
-    def _sample(self, context: str) -> Tuple[str, float]:
-        # Encode the given context sentence and add begin-of-sentence token.
-        words = [self.vocab[t] for t in self.tokenizer.encode(context)]
-        words = [self.vocab.bos_idx] + words
+        x = torch.tensor([words[cached:]], dtype=torch.long,
+                         device='cuda' if self.use_gpu else 'cpu')
+        logits, past = self._predict_next_words(x, past)
+
+        if self.cache is not None:
+            self.cache.insert(words, past)
+
+        return logits, past
+
+    @torch.no_grad()
+    def _sample(self,
+                words: List[int],
+                samples: int,
+                seed: Optional[int] = None
+                ) -> Tuple[List[List[int]], List[float]]:
+        device = 'cuda' if self.use_gpu else 'cpu'
+
+        # Create random generators for each candidate to reproduce the
+        # sampling results.
+        generators = None
+        if seed is not None:
+            generators = [torch.Generator(device).manual_seed(seed + i)
+                          for i in range(samples)]
+
+        # Calculate the context only once and share its key-value pairs with
+        # every candidate.
+        logits, past = self._prefill(words)
+
+        logits = logits.expand(samples, -1)
+        past = [(k.expand((samples,) + k.shape[1:]),
+                 v.expand((samples,) + v.shape[1:])) for k, v in past]
+
+        history = torch.tensor(words, dtype=torch.long, device=device)
+        history = history.expand(samples, -1)
+
+        sequences = [[] for _ in range(samples)]
+        total_log_probs = torch.zeros(samples, device=device)
+        active = torch.arange(samples, device=device)
+
+        abandoned, leader = set(), float('-inf')
+        for length in range(len(words), self.seq_len):
+            preds, log_probs = self.sampler(logits, history, generators)
+            total_log_probs.index_add_(0, active, log_probs)
+
+            for i, pred in zip(active.tolist(), preds.tolist()):
+                sequences[i].append(pred)
+            self.stats['generated_words'] += active.numel()
+
+            if length + 1 == self.seq_len:
+                break
+
+            # Finished candidates which predict end-of-sentence token drop out
+            # of the batch.
+            alive = preds != self.vocab.eos_idx
+
+            # Abandon the candidates whose mean log-probabilities fall behind
+            # the leader, which is the best of the finished and running
+            # candidates. Because the mean of fewer words is noisier, the
+            # margin shrinks with the square root of the generated length.
+            if self.prune_margin is not None:
+                generated = length + 1 - len(words)
+                scores = total_log_probs[active] / generated
+                leader = max([leader] + scores[~alive].tolist())
+
+                bound = (max(leader, scores.max().item())
+                         - self.prune_margin / generated ** 0.5)
+                pruned = alive & (scores < bound)
+                if pruned.any():
+                    abandoned.update(active[pruned].tolist())
+                    self.stats['pruned'] += int(pruned.sum())
+                    alive &= ~pruned
+
+            if not alive.all():
+                alive = alive.nonzero().squeeze(-1)
+                if alive.numel() == 0:
+                    break
+
+                active, preds = active[alive], preds[alive]
+                history = history[alive]
+                past = [(k[alive], v[alive]) for k, v in past]
+
+                if generators is not None:
+                    generators = [generators[i] for i in alive.tolist()]
+
+            history = torch.cat((history, preds.unsqueeze(-1)), dim=-1)
+            logits, past = self._predict_next_words(preds.unsqueeze(-1), past)
+
+        # Average the log-probabilities over the generated tokens. Abandoned
+        # candidates are unfinished, so they are never chosen.
+        lengths = torch.tensor([len(s) for s in sequences],
+                               dtype=torch.float, device=device)
+        mean_log_probs = (total_log_probs / lengths.clamp(min=1)).tolist()
+        for i in abandoned:
+            mean_log_probs[i] = float('-inf')
+
+        return sequences, mean_log_probs
+
+    def generate(self,
+                 context: str,
+                 samples: int = 20,
+                 seed: Optional[int] = None) -> Tuple[str, float]:
+        words = self._encode_context(context)
+        sequences, mean_log_probs = self._sample(words, samples, seed)
+
+        # Choose the candidate which has the highest mean log-probability.
+        best = max(range(samples), key=lambda i: mean_log_probs[i])
+        return (self._decode_words(words + sequences[best]),
+                mean_log_probs[best])
+
+    @torch.no_grad()
+    def _sample_batch(self,
+                      contexts: List[List[int]],
+                      seeds: Optional[List[int]] = None
+                      ) -> Tuple[List[List[int]], List[float]]:
+        device = 'cuda' if self.use_gpu else 'cpu'
+
+        generators = None
+        if seeds is not None:
+            generators = [torch.Generator(device).manual_seed(seed)
+                          for seed in seeds]
+
+        # Left-pad the contexts so that the next words of every context are
+        # predicted at the last position.
+        length = max(len(words) for words in contexts)
+        history = torch.tensor([[self.vocab.pad_idx] * (length - len(words))
+                                + words for words in contexts],
+                               dtype=torch.long, device=device)
+        padding = history == self.vocab.pad_idx
+
+        logits, past = self.model(history, None, padding=padding)
+        logits = logits[:, -1].float()
+
+        sequences = [[] for _ in contexts]
+        total_log_probs = torch.zeros(len(contexts), device=device)
+        active = torch.arange(len(contexts), device=device)
+
+        while True:
+            preds, log_probs = self.sampler(logits, history, generators)
+            total_log_probs.index_add_(0, active, log_probs)
+
+            alive = []
+            for i, pred in zip(active.tolist(), preds.tolist()):
+                sequences[i].append(pred)
+                alive.append(pred != self.vocab.eos_idx
+                             and len(contexts[i]) + len(sequences[i])
+                             < self.seq_len)
+            self.stats['generated_words'] += active.numel()
+
+            # Finished contexts which predict end-of-sentence token or reach
+            # the maximum length drop out of the batch.
+            if not all(alive):
+                alive = torch.tensor(alive, device=device).nonzero()
+                alive = alive.squeeze(-1)
+                if alive.numel() == 0:
+                    break
+
+                active, preds = active[alive], preds[alive]
+                history, padding = history[alive], padding[alive]
+                past = [(k[alive], v[alive]) for k, v in past]
+
+                if generators is not None:
+                    generators = [generators[i] for i in alive.tolist()]
+
+            history = torch.cat((history, preds.unsqueeze(-1)), dim=-1)
+            padding = F.pad(padding, (0, 1), value=False)
+
+            logits, past = self.model(preds.unsqueeze(-1), past,
+                                      padding=padding)
+            logits = logits[:, -1].float()
+
+        lengths = torch.tensor([len(s) for s in sequences],
+                               dtype=torch.float, device=device)
+        return sequences, (total_log_probs / lengths.clamp(min=1)).tolist()
+
+    def generate_batch(self,
+                       contexts: List[Union[str, List[int]]],
+                       seeds: Optional[List[int]] = None
+                       ) -> List[Tuple[str, float]]:
+        # The contexts which are already encoded are used as they are.
+        contexts = [self._encode_context(context)
+                    if isinstance(context, str) else context
+                    for context in contexts]
+
+        # Keep the last words of too long contexts to generate at least one
+        # word.
+        contexts = [words[:1] + words[len(words) - self.seq_len + 2:]
+                    if len(words) >= self.seq_len else words
+                    for words in contexts]
+
+        sequences, mean_log_probs = self._sample_batch(contexts, seeds)
+        return [(self._decode_words(words + sequence), mean_log_prob)
+                for words, sequence, mean_log_prob in zip(
+                    contexts, sequences, mean_log_probs)]
+
+    @torch.no_grad()
+    def stream(self,
+               context: str,
+               seed: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+        device = 'cuda' if self.use_gpu else 'cpu'
+
+        generators = None
+        if seed is not None:
+            generators = [torch.Generator(device).manual_seed(seed)]
+
+        words = self._encode_context(context)
+        logits, past = self._prefill(words)
+
+        history = torch.tensor([words], dtype=torch.long, device=device)
+        text = self._decode_words(words)
+
+        for length in range(len(words), self.seq_len):
+            preds, _ = self.sampler(logits, history, generators)
+            words.append(preds.item())
+
+            # Yield the generated word with the newly decoded text. Because
+            # subwords are merged into the previous words, the fragment is
+            # the difference between the whole decoded sentences.
+            decoded = self._decode_words(words)
+            yield words[-1], decoded[len(text):]
+            text = decoded
+
+            if words[-1] == self.vocab.eos_idx or length + 1 == self.seq_len:
+                break
 
-        current, total_log_prob, generated, past = words, 0, 0, None
-        while len(current) < self.seq_len:
-            pred, log_prob, past = self._sample_next_word(current, past)
-            total_log_prob += log_prob
+            history = torch.cat((history, preds.unsqueeze(-1)), dim=-1)
+            logits, past = self._predict_next_words(preds.unsqueeze(-1), past)
 
-            current = [pred]
-            generated += 1
-            words.append(pred)
 
-            # Finish generating sentence if end-of-sentence token is
-            # predicted.
-            if pred == self.vocab.eos_idx:
+class BeamSearchGenerator(Generator):
+    def __init__(self,
+                 vocab: Vocab,
+                 tokenizer: Tokenizer,
+                 model: nn.Module,
+                 seq_len: int,
+                 beam_size: int = 4,
+                 length_penalty: float = 1.0,
+                 use_gpu: bool = False,
+                 cache: Optional[PrefixCache] = None):
+        super().__init__(vocab, tokenizer, model, seq_len,
+                         use_gpu=use_gpu, cache=cache)
+        self.beam_size = beam_size
+        self.length_penalty = length_penalty
+
+    def _normalize(self, log_prob: float, length: int) -> float:
+        return log_prob / max(length, 1) ** self.length_penalty
+
+    @torch.no_grad()
+    def _search(self, words: List[int]) -> List[Tuple[List[int], float]]:
+        device = 'cuda' if self.use_gpu else 'cpu'
+
+        logits, past = self._prefill(words)
+
+        # Every hypothesis starts from the single beam of the context.
+        beams = [[]]
+        scores = torch.zeros(1, device=device)
+        finished, next_beams, next_scores = [], [], []
+
+        for length in range(len(words), self.seq_len):
+            log_probs = scores.unsqueeze(-1) + logits.log_softmax(-1)
+
+            # Take twice as many candidates as the beam size so that enough
+            # hypotheses remain after the finished ones are removed.
+            top_log_probs, candidates = log_probs.view(-1).topk(
+                min(2 * self.beam_size, log_probs.numel()))
+
+            next_beams, next_scores, indices, preds = [], [], [], []
+            for log_prob, candidate in zip(top_log_probs.tolist(),
+                                           candidates.tolist()):
+                beam, pred = divmod(candidate, log_probs.size(-1))
+                sequence = beams[beam] + [pred]
+
+                if pred == self.vocab.eos_idx:
+                    finished.append((sequence, self._normalize(
+                        log_prob, len(sequence))))
+                else:
+                    next_beams.append(sequence)
+                    next_scores.append(log_prob)
+                    indices.append(beam)
+                    preds.append(pred)
+
+                if len(next_beams) == self.beam_size:
+                    break
+
+            # Stop searching if the finished hypotheses are better than every
+            # hypothesis in the beam. Both are normalized by the number of
+            # the generated words, excluding the context.
+            finished = sorted(finished, key=lambda h: h[1],
+                              reverse=True)[:self.beam_size]
+            if (not next_beams
+                    or len(finished) == self.beam_size
+                    and finished[-1][1] >= max(
+                        self._normalize(s, len(next_beams[0]))
+                        for s in next_scores)):
+                next_beams = []
+                break
+
+            beams = next_beams
+            scores = torch.tensor(next_scores, device=device)
+
+            if length + 1 == self.seq_len:
                 break
 
-        sentence = self.tokenizer.decode([self.vocab[t] for t in words])
-        return sentence, total_log_prob / generated
+            # Reorder the past key-value pairs to follow the selected beams.
+            indices = torch.tensor(indices, dtype=torch.long, device=device)
+            past = [(k.index_select(0, indices), v.index_select(0, indices))
+                    for k, v in past]
+
+            preds = torch.tensor(preds, dtype=torch.long, device=device)
+            logits, past = self._predict_next_words(preds.unsqueeze(-1), past)
+
+        # The unfinished hypotheses are also candidates when the search
+        # reaches the maximum sequence length.
+        for sequence, score in zip(next_beams, next_scores):
+            finished.append((sequence, self._normalize(score, len(sequence))))
+
+        return sorted(finished, key=lambda h: h[1],
+                      reverse=True)[:self.beam_size]
+
+    def generate_nbest(self, context: str, nbest: int = 1
+                       ) -> List[Tuple[str, float]]:
+        words = self._encode_context(context)
+        return [(self._decode_words(words + sequence), score)
+                for sequence, score in self._search(words)[:nbest]]
+
+    def generate(self,
+                 context: str,
+                 samples: int = 1,
+                 seed: Optional[int] = None) -> Tuple[str, float]:
+        return self.generate_nbest(context, nbest=1)[0]
+
+
+class SpeculativeGenerator(Generator):
+    def __init__(self,
+                 vocab: Vocab,
+                 tokenizer: Tokenizer,
+                 model: nn.Module,
+                 draft: nn.Module,
+                 seq_len: int,
+                 draft_tokens: int = 4,
+                 use_gpu: bool = False,
+                 sampler: Optional[Sampler] = None):
+        if use_gpu:
+            draft.cuda()
+
+        super().__init__(vocab, tokenizer, model, seq_len,
+                         use_gpu=use_gpu, sampler=sampler)
+        self.draft = draft
+        self.draft_tokens = draft_tokens
+        self.stats.update(proposed=0, accepted=0, target_calls=0)
+
+    def _probs(self, logits: torch.Tensor, history: torch.Tensor
+               ) -> Tuple[torch.Tensor, torch.Tensor]:
+        # Calculate the sampling distribution and the log-probabilities of
+        # the candidates over the whole vocabulary, with the penalties of the
+        # words in each history.
+        probs, targets, log_probs = self.sampler.distribution(logits, history)
+        log_probs = torch.full_like(logits, -float('inf')).scatter(
+            -1, targets, log_probs)
+
+        if self.sampler.greedy:
+            probs = torch.ones_like(probs[:, :1])
+            targets = targets[:, :1]
+
+        return torch.zeros_like(logits).scatter(-1, targets, probs), log_probs
+
+    def _histories(self, committed: List[int], proposals: List[int],
+                   device: str) -> torch.Tensor:
+        # The history of each prediction contains the committed words and the
+        # preceding proposals. The shorter ones are padded with the first
+        # word which already appears in every history.
+        return torch.tensor([committed + proposals[:i]
+                             + committed[:1] * (len(proposals) - i)
+                             for i in range(len(proposals) + 1)],
+                            dtype=torch.long, device=device)
+
+    def _choose(self,
+                probs: torch.Tensor,
+                generator: Optional[torch.Generator]) -> int:
+        return torch.multinomial(probs, 1, generator=generator).item()
+
+    def _uniform(self, generator: Optional[torch.Generator]) -> float:
+        return torch.rand((1,), generator=generator,
+                          device=generator.device if generator else None
+                          ).item()
+
+    @torch.no_grad()
+    def _speculate(self, words: List[int], seed: Optional[int] = None
+                   ) -> Tuple[List[int], float]:
+        device = 'cuda' if self.use_gpu else 'cpu'
+
+        generator = None
+        if seed is not None:
+            generator = torch.Generator(device).manual_seed(seed)
+
+        # Both models calculate the committed words except the last one, which
+        # is used to predict the next word.
+        target_past, draft_past = None, None
+        if len(words) > 1:
+            x = torch.tensor([words[:-1]], dtype=torch.long, device=device)
+            _, target_past = self.model(x, None)
+            _, draft_past = self.draft(x, None)
+
+        committed, total_log_prob = list(words), 0
+        while len(committed) < self.seq_len:
+            proposing = min(self.draft_tokens,
+                            self.seq_len - len(committed) - 1)
+
+            # The draft model proposes words autoregressively.
+            pending = committed[_past_length(draft_past):]
+            proposals, draft_probs = [], []
+            for _ in range(proposing):
+                x = torch.tensor([pending], dtype=torch.long, device=device)
+                logits, draft_past = self.draft(x, draft_past)
+
+                history = self._histories(committed, proposals, device)
+                draft_probs.append(self._probs(logits[0, -1:].float(),
+                                               history[-1:])[0][0])
+                proposals.append(self._choose(draft_probs[-1], generator))
+                pending = proposals[-1:]
+
+            # The target model verifies every proposal at once.
+            x = torch.tensor([committed[-1:] + proposals], dtype=torch.long,
+                             device=device)
+            logits, target_past = self.model(x, target_past)
+            target_probs, log_probs = self._probs(
+                logits[0].float(),
+                self._histories(committed, proposals, device))
+
+            # Accept each proposal with the probability of `min(1, p / q)`. If
+            # a proposal is rejected, a word is resampled from the residual
+            # distribution `max(0, p - q)` so that the sampled words follow
+            # the target distribution exactly.
+            accepted = 0
+            for pred, p, q in zip(proposals, target_probs, draft_probs):
+                if self._uniform(generator) * q[pred] > p[pred]:
+                    break
+                accepted += 1
+
+            if accepted < proposing:
+                residual = (target_probs[accepted]
+                            - draft_probs[accepted]).clamp(min=0)
+                if residual.sum() == 0:
+                    residual = target_probs[accepted]
+                pred = self._choose(residual, generator)
+            else:
+                pred = self._choose(target_probs[accepted], generator)
+
+            self.stats['proposed'] += proposing
+            self.stats['accepted'] += accepted
+            self.stats['target_calls'] += 1
+
+            # Commit the accepted proposals and the resampled word.
+            for i, word in enumerate(proposals[:accepted] + [pred]):
+                committed.append(word)
+                total_log_prob += log_probs[i, word].item()
+
+                if word == self.vocab.eos_idx:
+                    break
+
+            if committed[-1] == self.vocab.eos_idx:
+                break
+
+            # Roll back the past key-value pairs of the rejected proposals.
+            target_past = _truncate_past(target_past, len(committed) - 1)
+            draft_past = _truncate_past(draft_past, len(committed) - 1)
+
+        sequence = committed[len(words):]
+        return sequence, total_log_prob / max(len(sequence), 1)
+
+    def generate(self,
+                 context: str,
+                 samples: int = 1,
+                 seed: Optional[int] = None) -> Tuple[str, float]:
+        words = self._encode_context(context)
+        sequence, mean_log_prob = self._speculate(words, seed)
 
-    def generate(self, context: str, samples: int = 20) -> Tuple[str, float]:
-        return max([self._sample(context) for _ in range(samples)],
-                   key=lambda sample: sample[1])
+        return self._decode_words(words + sequence), mean_log_prob
@@ -1,6 +1,9 @@
+import os
+import hashlib
 import torch
 import torch.nn as nn
-from typing import Dict, Any
+from ..modeling.packing import Packing
+from typing import Dict, Any, Optional, Tuple
 
 
 class Objective(object):
@@ -11,6 +14,9 @@ class Objective(object):
              ) -> torch.Tensor:
         raise NotImplementedError()
 
+    def count_targets(self, outputs: torch.Tensor) -> torch.Tensor:
+        return torch.tensor(outputs.numel(), device=outputs.device)
+
     def state_dict(self) -> Dict[str, Any]:
         return {}
 
@@ -19,12 +25,140 @@ class Objective(object):
 
 
 class LMObjective(Objective):
-    def __init__(self, model: nn.Module, pad_idx: int = 0):
+    def __init__(self, model: nn.Module, pad_idx: int = 0,
+                 varlen: bool = False):
         super().__init__(model)
+        self.pad_idx = pad_idx
+        self.varlen = varlen
         self.criterion = nn.CrossEntropyLoss(ignore_index=pad_idx,
                                              reduction='mean')
 
+    def _predict(self, model: nn.Module, inputs: torch.Tensor,
+                 packing: Optional[Packing] = None) -> torch.Tensor:
+        if packing is not None:
+            logits, _ = model(inputs, None, packing)
+        else:
+            logits, _ = model(inputs, None)
+        return logits
+
+    def _packing(self, inputs: torch.Tensor) -> Optional[Packing]:
+        # In variable-length mode, the model calculates the non-pad tokens
+        # only.
+        return Packing(inputs != self.pad_idx) if self.varlen else None
+
+    def count_targets(self, outputs: torch.Tensor) -> torch.Tensor:
+        return (outputs != self.pad_idx).sum()
+
     def loss(self, inputs: torch.Tensor, outputs: torch.Tensor
              ) -> torch.Tensor:
-        logits, _ = self.model(inputs, None)
+        packing = self._packing(inputs)
+        logits = self._predict(self.model, inputs, packing)
+
+        if packing is not None:
+            return self.criterion(logits, packing.pack(outputs))
         return self.criterion(logits.transpose(1, 2), outputs)
+
+
+class DistillationObjective(LMObjective):
+    def __init__(self,
+                 model: nn.Module,
+                 teacher: nn.Module,
+                 pad_idx: int = 0,
+                 temp: float = 2.0,
+                 alpha: float = 0.5,
+                 topk: Optional[int] = None,
+                 cache_dir: Optional[str] = None,
+                 varlen: bool = False):
+        super().__init__(model, pad_idx, varlen)
+        if cache_dir is not None and topk is None:
+            raise ValueError('caching teacher logits requires `topk`.')
+
+        self.teacher = teacher
+        self.temp = temp
+        self.alpha = alpha
+        self.topk = topk
+        self.cache_dir = cache_dir
+
+        # The teacher model is never trained.
+        self.teacher.eval()
+        for param in self.teacher.parameters():
+            param.requires_grad_(False)
+
+        # Cache the logits of each teacher and top-k separately, so the logits
+        # of the other teacher are not reused. The cached logits are not
+        # scaled by the temperature, so it does not need to be separated.
+        if cache_dir is not None:
+            self.cache_dir = os.path.join(
+                cache_dir, f'{self._fingerprint(teacher)}-top{topk}')
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def _fingerprint(model: nn.Module) -> str:
+        digest = hashlib.sha1()
+        for name, tensor in model.state_dict().items():
+            tensor = tensor.detach().cpu().contiguous().view(-1)
+            digest.update(f'{name}:{tensor.dtype}:{tensor.numel()}'.encode())
+            digest.update(tensor.view(torch.uint8).numpy().tobytes())
+        return digest.hexdigest()[:16]
+
+    def _teacher_logits(self,
+                        inputs: torch.Tensor,
+                        packing: Optional[Packing] = None
+                        ) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
+        # Load top-k teacher logits of the same sequences from the cache.
+        # Since packed logits have a different layout, they are cached
+        # separately.
+        if self.cache_dir is not None:
+            key = hashlib.sha1(inputs.cpu().numpy().tobytes())
+            key = key.hexdigest() + ('-varlen' if self.varlen else '')
+            path = os.path.join(self.cache_dir, f'{key}.pt')
+
+            if os.path.exists(path):
+                cached = torch.load(path, map_location=inputs.device)
+                return cached['values'].float(), cached['indices'].long()
+
+        with torch.no_grad():
+            logits = self._predict(self.teacher, inputs, packing).float()
+
+        if self.topk is None:
+            return logits, None
+
+        values, indices = logits.topk(self.topk, dim=-1)
+
+        # Store the top-k logits in half precision to reduce disk usage.
+        if self.cache_dir is not None:
+            torch.save({'values': values.half().cpu(),
+                        'indices': indices.int().cpu()}, path)
+
+        return values, indices
+
+    def loss(self, inputs: torch.Tensor, outputs: torch.Tensor
+             ) -> torch.Tensor:
+        packing = self._packing(inputs)
+        logits = self._predict(self.model, inputs, packing)
+
+        if packing is not None:
+            outputs = packing.pack(outputs)
+            lm_loss = self.criterion(logits, outputs)
+        else:
+            lm_loss = self.criterion(logits.transpose(1, 2), outputs)
+
+        # Compare temperature-scaled distributions of student and teacher.
+        # When only top-k teacher logits are used, the teacher distribution
+        # is renormalized over the top-k words.
+        teacher_logits, indices = self._teacher_logits(inputs, packing)
+        student_log_probs = (logits.float() / self.temp).log_softmax(-1)
+        if indices is not None:
+            student_log_probs = student_log_probs.gather(-1, indices)
+
+        teacher_log_probs = (teacher_logits / self.temp).log_softmax(-1)
+        kl_div = (teacher_log_probs.exp()
+                  * (teacher_log_probs - student_log_probs)).sum(-1)
+
+        # Average the divergence over non-pad target tokens only. Note that
+        # the gradient scale of soft targets is proportional to `1 / temp^2`.
+        mask = (outputs != self.pad_idx).type_as(kl_div)
+        kd_loss = (kl_div * mask).sum() / mask.sum().clamp(min=1)
+        kd_loss = kd_loss * self.temp ** 2
+
+        return self.alpha * kd_loss + (1 - self.alpha) * lm_loss
@@ -0,0 +1,116 @@
+import os
+import time
+import torch
+import pickle
+import torch.multiprocessing as mp
+from .generating import Generator
+from typing import Tuple, List, Optional, Union
+
+# Define new type `Batch` which is a tuple of contexts, which are sentences or
+# their encoded words, and their seeds.
+Batch = Tuple[List[Union[str, List[int]]], Optional[List[int]]]
+
+
+def _pool_worker(generator: Generator,
+                 threads: int,
+                 cores: Optional[List[int]],
+                 tasks: mp.SimpleQueue,
+                 results: mp.SimpleQueue):
+    # Pin the intra-op threads of the worker to its own cores.
+    torch.set_num_threads(threads)
+    if cores is not None:
+        os.sched_setaffinity(0, cores)
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+
+        idx, contexts, seeds = task
+        generated = generator.stats['generated_words']
+
+        # Send the error to the parent process rather than exiting, so the
+        # parent does not wait for the result forever.
+        try:
+            sentences = generator.generate_batch(contexts, seeds)
+        except Exception as e:
+            try:
+                pickle.dumps(e)
+            except Exception:
+                e = RuntimeError(f'{type(e).__name__}: {e}')
+            results.put((idx, e, 0))
+            continue
+
+        results.put((idx, sentences,
+                     generator.stats['generated_words'] - generated))
+
+
+class GeneratorPool(object):
+    def __init__(self,
+                 generator: Generator,
+                 workers: int,
+                 threads: Optional[int] = None,
+                 pin_cores: bool = False):
+        cores = sorted(os.sched_getaffinity(0)
+                       if hasattr(os, 'sched_getaffinity')
+                       else range(os.cpu_count()))
+        threads = threads or max(len(cores) // workers, 1)
+
+        # Move the model parameters to shared memory so that the forked
+        # workers use the same weights without copying them.
+        generator.model.share_memory()
+
+        self.generator = generator
+        self.context = mp.get_context('fork')
+        self.tasks = self.context.SimpleQueue()
+        self.results = self.context.SimpleQueue()
+
+        self.workers = []
+        for rank in range(workers):
+            assigned = None
+            if pin_cores and hasattr(os, 'sched_setaffinity'):
+                assigned = [cores[(rank * threads + i) % len(cores)]
+                            for i in range(threads)]
+
+            worker = self.context.Process(
+                target=_pool_worker,
+                args=(generator, threads, assigned, self.tasks, self.results),
+                daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def generate_batches(self, batches: List[Batch]
+                         ) -> List[List[Tuple[str, float]]]:
+        # Idle workers take the next batch from the shared queue, so the
+        # batches are spread over the workers by their progress.
+        for idx, (contexts, seeds) in enumerate(batches):
+            self.tasks.put((idx, contexts, seeds))
+
+        sentences, errors = [None] * len(batches), []
+        for _ in batches:
+            # Check if the workers are alive while waiting for the results.
+            while self.results.empty():
+                if not all(worker.is_alive() for worker in self.workers):
+                    raise RuntimeError('generator pool worker exited '
+                                       'unexpectedly.')
+                time.sleep(0.01)
+
+            idx, result, generated = self.results.get()
+            if isinstance(result, Exception):
+                errors.append(result)
+
+            sentences[idx] = result
+            self.generator.stats['generated_words'] += generated
+
+        # Raise the error after every result is received, so the remaining
+        # results are not read by the next batches.
+        if errors:
+            raise errors[0]
+
+        return sentences
+
+    def close(self):
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join()
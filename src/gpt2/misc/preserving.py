@@ -1,24 +1,107 @@
+import os
+import time
 import torch
-from typing import Optional
+import shutil
+import threading
+from typing import Optional, Any, List
+
+
+def _to_host(obj: Any) -> Any:
+    # Copy the tensors to host memory so that the training can modify the
+    # original ones while the snapshot is written.
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy=True)
+    elif isinstance(obj, dict):
+        return type(obj)((k, _to_host(v)) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        return type(obj)(_to_host(v) for v in obj)
+    return obj
+
+
+def _write_atomically(ckpt: Any, checkpoint: str, keep: int):
+    # Write to the temporary file first and replace the checkpoint after the
+    # contents are flushed to disk, so the crash while writing does not
+    # corrupt the previous checkpoint.
+    with open(f'{checkpoint}.tmp', 'wb') as fp:
+        torch.save(ckpt, fp)
+        fp.flush()
+        os.fsync(fp.fileno())
+
+    # Shift the previous checkpoints to keep the last ones. The current
+    # checkpoint is linked rather than moved, so the checkpoint path exists
+    # until it is replaced by the new one.
+    for i in range(keep - 1, 1, -1):
+        if os.path.exists(f'{checkpoint}.{i - 1}'):
+            os.replace(f'{checkpoint}.{i - 1}', f'{checkpoint}.{i}')
+
+    if keep > 1 and os.path.exists(checkpoint):
+        if os.path.exists(f'{checkpoint}.1.tmp'):
+            os.remove(f'{checkpoint}.1.tmp')
+
+        try:
+            os.link(checkpoint, f'{checkpoint}.1.tmp')
+        except OSError:
+            shutil.copyfile(checkpoint, f'{checkpoint}.1.tmp')
+        os.replace(f'{checkpoint}.1.tmp', f'{checkpoint}.1')
+
+    os.replace(f'{checkpoint}.tmp', checkpoint)
 
 
 class Preservable(object):
-    def preserve(self, checkpoint: str):
+    def preserve(self, checkpoint: str, keep: int = 1):
         ckpt = {}
         for k, v in self.__dict__.items():
-            if getattr(v, 'state_dict', None):
+            if k.startswith('_'):
+                # Private attributes are not the training states.
+                continue
+            elif getattr(v, 'state_dict', None):
                 # If object has `state_dict` method, use it rather than dump
                 # the value directly.
                 ckpt[k] = v.state_dict()
             elif not callable(v):
                 ckpt[k] = v
 
-        torch.save(ckpt, checkpoint)
+        # Wait for the previous checkpoint to be written and measure how long
+        # the training is stalled.
+        start_time = time.perf_counter()
+        ckpt = _to_host(ckpt)
+        self.wait()
+
+        self._preserve_stalls = getattr(self, '_preserve_stalls', [])
+        self._preserve_stalls.append(time.perf_counter() - start_time)
+
+        # Write the snapshot on background thread. The error while writing is
+        # raised when the next checkpoint waits for it.
+        def _write():
+            try:
+                _write_atomically(ckpt, checkpoint, keep)
+            except Exception as e:
+                self._preserve_error = e
+
+        self._preserving = threading.Thread(target=_write)
+        self._preserving.start()
+
+    def wait(self):
+        if getattr(self, '_preserving', None) is not None:
+            self._preserving.join()
+            self._preserving = None
+
+        error, self._preserve_error = (
+            getattr(self, '_preserve_error', None), None)
+        if error is not None:
+            raise error
+
+    def restore(self, checkpoint: str, map_location: Optional[str] = None
+                ) -> List[str]:
+        # Map the checkpoint file rather than reading the whole contents into
+        # memory if it is supported.
+        try:
+            ckpt = torch.load(checkpoint, map_location=map_location, mmap=True)
+        except (TypeError, RuntimeError):
+            ckpt = torch.load(checkpoint, map_location=map_location)
 
-    def restore(self, checkpoint: str, map_location: Optional[str] = None):
-        ckpt = torch.load(checkpoint, map_location=map_location)
         for k, v in ckpt.items():
-            if getattr(getattr(self, k), 'load_state_dict', None):
+            if getattr(getattr(self, k, None), 'load_state_dict', None):
                 # If object has `load_state_dict` method, use it rather than
                 # assign the value directly.
                 getattr(self, k).load_state_dict(v)
@@ -27,5 +110,9 @@ class Preservable(object):
 
         # Remove used checkpoint object and clear cuda cache to prevent out of
         # memory error.
+        names = list(ckpt)
         del ckpt
-        torch.cuda.empty_cache()
+        if torch.cuda.is_available() and torch.cuda.is_initialized():
+            torch.cuda.empty_cache()
+
+        return names
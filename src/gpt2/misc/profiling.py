@@ -0,0 +1,284 @@
+import os
+import json
+import time
+import torch
+import threading
+import contextlib
+import torch.nn as nn
+from .training import Trainer
+from ..modeling.transformer import Transformer, TransformerLayer
+from ..modeling.attention import AttentionLayer
+from ..modeling.feedforward import PositionwiseFeedForward
+from ..modeling.embedding import PositionalEmbedding, TokenEmbedding
+from typing import Optional, Iterator, Tuple, List, Dict, Any
+
+_PROFILED_MODULES = (Transformer, TransformerLayer, AttentionLayer,
+                     PositionwiseFeedForward, PositionalEmbedding,
+                     TokenEmbedding)
+
+
+def _profiled_modules(model: nn.Module) -> Iterator[Tuple[str, nn.Module]]:
+    for name, module in model.named_modules():
+        if isinstance(module, _PROFILED_MODULES) or name == 'ln_head':
+            yield name or 'transformer', module
+
+
+class Profiler(object):
+    def __init__(self,
+                 model: nn.Module,
+                 start: int = 10,
+                 steps: int = 5,
+                 trace_path: str = 'profile.json'):
+        self.start = start
+        self.steps = steps
+        self.trace_path = trace_path
+
+        self.step_idx = 0
+        self.paused = False
+        self.events = []
+        self.handles = []
+        self.origin = time.perf_counter()
+        self.use_gpu = next(model.parameters()).is_cuda
+
+        # Unwrap the distributed model to find the modeling submodules.
+        self.model = getattr(model, 'module', model)
+        if self.start == 0:
+            self._attach()
+
+    @property
+    def active(self) -> bool:
+        return (not self.paused
+                and self.start <= self.step_idx < self.start + self.steps)
+
+    def _now(self) -> float:
+        # Wait for the launched kernels to measure the elapsed time of the
+        # module rather than the launching time.
+        if self.use_gpu:
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def _memory(self) -> int:
+        if self.use_gpu:
+            return torch.cuda.memory_allocated()
+
+        # Use the resident memory of the process on cpu.
+        try:
+            with open('/proc/self/statm', 'r') as fp:
+                return int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError):
+            return 0
+
+    def _begin(self) -> Tuple[float, int]:
+        return self._now(), self._memory()
+
+    def _end(self, name: str, phase: str, begin: Tuple[float, int]):
+        end_time, memory = self._now(), self._memory()
+        self.events.append({'name': name, 'phase': phase,
+                            'start': begin[0], 'end': end_time,
+                            'memory': memory, 'delta': memory - begin[1],
+                            'thread': threading.get_ident()})
+
+    def _register_hooks(self, name: str, module: nn.Module):
+        forwards, backwards, differentiable = [], [], {}
+
+        def _label(tensor: Optional[torch.Tensor]) -> str:
+            # The token embedding is also used to project the representations
+            # to the vocabulary space.
+            if (isinstance(module, TokenEmbedding) and tensor is not None
+                    and tensor.size(-1) == module.num_embeddings):
+                return f'{name} (projection)'
+            return name
+
+        def _forward_pre_hook(_, inputs):
+            if self.active:
+                forwards.append(self._begin())
+
+        def _forward_hook(_, inputs, outputs):
+            if self.active and forwards:
+                output = outputs[0] if isinstance(outputs, tuple) else outputs
+                label = _label(output)
+                self._end(label, 'forward', forwards.pop())
+
+                # The backward hooks are called before the gradients of the
+                # module are calculated if its inputs do not require them.
+                differentiable[label] = any(
+                    isinstance(x, torch.Tensor) and x.requires_grad
+                    for x in inputs)
+
+                # Only the projection of the token embedding is
+                # differentiable, so its backward pass is measured by the
+                # hooks of its input and output tensors.
+                if (isinstance(module, TokenEmbedding)
+                        and differentiable[label]):
+                    output.register_hook(
+                        lambda grad: _backward_pre_hook(None, (grad,)))
+                    inputs[0].register_hook(
+                        lambda grad: _backward_hook(None, (grad,), None))
+
+        def _backward_pre_hook(_, grad_outputs):
+            label = _label(grad_outputs[0])
+            if self.active and differentiable.get(label):
+                backwards.append((self._begin(), label))
+
+        def _backward_hook(_, grad_inputs, grad_outputs):
+            if self.active and backwards:
+                begin, label = backwards.pop()
+                self._end(label, 'backward', begin)
+
+        self.handles += [
+            module.register_forward_pre_hook(_forward_pre_hook),
+            module.register_forward_hook(_forward_hook)]
+
+        # The inputs of the model and the embeddings are the word indices, so
+        # their gradients are never calculated. The projection of the token
+        # embedding is measured in its forward hook instead.
+        if not isinstance(module, (Transformer, PositionalEmbedding,
+                                   TokenEmbedding)):
+            self.handles += [
+                module.register_full_backward_pre_hook(_backward_pre_hook),
+                module.register_full_backward_hook(_backward_hook)]
+
+    @contextlib.contextmanager
+    def region(self, name: str):
+        if not self.active:
+            yield
+            return
+
+        begin = self._begin()
+        try:
+            yield
+        finally:
+            self._end(name, 'step', begin)
+
+    def _attach(self):
+        for name, module in _profiled_modules(self.model):
+            self._register_hooks(name, module)
+
+    def _detach(self):
+        for handle in self.handles:
+            handle.remove()
+        self.handles.clear()
+
+    def step(self):
+        self.step_idx += 1
+
+        # Install the hooks only in the profiling window, so the modules are
+        # not slowed down by them out of the window. After the window, the
+        # results are exported.
+        if self.step_idx == self.start:
+            self._attach()
+        elif self.step_idx == self.start + self.steps:
+            self._detach()
+
+            self.export_trace(self.trace_path)
+            print(self.summary())
+
+    def export_trace(self, path: str):
+        threads = {}
+        trace = []
+        for event in self.events:
+            tid = threads.setdefault(event['thread'], len(threads))
+            trace.append({'name': event['name'], 'cat': event['phase'],
+                          'ph': 'X', 'pid': 0, 'tid': tid,
+                          'ts': (event['start'] - self.origin) * 1e6,
+                          'dur': (event['end'] - event['start']) * 1e6,
+                          'args': {'memory': event['memory'],
+                                   'memory_delta': event['delta']}})
+
+        with open(path, 'w') as fp:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, fp)
+
+    def aggregate(self) -> List[Dict[str, Any]]:
+        rows = {}
+        for event in self.events:
+            key = (event['name'], event['phase'])
+            if key not in rows:
+                rows[key] = {'name': event['name'], 'phase': event['phase'],
+                             'calls': 0, 'total': 0.0, 'delta': 0}
+
+            rows[key]['calls'] += 1
+            rows[key]['total'] += event['end'] - event['start']
+            rows[key]['delta'] = max(rows[key]['delta'], event['delta'])
+
+        return sorted(rows.values(), key=lambda row: -row['total'])
+
+    def summary(self) -> str:
+        if not self.events:
+            return '[profile] no events are recorded.'
+
+        # Calculate the ratio of each row to the wall time of the window.
+        elapsed = (max(e['end'] for e in self.events)
+                   - min(e['start'] for e in self.events))
+
+        lines = [f'[profile] {self.steps} steps, '
+                 f'{elapsed * 1000:.1f}ms, trace: {self.trace_path}',
+                 f'{"name":<40} {"phase":<9} {"calls":>6} {"total ms":>10} '
+                 f'{"mean ms":>9} {"%":>6} {"max mem MB":>11}']
+        for row in self.aggregate():
+            lines.append(
+                f'{row["name"]:<40} {row["phase"]:<9} {row["calls"]:>6} '
+                f'{row["total"] * 1000:>10.2f} '
+                f'{row["total"] / row["calls"] * 1000:>9.3f} '
+                f'{row["total"] / elapsed * 100:>6.1f} '
+                f'{row["delta"] / 2 ** 20:>11.2f}')
+        return '\n'.join(lines)
+
+
+def apply(trainer: Trainer, profiler: Profiler):
+    def _modified_dataset_fetch(*args, **kwargs):
+        with profiler.region('data'):
+            return _old_dataset_fetch(*args, **kwargs)
+
+    def _modified_objective_loss(*args, **kwargs):
+        with profiler.region('forward'):
+            loss = _old_objective_loss(*args, **kwargs)
+
+        # Patch `loss.backward` to measure the backward pass.
+        def _modified_tensor_backward(*args, **kwargs):
+            with profiler.region('backward'):
+                _old_tensor_backward(*args, **kwargs)
+
+        _old_tensor_backward = loss.backward
+        loss.backward = _modified_tensor_backward
+
+        return loss
+
+    def _optimizer_pre_hook(*_):
+        if profiler.active:
+            optimizer_steps.append(profiler._begin())
+
+    def _optimizer_post_hook(*_):
+        if optimizer_steps:
+            profiler._end('optimizer', 'step', optimizer_steps.pop())
+
+    def _modified_trainer_evaluate(*args, **kwargs):
+        # Exclude the evaluation from the profiled training steps.
+        profiler.paused = True
+        try:
+            _old_trainer_evaluate(*args, **kwargs)
+        finally:
+            profiler.paused = False
+
+    def _modified_trainer_train(*args, **kwargs):
+        with profiler.region('train'):
+            _old_trainer_train(*args, **kwargs)
+        profiler.step()
+
+    # Modify the components of training step to measure each of them.
+    _old_dataset_fetch = trainer.train_dataset.fetch
+    trainer.train_dataset.fetch = _modified_dataset_fetch
+
+    _old_objective_loss = trainer.train_objective.loss
+    trainer.train_objective.loss = _modified_objective_loss
+
+    # Use the hooks of the optimizer rather than modifying `optimizer.step`
+    # which is already wrapped by the learning rate scheduler.
+    optimizer_steps = []
+    trainer.optimizer.register_step_pre_hook(_optimizer_pre_hook)
+    trainer.optimizer.register_step_post_hook(_optimizer_post_hook)
+
+    _old_trainer_evaluate = trainer.evaluate
+    trainer.evaluate = _modified_trainer_evaluate
+
+    _old_trainer_train = trainer.train
+    trainer.train = _modified_trainer_train
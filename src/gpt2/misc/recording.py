@@ -1,5 +1,80 @@
+import os
+import torch
+import shutil
 import functools
-from typing import Optional
+import numpy as np
+from urllib.parse import quote, unquote
+from typing import Optional, Union, Callable, Dict, Tuple, List, Any
+
+# Each metric is stored in its own file as the records of the step and the
+# value, so the steps and the values are read as arrays.
+_RECORD = np.dtype([('step', '<i8'), ('value', '<f8')])
+
+
+class MetricsLog(object):
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, quote(name, safe='') + '.bin')
+
+    def names(self) -> List[str]:
+        return sorted(unquote(filename[:-4])
+                      for filename in os.listdir(self.directory)
+                      if filename.endswith('.bin'))
+
+    def size(self, name: str) -> int:
+        return os.path.getsize(self._path(name)) // _RECORD.itemsize
+
+    def write(self, step: int, metrics: Dict[str, float]):
+        # Append the records to the end of the files and flush them, so the
+        # readers can follow the metrics while training.
+        for name, value in metrics.items():
+            with open(self._path(name), 'ab') as fp:
+                fp.write(np.array([(step, value)], dtype=_RECORD).tobytes())
+
+    def read(self, name: str, start: int = 0, stop: Optional[int] = None
+             ) -> Tuple[np.ndarray, np.ndarray]:
+        # Read the records from the `start`-th one. The partially written
+        # record at the end is ignored.
+        with open(self._path(name), 'rb') as fp:
+            fp.seek(start * _RECORD.itemsize)
+            content = fp.read(-1 if stop is None
+                              else (stop - start) * _RECORD.itemsize)
+
+        records = np.frombuffer(
+            content[:len(content) // _RECORD.itemsize * _RECORD.itemsize],
+            dtype=_RECORD)
+        return records['step'], records['value']
+
+    def state_dict(self) -> Dict[str, Any]:
+        # Store the number of records of each metric rather than the metrics
+        # themselves.
+        return {'directory': self.directory,
+                'offsets': {name: self.size(name) for name in self.names()}}
+
+    def load_state_dict(self, state_dict: Dict[str, Any]):
+        # Copy the log of the restored checkpoint if it is in other directory.
+        if (os.path.abspath(state_dict['directory'])
+                != os.path.abspath(self.directory)):
+            source = MetricsLog(state_dict['directory'])
+            for name in state_dict['offsets']:
+                shutil.copyfile(source._path(name), self._path(name))
+
+        # Remove the records written after the checkpoint was preserved.
+        for name in self.names():
+            with open(self._path(name), 'rb+') as fp:
+                fp.truncate(state_dict['offsets'].get(name, 0)
+                            * _RECORD.itemsize)
+
+    def migrate(self, metrics: Dict[str, List[Tuple[int, float]]]):
+        # Replace the records with the whole metrics of the old checkpoints.
+        self.load_state_dict({'directory': self.directory, 'offsets': {}})
+        for name, values in metrics.items():
+            with open(self._path(name), 'wb') as fp:
+                fp.write(np.array([tuple(v) for v in values],
+                                  dtype=_RECORD).tobytes())
 
 
 class Recordable(object):
@@ -9,23 +84,74 @@ class Recordable(object):
 
     def record(self,
                scope: Optional[str] = None,
-               **metrics: float):
+               **metrics: Union[float, torch.Tensor,
+                                Callable[[], float]]):
         for name, value in metrics.items():
             # Add scope prefix to the metrics name.
             name = f'{scope}/{name}'
 
+            # Keep the tensors on their devices to avoid synchronizing every
+            # step. They are transferred to host at once in `stamp`.
+            if isinstance(value, torch.Tensor):
+                value = value.detach().double()
+            elif callable(value):
+                # The callable metrics are evaluated in `stamp`. They are kept
+                # separately because they cannot be preserved.
+                self._deferred_metrics = getattr(self, '_deferred_metrics',
+                                                 {})
+                self._deferred_metrics.setdefault(name, []).append(value)
+                self.batch_metrics.setdefault(name, [])
+                continue
+
             # Add metrics to the batch.
             if name not in self.batch_metrics:
                 self.batch_metrics[name] = []
             self.batch_metrics[name].append(value)
 
+    def reduce_metrics(self, values: torch.Tensor) -> torch.Tensor:
+        return values
+
     def stamp(self, step: int = 0):
-        for name, values in self.batch_metrics.items():
-            if name not in self.metrics:
-                self.metrics[name] = []
+        if not self.batch_metrics:
+            return
+
+        # Evaluate the deferred metrics, e.g. the elapsed time between cuda
+        # events, which are available only after the events are completed.
+        for name, values in getattr(self, '_deferred_metrics', {}).items():
+            self.batch_metrics[name] += [v() for v in values]
+        self._deferred_metrics = {}
+
+        # Remove the metrics without any values, e.g. the deferred ones which
+        # are not restored from the checkpoint.
+        for name in [k for k, v in self.batch_metrics.items() if not v]:
+            del self.batch_metrics[name]
+
+        # Average the batch metrics and gather them into a single tensor.
+        averaged = [sum(values) / len(values)
+                    for values in self.batch_metrics.values()]
+        device = next((v.device for v in averaged
+                       if isinstance(v, torch.Tensor)), None)
+        averaged = torch.stack([torch.as_tensor(v, dtype=torch.double,
+                                                device=device)
+                                for v in averaged])
+
+        stamped = dict(zip(self.batch_metrics,
+                           self.reduce_metrics(averaged).tolist()))
+
+        metrics_log = getattr(self, 'metrics_log', None)
+        if isinstance(metrics_log, MetricsLog):
+            # Write the averaged batch metrics to the log and keep only the
+            # last ones in memory.
+            metrics_log.write(step, stamped)
+            self.metrics.update({name: [(step, value)]
+                                 for name, value in stamped.items()})
+        else:
+            for name, value in stamped.items():
+                if name not in self.metrics:
+                    self.metrics[name] = []
 
-            # Add averaged batch metrics.
-            self.metrics[name].append((step, sum(values) / len(values)))
+                # Add averaged batch metrics.
+                self.metrics[name].append((step, value))
 
         # After update batch metrics, clear the batch.
         self.batch_metrics.clear()
@@ -0,0 +1,106 @@
+import torch
+from typing import Tuple, List, Optional
+
+
+class Sampler(object):
+    """
+    Tensor          Type            Shape
+    ===========================================================================
+    logits          float           (batch, words)
+    history (*)     long            (batch, history_len)
+    generators (*)  -               [batch]
+    ---------------------------------------------------------------------------
+    output 1        long            (batch,)
+    output 2        float           (batch,)
+    ===========================================================================
+    """
+    def __init__(self,
+                 temp: float = 0.8,
+                 topk: int = 40,
+                 topp: float = 1.0,
+                 repetition_penalty: float = 1.0,
+                 presence_penalty: float = 0.0,
+                 greedy: bool = False):
+        self.temp = temp
+        self.topk = topk
+        self.topp = topp
+        self.repetition_penalty = repetition_penalty
+        self.presence_penalty = presence_penalty
+        self.greedy = greedy
+
+    def _penalize(self, logits: torch.Tensor, history: torch.Tensor
+                  ) -> torch.Tensor:
+        if self.repetition_penalty == 1 and self.presence_penalty == 0:
+            return logits
+
+        # Decrease the logits of the words which are already in each
+        # sequence. Only the appeared words are updated rather than the whole
+        # vocabulary.
+        appeared = logits.gather(-1, history)
+        appeared = torch.where(appeared > 0,
+                               appeared / self.repetition_penalty,
+                               appeared * self.repetition_penalty)
+
+        return logits.scatter(-1, history, appeared - self.presence_penalty)
+
+    def distribution(self,
+                     logits: torch.Tensor,
+                     history: Optional[torch.Tensor] = None
+                     ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        if history is not None:
+            logits = self._penalize(logits, history)
+
+        log_probs = (logits.float() / self.temp).log_softmax(-1)
+
+        # Select the top-k candidates in descending order without sorting the
+        # whole vocabulary.
+        if self.topk:
+            top_log_probs, targets = log_probs.topk(
+                min(self.topk, log_probs.size(-1)), dim=-1)
+            mass = top_log_probs.exp().sum(-1, keepdim=True)
+        else:
+            # If the number of candidates is not limited, increase the
+            # candidates until they contain the whole nucleus.
+            topk = min(64, log_probs.size(-1))
+            while True:
+                top_log_probs, targets = log_probs.topk(topk, dim=-1)
+                if (topk == log_probs.size(-1)
+                        or (top_log_probs.exp().sum(-1) >= self.topp).all()):
+                    break
+                topk = min(topk * 2, log_probs.size(-1))
+            mass = torch.ones_like(top_log_probs[:, :1])
+
+        # Remove the candidates outside of the nucleus, while keeping at least
+        # one candidate.
+        probs = top_log_probs.exp()
+        if self.topp < 1:
+            outside = probs.cumsum(-1) - probs >= self.topp * mass
+            probs = probs.masked_fill(outside, 0)
+
+        return probs / probs.sum(-1, keepdim=True), targets, top_log_probs
+
+    def __call__(self,
+                 logits: torch.Tensor,
+                 history: Optional[torch.Tensor] = None,
+                 generators: Optional[List[torch.Generator]] = None
+                 ) -> Tuple[torch.Tensor, torch.Tensor]:
+        probs, targets, top_log_probs = self.distribution(logits, history)
+
+        if self.greedy:
+            chosen = torch.zeros_like(targets[:, :1])
+        else:
+            # Sample by inverting the cumulative distribution with uniform
+            # random numbers. Each row uses its own generator if given.
+            if generators is None:
+                uniform = torch.rand((probs.size(0), 1), device=probs.device)
+            else:
+                uniform = torch.cat([
+                    torch.rand((1,), generator=g, device=g.device)
+                    for g in generators]).view(-1, 1).to(probs.device)
+
+            cdf = probs.cumsum(-1)
+            chosen = torch.searchsorted(cdf, uniform * cdf[:, -1:])
+            chosen = chosen.clamp(max=probs.size(-1) - 1)
+
+        return (targets.gather(-1, chosen).squeeze(-1),
+                top_log_probs.gather(-1, chosen).squeeze(-1))
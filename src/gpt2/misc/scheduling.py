@@ -0,0 +1,256 @@
+import time
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from collections import deque
+from ..data.vocabulary import Vocab
+from ..modeling.attention import Past
+from .sampling import Sampler
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class Request(object):
+    def __init__(self,
+                 words: List[int],
+                 sampler: Sampler,
+                 max_words: int,
+                 seed: Optional[int] = None,
+                 callback: Optional[Callable[['Request'], None]] = None):
+        self.words = words
+        self.sampler = sampler
+        self.max_words = max_words
+        self.seed = seed
+        self.callback = callback
+
+        self.generated = []
+        self.log_prob = 0.0
+        self.cancelled = False
+        self.error = None
+
+        self.arrived = time.perf_counter()
+        self.first_word = None
+        self.finished = None
+
+    def cancel(self):
+        self.cancelled = True
+
+
+def _pad_left(past: List[Past], padding: torch.Tensor, length: int
+              ) -> Tuple[List[Past], torch.Tensor]:
+    # Left-pad the past key-value pairs and their padding masks to the given
+    # length.
+    extra = length - padding.size(-1)
+    if extra == 0:
+        return past, padding
+
+    past = [(F.pad(k, (0, 0, extra, 0)), F.pad(v, (0, 0, extra, 0)))
+            for k, v in past]
+    return past, F.pad(padding, (extra, 0), value=True)
+
+
+class Scheduler(object):
+    def __init__(self,
+                 model: nn.Module,
+                 vocab: Vocab,
+                 seq_len: int,
+                 max_batch: int = 16,
+                 max_waiting: int = 64,
+                 use_gpu: bool = False):
+        self.model = model
+        self.vocab = vocab
+        self.seq_len = seq_len
+        self.max_batch = max_batch
+        self.max_waiting = max_waiting
+        self.device = 'cuda' if use_gpu else 'cpu'
+
+        self.waiting = deque()
+        self.running = []
+        self.generators = []
+
+        # The state of running batch. `pending` contains the last sampled
+        # words which are not calculated yet.
+        self.past = None
+        self.padding = None
+        self.history = None
+        self.pending = None
+
+        self.stats = {'steps': 0, 'admitted': 0, 'finished': 0,
+                      'rejected': 0, 'failed': 0, 'generated_words': 0}
+
+    def submit(self, request: Request) -> bool:
+        # Reject the request if too many requests are waiting.
+        if len(self.waiting) >= self.max_waiting:
+            self.stats['rejected'] += 1
+            return False
+
+        self.waiting.append(request)
+        return True
+
+    @torch.no_grad()
+    def step(self) -> bool:
+        self._admit()
+        if not self.running:
+            return False
+
+        # Calculate the pending words of every running request at once.
+        padding = F.pad(self.padding, (0, 1), value=False)
+        logits, self.past = self.model(self.pending.unsqueeze(-1), self.past,
+                                       padding=padding)
+        self.padding = padding
+        self.history = torch.cat((self.history,
+                                  self.pending.unsqueeze(-1)), dim=-1)
+
+        preds, log_probs = self._sample(logits[:, -1].float())
+        self.pending = preds
+
+        # The requests whose sampling failed are finished with the error.
+        alive = [self._append(request, pred, log_prob)
+                 if request.error is None else self._fail(request)
+                 for request, pred, log_prob in zip(
+                     self.running, preds.tolist(), log_probs.tolist())]
+        self._retire(alive)
+
+        self.stats['steps'] += 1
+        return True
+
+    def _admit(self):
+        while self.waiting and len(self.running) < self.max_batch:
+            request = self.waiting.popleft()
+            if request.cancelled:
+                self._finish(request)
+                continue
+
+            generator = torch.Generator(self.device)
+            if request.seed is not None:
+                generator.manual_seed(request.seed)
+            else:
+                generator.seed()
+
+            # Calculate the context of the new request separately and sample
+            # its first word.
+            x = torch.tensor([request.words], dtype=torch.long,
+                             device=self.device)
+            logits, past = self.model(x, None)
+
+            # Fail only the request if its sampling options are invalid,
+            # rather than stopping the whole scheduler.
+            try:
+                pred, log_prob = request.sampler(logits[:, -1].float(), x,
+                                                 [generator])
+            except Exception as e:
+                request.error = e
+                self._fail(request)
+                continue
+            self.stats['admitted'] += 1
+
+            if not self._append(request, pred.item(), log_prob.item()):
+                continue
+
+            # Merge the new request into the running batch.
+            padding = torch.zeros_like(x, dtype=torch.bool)
+            if self.running:
+                length = max(self.padding.size(-1), padding.size(-1))
+                self.past, self.padding = _pad_left(self.past, self.padding,
+                                                    length)
+                past, padding = _pad_left(past, padding, length)
+
+                self.past = [(torch.cat((k1, k2)), torch.cat((v1, v2)))
+                             for (k1, v1), (k2, v2) in zip(self.past, past)]
+                self.padding = torch.cat((self.padding, padding))
+                self.history = torch.cat((
+                    F.pad(self.history, (length - self.history.size(-1), 0),
+                          value=self.vocab.pad_idx),
+                    F.pad(x, (length - x.size(-1), 0),
+                          value=self.vocab.pad_idx)))
+                self.pending = torch.cat((self.pending, pred))
+            else:
+                self.past, self.padding = past, padding
+                self.history, self.pending = x, pred
+
+            self.running.append(request)
+            self.generators.append(generator)
+
+    def _sample(self, logits: torch.Tensor
+                ) -> Tuple[torch.Tensor, torch.Tensor]:
+        preds = torch.full((logits.size(0),), self.vocab.pad_idx,
+                           dtype=torch.long, device=logits.device)
+        log_probs = torch.zeros(logits.size(0), device=logits.device)
+
+        # Sample the requests which have the same sampling options together.
+        groups = {}
+        for i, request in enumerate(self.running):
+            groups.setdefault(repr(vars(request.sampler)), []).append(i)
+
+        for rows in groups.values():
+            sampler = self.running[rows[0]].sampler
+            indices = torch.tensor(rows, device=logits.device)
+
+            try:
+                preds[indices], log_probs[indices] = sampler(
+                    logits[indices], self.history[indices],
+                    [self.generators[i] for i in rows])
+            except Exception as e:
+                for i in rows:
+                    self.running[i].error = e
+
+        return preds, log_probs
+
+    def _append(self, request: Request, pred: int, log_prob: float) -> bool:
+        if request.first_word is None:
+            request.first_word = time.perf_counter()
+
+        request.generated.append(pred)
+        request.log_prob += log_prob
+        self.stats['generated_words'] += 1
+
+        # Finish the request if it predicts end-of-sentence token or reaches
+        # its maximum length.
+        if (request.cancelled
+                or pred == self.vocab.eos_idx
+                or len(request.generated) >= request.max_words
+                or len(request.words) + len(request.generated)
+                >= self.seq_len):
+            self._finish(request)
+            return False
+        return True
+
+    def _fail(self, request: Request) -> bool:
+        self.stats['failed'] += 1
+        self._finish(request)
+        return False
+
+    def _finish(self, request: Request):
+        request.finished = time.perf_counter()
+        self.stats['finished'] += 1
+
+        if request.callback is not None:
+            request.callback(request)
+
+    def _retire(self, alive: List[bool]):
+        if all(alive):
+            return
+
+        indices = [i for i, a in enumerate(alive) if a]
+        self.running = [self.running[i] for i in indices]
+        self.generators = [self.generators[i] for i in indices]
+
+        if not self.running:
+            self.past = self.padding = self.history = self.pending = None
+            return
+
+        indices = torch.tensor(indices, device=self.padding.device)
+        self.pending = self.pending[indices]
+        self.padding = self.padding[indices]
+        self.history = self.history[indices]
+        self.past = [(k[indices], v[indices]) for k, v in self.past]
+
+        # Remove the columns which are padded in every remaining request.
+        start = int((~self.padding).any(0).nonzero()[0])
+        if start > 0:
+            self.padding = self.padding[:, start:]
+            self.history = self.history[:, start:]
+            self.past = [(k[:, start:], v[:, start:]) for k, v in self.past]
+
+    def state(self) -> Dict[str, int]:
+        return dict(self.stats, running=len(self.running),
+                    waiting=len(self.waiting))
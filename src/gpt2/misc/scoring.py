@@ -0,0 +1,86 @@
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from ..data.vocabulary import Vocab
+from typing import List, Tuple
+
+
+class Scorer(object):
+    def __init__(self,
+                 model: nn.Module,
+                 vocab: Vocab,
+                 seq_len: int,
+                 stride: int,
+                 batch_size: int = 32,
+                 use_gpu: bool = False):
+        # The windows should move forward to cover the whole document.
+        if stride <= 0:
+            raise ValueError(f'stride should be positive, but got {stride}.')
+
+        if use_gpu:
+            model.cuda()
+
+        self.model = model
+        self.vocab = vocab
+        self.seq_len = seq_len
+        self.stride = min(stride, seq_len)
+        self.batch_size = batch_size
+        self.device = 'cuda' if use_gpu else 'cpu'
+
+    def _windows(self, words: List[int]) -> List[Tuple[int, int, int]]:
+        # Split the document into the windows `words[begin:end]` which predict
+        # `words[begin + 1:end + 1]`. Each window scores only the last targets
+        # which are not scored in the previous windows, so the targets are
+        # predicted with at least `seq_len - stride` words of context.
+        windows, begin, scored = [], 0, 0
+        while scored < len(words) - 1:
+            end = min(begin + self.seq_len, len(words) - 1)
+            windows.append((begin, end, end - scored))
+
+            begin, scored = begin + self.stride, end
+        return windows
+
+    @torch.inference_mode()
+    def score(self, documents: List[List[int]]) -> List[Tuple[float, int]]:
+        windows = [(i, window)
+                   for i, words in enumerate(documents)
+                   for window in self._windows(words)]
+
+        # Sort the windows by their lengths to reduce the padded words.
+        windows.sort(key=lambda w: w[1][1] - w[1][0])
+
+        total_nll = [0.0] * len(documents)
+        total_words = [0] * len(documents)
+        for i in range(0, len(windows), self.batch_size):
+            batch = windows[i:i + self.batch_size]
+            length = max(end - begin for _, (begin, end, _) in batch)
+
+            inputs = [documents[j][begin:end] for j, (begin, end, _) in batch]
+            outputs = [documents[j][begin + 1:end + 1]
+                       for j, (begin, end, _) in batch]
+
+            # Pad the windows on the right side, which does not change the
+            # predictions of the real words in causal attention.
+            x, y = [torch.tensor([s + [self.vocab.pad_idx] * (length - len(s))
+                                  for s in seqs],
+                                 dtype=torch.long, device=self.device)
+                    for seqs in (inputs, outputs)]
+
+            logits, _ = self.model(x, None)
+            nll = F.cross_entropy(logits.transpose(1, 2).float(), y,
+                                  reduction='none')
+
+            # Sum the negative log-likelihoods of the scored targets only.
+            position = torch.arange(length, device=self.device)
+            ends = torch.tensor([end - begin for _, (begin, end, _) in batch],
+                                device=self.device).unsqueeze(-1)
+            scored = torch.tensor([s for _, (_, _, s) in batch],
+                                  device=self.device).unsqueeze(-1)
+            mask = (position >= ends - scored) & (position < ends)
+
+            for (j, (_, _, s)), window_nll in zip(
+                    batch, (nll * mask).sum(-1).tolist()):
+                total_nll[j] += window_nll
+                total_words[j] += s
+
+        return list(zip(total_nll, total_words))
@@ -0,0 +1,168 @@
+import sys
+import json
+import mmap
+import torch
+import struct
+import torch.nn as nn
+import argparse
+from typing import Tuple, Dict, Any, Optional
+
+# The tensor file starts with the magic bytes and the length of its JSON
+# header. Every tensor is aligned to `_ALIGNMENT` bytes after the header.
+_MAGIC = b'GPT2TNSR'
+_ALIGNMENT = 64
+
+# The model configurations which determine the shapes of the parameters.
+_ARCHITECTURE = ['layers', 'heads', 'dims', 'rate', 'words']
+
+_DTYPES = {'float64': torch.float64, 'float32': torch.float32,
+           'float16': torch.float16, 'bfloat16': torch.bfloat16,
+           'int64': torch.int64, 'int32': torch.int32,
+           'uint8': torch.uint8, 'bool': torch.bool}
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def save_tensors(path: str,
+                 tensors: Dict[str, torch.Tensor],
+                 config: Optional[Dict[str, Any]] = None):
+    dtypes = {v: k for k, v in _DTYPES.items()}
+
+    # Calculate the offsets of the tensors in the data section.
+    entries, offset = {}, 0
+    for name, tensor in tensors.items():
+        nbytes = tensor.numel() * tensor.element_size()
+        entries[name] = {'dtype': dtypes[tensor.dtype],
+                         'shape': list(tensor.shape),
+                         'offset': offset, 'nbytes': nbytes}
+        offset = _align(offset + nbytes)
+
+    # Pad the header with whitespaces to align the data section.
+    header = json.dumps({'config': config or {}, 'tensors': entries})
+    header = header.encode().ljust(
+        _align(len(_MAGIC) + 8 + len(header)) - len(_MAGIC) - 8)
+
+    with open(path, 'wb') as fp:
+        fp.write(_MAGIC + struct.pack('<Q', len(header)) + header)
+
+        start = fp.tell()
+        for name, tensor in tensors.items():
+            fp.seek(start + entries[name]['offset'])
+            fp.write(tensor.detach().cpu().contiguous().reshape(-1)
+                     .view(torch.uint8).numpy().tobytes())
+
+        # Extend the file to the end of the aligned data section.
+        fp.truncate(start + offset)
+
+
+def _read_header(fp) -> Tuple[Dict[str, Any], int]:
+    if fp.read(len(_MAGIC)) != _MAGIC:
+        raise ValueError('not a tensor file.')
+
+    length, = struct.unpack('<Q', fp.read(8))
+    return json.loads(fp.read(length).decode()), len(_MAGIC) + 8 + length
+
+
+def is_tensor_file(path: str) -> bool:
+    with open(path, 'rb') as fp:
+        return fp.read(len(_MAGIC)) == _MAGIC
+
+
+def load_config(path: str) -> Dict[str, Any]:
+    with open(path, 'rb') as fp:
+        return _read_header(fp)[0]['config']
+
+
+def load_tensors(path: str
+                 ) -> Tuple[Dict[str, torch.Tensor], Dict[str, Any]]:
+    with open(path, 'rb') as fp:
+        header, start = _read_header(fp)
+
+        # Map the file with copy-on-write access. The pages are read lazily
+        # when the tensors are accessed, and the unmodified pages are shared
+        # with other processes through the page cache.
+        buffer = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    tensors = {}
+    for name, entry in header['tensors'].items():
+        dtype = _DTYPES[entry['dtype']]
+        if entry['nbytes'] == 0:
+            tensors[name] = torch.empty(entry['shape'], dtype=dtype)
+            continue
+
+        count = entry['nbytes'] // torch.empty((), dtype=dtype).element_size()
+        tensors[name] = torch.frombuffer(
+            buffer, dtype=dtype, count=count,
+            offset=start + entry['offset']).view(entry['shape'])
+
+    return tensors, header['config']
+
+
+def infer_config(state_dict: Dict[str, torch.Tensor], heads: int
+                 ) -> Dict[str, int]:
+    # Infer the model configuration from the shapes of the parameters. The
+    # number of heads does not change the shapes, so it should be given.
+    dims = state_dict['token_embedding.weight'].size(1)
+    if heads <= 0 or dims % heads != 0:
+        raise ValueError(f'dimensionality {dims} is not divisible by '
+                         f'{heads} heads.')
+
+    layers = len({name.split('.')[1] for name in state_dict
+                  if name.startswith('transformers.')})
+    return {'layers': layers, 'heads': heads, 'dims': dims,
+            'rate': state_dict['transformers.0.ff.0.weight'].size(0) // dims,
+            'seq_len': state_dict['positional_embedding.weight'].size(0),
+            'words': state_dict['token_embedding.weight'].size(0)}
+
+
+def load_model(model: nn.Module, checkpoint: str, use_gpu: bool = False):
+    if not is_tensor_file(checkpoint):
+        ckpt = torch.load(checkpoint,
+                          map_location='cuda' if use_gpu else 'cpu')
+        model.load_state_dict(ckpt['model'])
+        return
+
+    # Use the memory-mapped tensors as the parameters directly on cpu rather
+    # than copying them.
+    tensors, _ = load_tensors(checkpoint)
+
+    # Use the leading positions only if the model is created with the shorter
+    # sequence length than the stored one.
+    positions = model.state_dict().get('positional_embedding.weight')
+    if positions is not None and 'positional_embedding.weight' in tensors:
+        tensors['positional_embedding.weight'] = \
+            tensors['positional_embedding.weight'][:positions.size(0)]
+
+    if use_gpu:
+        model.load_state_dict(tensors)
+        return
+
+    try:
+        model.load_state_dict(tensors, assign=True)
+    except TypeError:
+        # The parameters are copied from the mapped tensors if assigning
+        # them is not supported.
+        model.load_state_dict(tensors)
+
+
+def update_args(args: argparse.Namespace):
+    if not is_tensor_file(args.checkpoint):
+        return
+
+    # Use the model architecture in the tensor file rather than the given
+    # arguments.
+    config = load_config(args.checkpoint)
+    for name in _ARCHITECTURE:
+        if name in config and getattr(args, name, None) not in (
+                None, config[name]):
+            print(f'[warning] `{name}` is replaced with {config[name]} of '
+                  f'the checkpoint.', file=sys.stderr)
+            setattr(args, name, config[name])
+
+    # Keep the given sequence length if the model supports it.
+    if 'seq_len' in config and getattr(args, 'seq_len', 0) > config['seq_len']:
+        print(f'[warning] `seq_len` is clamped to {config["seq_len"]} of the '
+              f'checkpoint.', file=sys.stderr)
+        args.seq_len = config['seq_len']
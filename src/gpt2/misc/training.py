@@ -1,11 +1,14 @@
+import time
 import torch
+import resource
+import contextlib
 import torch.nn as nn
 import torch.optim as optim
 from .objective import Objective
 from .preserving import Preservable
-from .recording import Recordable, records
+from .recording import Recordable, MetricsLog, records
 from ..data.serving import Dataset
-from typing import Optional
+from typing import Optional, Union, Callable, List
 
 
 class Trainer(Recordable, Preservable):
@@ -16,7 +19,8 @@ class Trainer(Recordable, Preservable):
                  train_dataset: Dataset,
                  eval_dataset: Dataset,
                  train_objective: Objective,
-                 eval_objective: Objective):
+                 eval_objective: Objective,
+                 peak_tflops: Optional[float] = None):
         super().__init__()
         self.iters = -1
         self.model = model
@@ -26,32 +30,148 @@ class Trainer(Recordable, Preservable):
         self.eval_dataset = eval_dataset
         self.train_objective = train_objective
         self.eval_objective = eval_objective
+        self._peak_tflops = peak_tflops
+
+    def _device(self) -> torch.device:
+        return next(self.model.parameters()).device
+
+    def _clock(self) -> Union[float, torch.cuda.Event]:
+        # Record cuda events rather than synchronizing the device to measure
+        # the elapsed time. They are read when the metrics are stamped.
+        if self._device().type == 'cuda':
+            event = torch.cuda.Event(enable_timing=True)
+            event.record()
+            return event
+        return time.perf_counter()
+
+    def _peak_memory(self) -> float:
+        if self._device().type == 'cuda':
+            return torch.cuda.max_memory_allocated() / 2 ** 20
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+    def _flops_per_token(self, seq_len: int) -> int:
+        # Unwrap the distributed model to estimate the operations from the
+        # configuration of the model.
+        model = getattr(self.model, 'module', self.model)
+        if not hasattr(model, 'flops_per_token'):
+            return 0
+        return model.flops_per_token(seq_len)
 
     def save(self, checkpoint: str):
-        torch.save({'metrics': self.metrics,
-                    'model': self.model.cpu().state_dict()}, checkpoint)
+        ckpt = {'metrics': self.metrics,
+                'model': self.model.cpu().state_dict()}
+
+        # Store the location of the metrics log instead of the whole metrics.
+        if isinstance(getattr(self, 'metrics_log', None), MetricsLog):
+            ckpt['metrics_log'] = self.metrics_log.state_dict()
+
+        torch.save(ckpt, checkpoint)
+
+    def restore(self, checkpoint: str, map_location: Optional[str] = None
+                ) -> List[str]:
+        names = super().restore(checkpoint, map_location)
+
+        # The old checkpoints contain the whole metrics rather than the state
+        # of the metrics log, so the log is recreated with them to remove the
+        # records of the previous run.
+        metrics_log = getattr(self, 'metrics_log', None)
+        if isinstance(metrics_log, MetricsLog) and 'metrics_log' not in names:
+            metrics_log.migrate(self.metrics)
+            self.metrics = {name: values[-1:]
+                            for name, values in self.metrics.items()}
+
+        return names
 
     @records('train')
-    def train(self, batch: Optional[int] = None):
+    def train(self, batch: Optional[int] = None, accumulate: int = 1):
         self.model.train()
         self.optimizer.zero_grad()
 
-        data = self.train_dataset.fetch(batch, device='cuda')
+        clocks = [self._clock()]
+        data = self.train_dataset.fetch(batch, device=self._device())
+        clocks.append(self._clock())
+
+        # Split the batch into micro-batches and weight their losses by the
+        # number of target tokens, so the accumulated gradients are same as
+        # the ones of the whole batch.
+        inputs = data['input'].chunk(accumulate)
+        outputs = data['output'].chunk(accumulate)
 
-        loss = self.train_objective.loss(data['input'], data['output'])
-        loss.backward()
+        # The counts are kept on the device to avoid synchronizing every
+        # step.
+        counts = torch.stack([self.train_objective.count_targets(y)
+                              for y in outputs])
+        weights = counts / counts.sum().clamp(min=1)
+        total_loss = 0
+
+        for i, (x, y) in enumerate(zip(inputs, outputs)):
+            weight = weights[i]
+
+            # Skip synchronizing the gradients in distributed training except
+            # for the last micro-batch.
+            with contextlib.ExitStack() as stack:
+                if i < len(inputs) - 1 and hasattr(self.model, 'no_sync'):
+                    stack.enter_context(self.model.no_sync())
+
+                loss = self.train_objective.loss(x, y)
+                clocks.append(self._clock())
+                loss.backward(weight.to(loss.dtype))
+                clocks.append(self._clock())
+
+            total_loss += loss.detach() * weight
 
         self.optimizer.step()
         self.scheduler.step()
+        clocks.append(self._clock())
+
+        # The clocks are read in the order of data fetch, forward and backward
+        # passes of the micro-batches, and optimization.
+        def _elapsed(*phases: int) -> Callable[[], float]:
+            def _evaluate() -> float:
+                if isinstance(clocks[-1], torch.cuda.Event):
+                    clocks[-1].synchronize()
+                    return sum(clocks[i].elapsed_time(clocks[i + 1])
+                               for i in phases) / 1000
+                return sum(clocks[i + 1] - clocks[i] for i in phases)
+            return _evaluate
+
+        def _milliseconds(*phases: int) -> Callable[[], float]:
+            elapsed = _elapsed(*phases)
+            return lambda: elapsed() * 1000
+
+        def _per_second(count: float) -> Callable[[], float]:
+            elapsed = _elapsed(*range(len(clocks) - 1))
+            return lambda: count / elapsed()
+
+        tokens = data['input'].numel()
+        flops = sum(x.numel() * self._flops_per_token(x.size(-1))
+                    for x in inputs)
+
+        metrics = {
+            'loss': total_loss,
+            'tokens_per_sec': _per_second(tokens),
+            'real_tokens_per_sec': _per_second(counts.sum()),
+            'samples_per_sec': _per_second(data['input'].size(0)),
+            'tflops': _per_second(flops / 1e12),
+            'data_ms': _milliseconds(0),
+            'forward_ms': _milliseconds(*range(1, len(clocks) - 2, 2)),
+            'backward_ms': _milliseconds(*range(2, len(clocks) - 1, 2)),
+            'optimizer_ms': _milliseconds(len(clocks) - 2),
+            'peak_memory_mb': self._peak_memory()}
+
+        # Calculate the model flops utilization against the peak performance
+        # of the device.
+        if self._peak_tflops:
+            metrics['mfu'] = _per_second(flops / 1e12 / self._peak_tflops)
 
-        return {'loss': loss.item()}
+        return metrics
 
     @records('eval')
     def evaluate(self, batch: Optional[int] = None):
         with torch.no_grad():
             self.model.eval()
 
-            data = self.eval_dataset.fetch(batch, device='cuda')
+            data = self.eval_dataset.fetch(batch, device=self._device())
             loss = self.eval_objective.loss(data['input'], data['output'])
 
-        return {'loss': loss.item()}
+        return {'loss': loss}
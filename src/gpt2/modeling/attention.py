@@ -1,6 +1,7 @@
 import math
 import torch
 import torch.nn as nn
+from .packing import Packing
 from typing import Optional, Tuple
 
 # Define new type `Past` which is a tuple of two `torch.Tensor`.
@@ -94,6 +95,9 @@ class AttentionLayer(nn.Module):
     output 1        float           (..., query_len, dims)
     output 2 (*)    float           (..., past_len + kv_len, dims)
     ===========================================================================
+
+    If `packing` is given, the inputs are packed tensors of shape
+    (total, dims) and `mask` has the shape of (batch, width, width).
     """
     def __init__(self, heads: int, dims: int, dropout: float = 0.1):
         super().__init__()
@@ -108,7 +112,8 @@ class AttentionLayer(nn.Module):
                 k: torch.Tensor,
                 v: torch.Tensor,
                 past: Optional[Past] = None,
-                mask: Optional[torch.Tensor] = None
+                mask: Optional[torch.Tensor] = None,
+                packing: Optional[Packing] = None
                 ) -> Tuple[torch.Tensor, Past]:
         # Project input tensors.
         q = self.proj_q(q)
@@ -121,6 +126,15 @@ class AttentionLayer(nn.Module):
             v = torch.cat((past[1], v), dim=-2)
 
         # Calculate multi-headed attention and apply linear projection.
-        x = self.linear(self.attn(q, k, v, mask))
+        if packing is not None:
+            # Restore the padded layout only while calculating attentions so
+            # that each token attends to the tokens in its own sequence.
+            x = self.attn(packing.unpack(q, packing.width),
+                          packing.unpack(k, packing.width),
+                          packing.unpack(v, packing.width),
+                          mask)
+            x = self.linear(packing.pack(x))
+        else:
+            x = self.linear(self.attn(q, k, v, mask))
 
         return x, (k, v)
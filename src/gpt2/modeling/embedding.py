@@ -1,5 +1,6 @@
 import torch
 import torch.nn as nn
+from typing import Optional
 
 
 class PositionalEmbedding(nn.Embedding):
@@ -7,6 +8,7 @@ class PositionalEmbedding(nn.Embedding):
     Tensor          Type            Shape
     ===========================================================================
     input           long            (..., seq_len)
+    position (*)    long            (..., seq_len)
     ---------------------------------------------------------------------------
     output          float           (..., seq_len, embedding_dim)
     ===========================================================================
@@ -26,11 +28,16 @@ class PositionalEmbedding(nn.Embedding):
         state_dict['weight'] = weight
         super().load_state_dict(state_dict)
 
-    def forward(self, x: torch.Tensor, offset: int = 0) -> torch.Tensor:
-        # Create position indices tensor.
-        position = torch.arange(offset, offset + x.size(-1),
-                                dtype=torch.long, device=x.device)
-        position = position.view((1,) * (x.ndim - 1) + (-1,)).expand_as(x)
+    def forward(self,
+                x: torch.Tensor,
+                offset: int = 0,
+                position: Optional[torch.Tensor] = None) -> torch.Tensor:
+        # Create position indices tensor if it is not given.
+        if position is None:
+            position = torch.arange(offset, offset + x.size(-1),
+                                    dtype=torch.long, device=x.device)
+            position = (position.view((1,) * (x.ndim - 1) + (-1,))
+                                .expand_as(x))
 
         # Embed the position indices to vectors.
         return super().forward(position)
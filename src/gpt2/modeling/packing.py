@@ -0,0 +1,43 @@
+import torch
+from typing import Optional
+
+
+class Packing(object):
+    """
+    Tensor          Type            Shape
+    ===========================================================================
+    real            bool            (batch, seq_len)
+    ---------------------------------------------------------------------------
+    rows            long            (total,)
+    position        long            (total,)
+    ===========================================================================
+    """
+    def __init__(self, real: torch.Tensor):
+        self.batch, self.seq_len = real.shape
+
+        # Collect the coordinates of real tokens in row-major order, so the
+        # tokens of each sequence are contiguous in the packed layout.
+        self.rows, self.position = real.nonzero(as_tuple=True)
+
+        # Attention is calculated over the padded layout which is trimmed to
+        # the last column containing real tokens.
+        self.width = (int(self.position.max()) + 1
+                      if self.position.numel() else 0)
+
+    def pack(self, x: torch.Tensor) -> torch.Tensor:
+        # Gather real tokens from the padded layout of shape
+        # (batch, length, ...).
+        indices = self.rows * x.size(1) + self.position
+        return x.flatten(0, 1).index_select(0, indices)
+
+    def unpack(self, x: torch.Tensor, length: Optional[int] = None
+               ) -> torch.Tensor:
+        length = length or self.seq_len
+
+        # Scatter real tokens to the padded layout and fill the others with
+        # zeros.
+        indices = self.rows * length + self.position
+        padded = x.new_zeros((self.batch * length,) + x.shape[1:])
+        padded = padded.index_copy(0, indices, x)
+
+        return padded.view((self.batch, length) + x.shape[1:])
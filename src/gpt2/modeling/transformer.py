@@ -4,6 +4,7 @@ from ..utils.fusing import LayerNorm
 from .masking import PadMasking, FutureMasking
 from .embedding import PositionalEmbedding, TokenEmbedding
 from .attention import AttentionLayer, Past
+from .packing import Packing
 from .feedforward import PositionwiseFeedForward
 from typing import Optional, Tuple, List
 
@@ -19,6 +20,9 @@ class TransformerLayer(nn.Module):
     output 1        float           (..., seq_len, dims)
     output 2 (*)    float           (..., past_len + seq_len, dims)
     ===========================================================================
+
+    If `packing` is given, `x` is a packed tensor of shape (total, dims) and
+    `mask` has the shape of (batch, width, width).
     """
     def __init__(self,
                  heads: int,
@@ -34,10 +38,11 @@ class TransformerLayer(nn.Module):
     def forward(self,
                 x: torch.Tensor,
                 past: Optional[Past] = None,
-                mask: Optional[torch.Tensor] = None) -> torch.Tensor:
+                mask: Optional[torch.Tensor] = None,
+                packing: Optional[Packing] = None) -> torch.Tensor:
         # Layer normalizations are performed before the layers respectively.
         a = self.ln_attn(x)
-        a, past = self.attn(a, a, a, past, mask)
+        a, past = self.attn(a, a, a, past, mask, packing)
 
         x = x + a
         x = x + self.ff(self.ln_ff(x))
@@ -51,10 +56,19 @@ class Transformer(nn.Module):
     ===========================================================================
     x               long            (..., seq_len)
     past (**)       float           (..., past_len, dims)
+    padding (*)     bool            (..., past_len + seq_len)
     ---------------------------------------------------------------------------
     output 1        float           (..., seq_len, dims)
     output 2 (**)   float           (..., past_len + seq_len, dims)
     ===========================================================================
+
+    If `padding` is given, the padded keys including the ones in `past` are
+    masked and the positions are counted from the first non-padded tokens. It
+    is used to decode left-padded sequences of different lengths together.
+
+    If `packing` is given, `x` should have the shape of (batch, seq_len) and
+    only the real tokens are calculated. Then the outputs are packed tensors
+    of shape (total, words) and (total, dims) respectively.
     """
     def __init__(self,
                  layers: int,
@@ -80,20 +94,45 @@ class Transformer(nn.Module):
             for _ in range(layers)])
         self.ln_head = LayerNorm(dims)
 
+    def flops_per_token(self, seq_len: int) -> int:
+        # Estimate the floating-point operations of forward and backward passes
+        # for each token: 6 for each parameter used in matrix multiplications,
+        # including the vocabulary projection, and 12 for each dimension of
+        # the attention scores over the sequence in each layer.
+        params = (sum(p.numel() for p in self.parameters())
+                  - self.positional_embedding.weight.numel())
+        dims = self.token_embedding.embedding_dim
+        return 6 * params + 12 * len(self.transformers) * dims * seq_len
+
     def forward(self,
                 x: torch.Tensor,
-                past: Optional[List[Past]] = None
+                past: Optional[List[Past]] = None,
+                packing: Optional[Packing] = None,
+                padding: Optional[torch.Tensor] = None
                 ) -> Tuple[torch.Tensor, List[Past]]:
+        if packing is not None:
+            return self._forward_packed(x, packing)
+
         # The past key-value pairs imply that input sequences are shifted.
         offset = past[0][0].size(-2) if past is not None else 0
 
         # Create masking tensor.
-        mask = self.pad_masking(x, offset)
+        position = None
+        if padding is not None:
+            mask = padding.unsqueeze(-2).expand(x.shape + padding.shape[-1:])
+            leading = ((~padding).cumsum(-1) == 0).sum(-1, keepdim=True)
+            position = (torch.arange(offset, offset + x.size(-1),
+                                     dtype=torch.long, device=x.device)
+                        - leading).clamp(min=0)
+        else:
+            mask = self.pad_masking(x, offset)
+
         if not self.bidirectional:
             mask = mask + self.future_masking(x, offset)
 
         # Create embedding vectors with dropout layer.
-        x = self.token_embedding(x) + self.positional_embedding(x, offset)
+        x = (self.token_embedding(x)
+             + self.positional_embedding(x, offset, position))
         x = self.dropout_embedding(x)
 
         # Apply transformer layers sequentially.
@@ -107,3 +146,31 @@ class Transformer(nn.Module):
         x = self.token_embedding(x, transposed=True)
 
         return x, present
+
+    def _forward_packed(self, x: torch.Tensor, packing: Packing
+                        ) -> Tuple[torch.Tensor, List[Past]]:
+        # Create masking tensor over the trimmed padded layout which is used
+        # in attention layers.
+        padded = x[:, :packing.width]
+        mask = self.pad_masking(padded)
+        if not self.bidirectional:
+            mask = mask + self.future_masking(padded)
+
+        # Create embedding vectors of the real tokens with dropout layer.
+        x = packing.pack(x)
+        x = (self.token_embedding(x)
+             + self.positional_embedding(x, position=packing.position))
+        x = self.dropout_embedding(x)
+
+        # Apply transformer layers sequentially. Position-wise operations are
+        # performed on the packed tensors.
+        present = []
+        for transformer in self.transformers:
+            x, p = transformer(x, None, mask, packing)
+            present.append(p)
+
+        # Project representations to vocabulary space.
+        x = self.ln_head(x)
+        x = self.token_embedding(x, transposed=True)
+
+        return x, present
@@ -0,0 +1,127 @@
+import os
+import json
+import math
+import time
+import torch
+import argparse
+import itertools
+import torch.multiprocessing as mp
+from .data.vocabulary import Vocab
+from .modeling.transformer import Transformer
+from .misc.scoring import Scorer
+from .misc import serializing
+
+
+def _score_worker(rank: int, args: argparse.Namespace):
+    # Divide the threads for the workers to prevent oversubscription.
+    if args.workers > 1:
+        torch.set_num_threads(max(os.cpu_count() // args.workers, 1))
+
+    # Prepare vocabulary and model.
+    vocab = Vocab(vocab_path=args.vocab)
+    model = Transformer(layers=args.layers, pad_idx=vocab.pad_idx,
+                        words=len(vocab), seq_len=args.seq_len,
+                        heads=args.heads, dims=args.dims, rate=args.rate,
+                        dropout=0, bidirectional=False)
+    model.eval()
+
+    # Restore trained GPT-2 parameters from checkpoint.
+    serializing.load_model(model, args.checkpoint, use_gpu=args.use_gpu)
+
+    scorer = Scorer(model, vocab, seq_len=args.seq_len, stride=args.stride,
+                    batch_size=args.batch_size, use_gpu=args.use_gpu)
+
+    # Each worker scores every `workers`-th document of the corpus.
+    output = args.output if args.workers == 1 else f'{args.output}.{rank}'
+    with open(args.corpus, 'r', encoding='utf-8') as src, \
+            open(output, 'w', encoding='utf-8') as dst:
+        lines = itertools.islice(src, rank, None, args.workers)
+        while True:
+            chunk = list(itertools.islice(lines, args.chunk_size))
+            if not chunk:
+                break
+
+            # Add special tokens to the documents as in training.
+            documents = [[vocab.bos_idx]
+                         + [vocab[t] for t in line.split()]
+                         + [vocab.eos_idx] for line in chunk]
+
+            for nll, words in scorer.score(documents):
+                dst.write(json.dumps({
+                    'nll': nll, 'words': words,
+                    'perplexity': math.exp(nll / words)}) + '\n')
+
+
+def _merge_shards(args: argparse.Namespace):
+    # Interleave the scores of the workers into input order.
+    shards = [open(f'{args.output}.{rank}', 'r', encoding='utf-8')
+              for rank in range(args.workers)]
+    with open(args.output, 'w', encoding='utf-8') as fp:
+        for lines in itertools.zip_longest(*shards):
+            fp.write(''.join(line for line in lines if line is not None))
+
+    for rank, shard in enumerate(shards):
+        shard.close()
+        os.remove(f'{args.output}.{rank}')
+
+
+def _score_corpus(args: argparse.Namespace):
+    # Use the model configuration of the checkpoint if it is stored.
+    serializing.update_args(args)
+
+    start_time = time.perf_counter()
+    if args.workers > 1:
+        mp.spawn(_score_worker, args=(args,), nprocs=args.workers)
+        _merge_shards(args)
+    else:
+        _score_worker(0, args)
+    elapsed = time.perf_counter() - start_time
+
+    # Calculate the perplexity of the whole corpus.
+    total_nll, total_words, total_documents = 0.0, 0, 0
+    with open(args.output, 'r', encoding='utf-8') as fp:
+        for line in fp:
+            result = json.loads(line)
+            total_nll += result['nll']
+            total_words += result['words']
+            total_documents += 1
+
+    print(f'[score] documents: {total_documents}, words: {total_words}, '
+          f'perplexity: {math.exp(total_nll / max(total_words, 1)):.4f}, '
+          f'words/s: {total_words / elapsed:.1f}')
+
+
+def add_subparser(subparsers: argparse._SubParsersAction):
+    parser = subparsers.add_parser(
+        'score', help='calculate perplexity of corpus by using GPT-2 model.')
+
+    parser.add_argument('--corpus', required=True,
+                        help='tokenized corpus file to score')
+    parser.add_argument('--output', required=True,
+                        help='jsonl file to write the score of each line')
+    parser.add_argument('--vocab', required=True,
+                        help='vocabulary file path')
+    parser.add_argument('--checkpoint', required=True,
+                        help='trained model checkpoint')
+    parser.add_argument('--seq_len', default=64, type=int,
+                        help='maximum length of sequences')
+    parser.add_argument('--stride', default=32, type=int,
+                        help='number of words scored by each window')
+    parser.add_argument('--layers', default=12, type=int,
+                        help='number of decoder layers')
+    parser.add_argument('--heads', default=16, type=int,
+                        help='number of multi-heads in attention')
+    parser.add_argument('--dims', default=1024, type=int,
+                        help='dimension of representation in each layer')
+    parser.add_argument('--rate', default=4, type=int,
+                        help='increase rate of dimensionality in bottleneck')
+    parser.add_argument('--batch_size', default=64, type=int,
+                        help='number of windows in each batch')
+    parser.add_argument('--chunk_size', default=1024, type=int,
+                        help='number of documents scored together')
+    parser.add_argument('--workers', default=1, type=int,
+                        help='number of processes to score in parallel')
+    parser.add_argument('--use_gpu', action='store_true',
+                        help='use gpu for scoring corpus.')
+
+    parser.set_defaults(func=_score_corpus)
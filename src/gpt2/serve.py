@@ -0,0 +1,264 @@
+import json
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from .data.vocabulary import Vocab
+from .data.tokenization import Tokenizer
+from .modeling.transformer import Transformer
+from .misc.sampling import Sampler
+from .misc.scheduling import Scheduler, Request
+from .misc import serializing
+from typing import Dict, Any, Tuple, Callable
+
+_HTTP_STATUS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+                500: 'Internal Server Error', 503: 'Service Unavailable',
+                504: 'Gateway Timeout'}
+
+
+def _parse_option(options: Dict[str, Any],
+                  name: str,
+                  default: Any,
+                  cast: Callable[[Any], Any],
+                  valid: Callable[[Any], bool],
+                  description: str) -> Any:
+    value = options.get(name, default)
+    if value is None:
+        return None
+
+    # Coerce the value to the expected type and reject the invalid ones
+    # before the request is submitted to the shared scheduler.
+    try:
+        if isinstance(value, (bool, list, dict)):
+            raise TypeError
+        value = cast(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f'`{name}` should be {description}.')
+
+    if not valid(value):
+        raise ValueError(f'`{name}` should be {description}.')
+    return value
+
+
+async def _read_http_request(reader: asyncio.StreamReader
+                             ) -> Tuple[str, str, bytes]:
+    method, path, _ = (await reader.readline()).decode().split(' ', 2)
+
+    # Read headers until an empty line.
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+
+        key, value = line.decode().split(':', 1)
+        headers[key.strip().lower()] = value.strip()
+
+    body = await reader.readexactly(int(headers.get('content-length', 0)))
+    return method, path, body
+
+
+def _write_http_response(writer: asyncio.StreamWriter,
+                         status: int,
+                         content: Dict[str, Any]):
+    body = json.dumps(content).encode()
+    writer.write(f'HTTP/1.1 {status} {_HTTP_STATUS[status]}\r\n'
+                 f'Content-Type: application/json\r\n'
+                 f'Content-Length: {len(body)}\r\n'
+                 f'Connection: close\r\n\r\n'.encode() + body)
+
+
+class _GenerationServer(object):
+    def __init__(self,
+                 scheduler: Scheduler,
+                 tokenizer: Tokenizer,
+                 args: argparse.Namespace):
+        self.scheduler = scheduler
+        self.tokenizer = tokenizer
+        self.vocab = scheduler.vocab
+        self.args = args
+
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.wakeup = asyncio.Event()
+
+    async def run_scheduler(self):
+        loop = asyncio.get_event_loop()
+
+        # Run decoding steps in the separated thread so that the event loop
+        # keeps accepting new requests.
+        while True:
+            self.wakeup.clear()
+            if not await loop.run_in_executor(self.executor,
+                                              self.scheduler.step):
+                await self.wakeup.wait()
+
+    async def handle(self,
+                     reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter):
+        try:
+            method, path, body = await _read_http_request(reader)
+
+            if method == 'GET' and path == '/stats':
+                _write_http_response(writer, 200, self.scheduler.state())
+            elif method == 'POST' and path == '/generate':
+                _write_http_response(writer, *await self._generate(body))
+            else:
+                _write_http_response(writer, 404, {'error': 'not found'})
+        except (ValueError, KeyError) as e:
+            _write_http_response(writer, 400, {'error': str(e)})
+        except Exception as e:
+            _write_http_response(writer, 500, {'error': str(e)})
+        finally:
+            try:
+                await writer.drain()
+            finally:
+                writer.close()
+
+    async def _generate(self, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        options = json.loads(body.decode() or '{}')
+        if not isinstance(options, dict):
+            raise ValueError('request body should be a json object.')
+        if not isinstance(options.get('context'), str):
+            raise ValueError('`context` should be a string.')
+
+        words = [self.vocab.bos_idx] + [
+            self.vocab[t] for t in self.tokenizer.encode(options['context'])]
+        if len(words) >= self.args.seq_len:
+            raise ValueError('context is too long.')
+
+        sampler = Sampler(
+            temp=_parse_option(options, 'temp', self.args.temp, float,
+                               lambda v: 0 < v < float('inf'),
+                               'a positive number'),
+            topk=_parse_option(options, 'topk', self.args.topk, int,
+                               lambda v: v >= 0, 'a non-negative integer'),
+            topp=_parse_option(options, 'topp', self.args.topp, float,
+                               lambda v: 0 < v <= 1, 'a number in (0, 1]'),
+            repetition_penalty=_parse_option(
+                options, 'repetition_penalty', 1.0, float,
+                lambda v: 0 < v < float('inf'), 'a positive number'),
+            presence_penalty=_parse_option(
+                options, 'presence_penalty', 0.0, float,
+                lambda v: abs(v) < float('inf'), 'a finite number'),
+            greedy=options.get('greedy', False))
+        if not isinstance(sampler.greedy, bool):
+            raise ValueError('`greedy` should be a boolean.')
+
+        max_words = _parse_option(options, 'max_words', self.args.max_words,
+                                  int, lambda v: v > 0, 'a positive integer')
+        seed = _parse_option(options, 'seed', None, int,
+                             lambda v: 0 <= v < 2 ** 64,
+                             'a non-negative 64-bit integer')
+        timeout = _parse_option(options, 'timeout', self.args.timeout, float,
+                                lambda v: 0 < v < float('inf'),
+                                'a positive number')
+
+        # Resolve the future when the scheduler finishes the request.
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+
+        def _callback(request: Request):
+            loop.call_soon_threadsafe(
+                lambda: future.done() or future.set_result(request))
+
+        request = Request(words, sampler, max_words=max_words, seed=seed,
+                          callback=_callback)
+        if not self.scheduler.submit(request):
+            return 503, {'error': 'too many requests.'}
+        self.wakeup.set()
+
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            request.cancel()
+            return 504, {'error': 'request timed out.'}
+
+        if request.error is not None:
+            return 500, {'error': str(request.error)}
+
+        sentence = self.tokenizer.decode(
+            [self.vocab[t] for t in request.words + request.generated])
+        return 200, {
+            'sentence': sentence,
+            'words': len(request.generated),
+            'log_prob': request.log_prob / max(len(request.generated), 1),
+            'latency': request.finished - request.arrived,
+            'first_word_latency': request.first_word - request.arrived}
+
+
+def _serve_model(args: argparse.Namespace):
+    # Use the model configuration of the checkpoint if it is stored.
+    serializing.update_args(args)
+
+    # Prepare tokenizer and model.
+    vocab = Vocab(vocab_path=args.vocab)
+    tokenizer = Tokenizer(
+        vocab, special_tokens=[vocab.unk_token] + vocab.additional_tokens)
+
+    model = Transformer(layers=args.layers, pad_idx=vocab.pad_idx,
+                        words=len(vocab), seq_len=args.seq_len,
+                        heads=args.heads, dims=args.dims, rate=args.rate,
+                        dropout=0, bidirectional=False)
+    model.eval()
+
+    # Restore trained GPT-2 parameters from checkpoint.
+    serializing.load_model(model, args.checkpoint, use_gpu=args.use_gpu)
+    if args.use_gpu:
+        model.cuda()
+
+    scheduler = Scheduler(model, vocab, seq_len=args.seq_len,
+                          max_batch=args.max_batch,
+                          max_waiting=args.max_waiting,
+                          use_gpu=args.use_gpu)
+
+    # Start serving the model with the continuous-batching scheduler.
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    server = _GenerationServer(scheduler, tokenizer, args)
+    loop.run_until_complete(
+        asyncio.start_server(server.handle, args.host, args.port))
+    print(f'Serving GPT-2 on http://{args.host}:{args.port}')
+
+    loop.run_until_complete(server.run_scheduler())
+
+
+def add_subparser(subparsers: argparse._SubParsersAction):
+    parser = subparsers.add_parser(
+        'serve', help='serve GPT-2 model through HTTP/JSON API.')
+
+    parser.add_argument('--vocab', required=True,
+                        help='vocabulary file path')
+    parser.add_argument('--checkpoint', required=True,
+                        help='trained model checkpoint')
+    parser.add_argument('--seq_len', default=64, type=int,
+                        help='maximum length of sequences')
+    parser.add_argument('--layers', default=12, type=int,
+                        help='number of decoder layers')
+    parser.add_argument('--heads', default=16, type=int,
+                        help='number of multi-heads in attention')
+    parser.add_argument('--dims', default=1024, type=int,
+                        help='dimension of representation in each layer')
+    parser.add_argument('--rate', default=4, type=int,
+                        help='increase rate of dimensionality in bottleneck')
+    parser.add_argument('--temp', default=0.8, type=float,
+                        help='default scale factor of prediction logits')
+    parser.add_argument('--topk', default=40, type=int,
+                        help='default number of next-word candidates')
+    parser.add_argument('--topp', default=1.0, type=float,
+                        help='default cumulative probability of nucleus')
+    parser.add_argument('--max_words', default=64, type=int,
+                        help='default maximum number of generated words')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='host address to bind')
+    parser.add_argument('--port', default=8000, type=int,
+                        help='port number to bind')
+    parser.add_argument('--max_batch', default=16, type=int,
+                        help='maximum number of requests in running batch')
+    parser.add_argument('--max_waiting', default=64, type=int,
+                        help='maximum number of waiting requests')
+    parser.add_argument('--timeout', default=30.0, type=float,
+                        help='default timeout of each request in seconds')
+    parser.add_argument('--use_gpu', action='store_true',
+                        help='use gpu for generating sentences.')
+
+    parser.set_defaults(func=_serve_model)
@@ -1,3 +1,4 @@
+import torch
 import argparse
 import torch.optim as optim
 import torch.multiprocessing as mp
@@ -6,7 +7,10 @@ from .utils import fusing
 from .utils import distributing
 from .misc import progress
 from .misc.training import Trainer
-from .misc.objective import LMObjective
+from .misc.recording import MetricsLog
+from .misc.objective import LMObjective, DistillationObjective
+from .misc import serializing
+from .misc import profiling
 from .data.vocabulary import Vocab
 from .data.serving import TokenizedCorpusDataset
 from .modeling.transformer import Transformer
@@ -17,8 +21,21 @@ warnings.filterwarnings(action='ignore')
 
 
 def _main_worker(rank: int, args: argparse.Namespace):
-    if args.gpus:
-        distributing.initialize(idx=rank, gpus=args.gpus)
+    processes = len(args.gpus) if args.gpus else args.cpu_workers
+    if processes:
+        distributing.initialize(
+            idx=rank, world_size=args.world_size or processes,
+            backend=args.backend or ('nccl' if args.gpus else 'gloo'),
+            init_method=args.init_method,
+            rank_offset=args.node_rank * processes, gpus=args.gpus,
+            threads=args.threads, pin_threads=args.pin_threads)
+    elif args.threads:
+        torch.set_num_threads(args.threads)
+
+    # Train the model on cpu if gpu is not available or cpu workers are used.
+    device = ('cuda' if args.gpus or (torch.cuda.is_available()
+                                      and not args.cpu_workers)
+              else 'cpu')
 
     # Prepare datasets, model and its objective.
     vocab = Vocab(vocab_path=args.vocab)
@@ -32,45 +49,114 @@ def _main_worker(rank: int, args: argparse.Namespace):
     model = Transformer(layers=args.layers, pad_idx=vocab.pad_idx,
                         words=len(vocab), seq_len=args.seq_len,
                         heads=args.heads, dims=args.dims, rate=args.rate,
-                        dropout=args.dropout, bidirectional=False).cuda()
-    objective = LMObjective(model, pad_idx=vocab.pad_idx)
+                        dropout=args.dropout, bidirectional=False).to(device)
+    objective = LMObjective(model, pad_idx=vocab.pad_idx,
+                            varlen=args.varlen)
 
-    # Create optimizer, learning rate scheduler and integrated trainer.
-    optimizer = fusing.Adam(
-        model.parameters(), lr=args.base_lr, weight_decay=args.wd_rate)
+    # Distill the knowledge of the given teacher model into the student.
+    if args.teacher:
+        teacher = Transformer(layers=args.teacher_layers,
+                              pad_idx=vocab.pad_idx, words=len(vocab),
+                              seq_len=args.seq_len, heads=args.teacher_heads,
+                              dims=args.teacher_dims, rate=args.teacher_rate,
+                              dropout=0, bidirectional=False)
+        serializing.load_model(teacher, args.teacher)
+
+        train_objective = DistillationObjective(
+            model, teacher.to(device), pad_idx=vocab.pad_idx,
+            temp=args.distill_temp, alpha=args.distill_alpha,
+            topk=args.distill_topk, cache_dir=args.distill_cache,
+            varlen=args.varlen)
+    else:
+        train_objective = objective
+
+    # Create optimizer, learning rate scheduler and integrated trainer. The
+    # optimizer states are partitioned over the processes if they are
+    # sharded.
+    if processes and args.shard_optimizer:
+        optimizer = distributing.shard_optimizer(
+            model.parameters(), fusing.Adam,
+            lr=args.base_lr, weight_decay=args.wd_rate)
+    else:
+        optimizer = fusing.Adam(
+            model.parameters(), lr=args.base_lr, weight_decay=args.wd_rate)
     scheduler = optim.lr_scheduler.LambdaLR(
         optimizer, lambda step: 1 - step / args.iterations)
 
     trainer = Trainer(model, optimizer, scheduler, train_dataset, eval_dataset,
-                      train_objective=objective, eval_objective=objective)
+                      train_objective=train_objective,
+                      eval_objective=objective, peak_tflops=args.peak_tflops)
+
+    # Write the metrics to the log next to the checkpoint rather than keeping
+    # all of them in the training states.
+    trainer.metrics_log = MetricsLog(f'{args.checkpoint}.metrics')
 
     # Use automatic mixed-precision.
     if args.use_amp:
         amp.apply(trainer)
 
-    # Use distributed training.
-    if args.gpus:
+    # Use distributed training with the gradient communication hook.
+    if processes:
         distributing.apply(trainer)
+        distributing.register_comm_hook(
+            trainer, args.comm_hook, powersgd_rank=args.powersgd_rank,
+            powersgd_start=args.powersgd_start)
 
-    # Restore training states from checkpoint.
+    # Restore training states from checkpoint. Otherwise, remove the metrics
+    # of the previous run which used the same checkpoint path.
     if args.restore:
         trainer.restore(args.restore)
+    else:
+        trainer.metrics_log.load_state_dict(
+            {'directory': trainer.metrics_log.directory, 'offsets': {}})
+
+    # Measure the time and memory of the modules and the components of the
+    # training steps in the given window. Only the master process is
+    # profiled, so the trace is not overwritten by the other processes.
+    if args.profile and args.node_rank * processes + rank == 0:
+        profiling.apply(trainer, profiling.Profiler(
+            trainer.model, start=args.profile_start,
+            steps=args.profile_steps, trace_path=args.profile_trace))
+
+    # Start training the model. The throughput and utilization are shown with
+    # the losses.
+    fstring = ('train/loss: {train_loss:.4f}, eval/loss: {eval_loss:.4f}, '
+               'tokens/s: {train_tokens_per_sec:.0f} '
+               '({train_real_tokens_per_sec:.0f} non-pad), '
+               'samples/s: {train_samples_per_sec:.1f}, '
+               'step: {train_data_ms:.0f}/{train_forward_ms:.0f}/'
+               '{train_backward_ms:.0f}/{train_optimizer_ms:.0f}ms, '
+               'memory: {train_peak_memory_mb:.0f}MB')
+    if args.peak_tflops:
+        fstring += ', mfu: {train_mfu:.1%}'
 
-    # Start training the model.
     progressbar = progress.ProgressBar(
         trainer.iters + 1, args.iterations,
-        desc='Train GPT-2', observe=trainer,
-        fstring='train/loss: {train_loss:.4f}, eval/loss: {eval_loss:.4f}')
+        desc='Train GPT-2', observe=trainer, fstring=fstring)
 
     for trainer.iters in progressbar:
-        trainer.train(batch=args.batch_train)
+        trainer.train(batch=args.batch_train, accumulate=args.accumulate)
 
         if (trainer.iters + 1) % args.eval_iters == 0:
             trainer.evaluate(batch=args.batch_eval)
             trainer.stamp(trainer.iters)
 
         if (trainer.iters + 1) % args.save_iters == 0:
-            trainer.preserve(args.checkpoint)
+            trainer.preserve(args.checkpoint, keep=args.keep_checkpoints)
+
+    # Wait for the last checkpoint and report the stall time of the training
+    # loop while saving checkpoints.
+    trainer.wait()
+
+    stalls = getattr(trainer, '_preserve_stalls', None)
+    if stalls:
+        print(f'[checkpoint] saves: {len(stalls)}, '
+              f'stall per save: mean {sum(stalls) / len(stalls) * 1000:.1f}ms'
+              f' / max {max(stalls) * 1000:.1f}ms')
+
+    # Report the memory usage of each process.
+    if processes:
+        distributing.report_memory(trainer)
 
     # Save trained model and recorded metrics.
     trainer.save(args.checkpoint)
@@ -79,6 +165,8 @@ def _main_worker(rank: int, args: argparse.Namespace):
 def _train_gpt2_model(args: argparse.Namespace):
     if args.gpus:
         mp.spawn(_main_worker, args=(args,), nprocs=len(args.gpus))
+    elif args.cpu_workers:
+        mp.spawn(_main_worker, args=(args,), nprocs=args.cpu_workers)
     else:
         _main_worker(0, args)
 
@@ -98,6 +186,8 @@ def add_subparser(subparsers: argparse._SubParsersAction):
                         help='checkpoint file path')
     parser.add_argument('--batch_train', default=64, type=int,
                         help='batch size for training')
+    parser.add_argument('--accumulate', default=1, type=int,
+                        help='number of micro-batches in each training step')
     parser.add_argument('--batch_eval', default=64, type=int,
                         help='batch size for evaluation')
     parser.add_argument('--seq_len', default=64, type=int,
@@ -122,9 +212,64 @@ def add_subparser(subparsers: argparse._SubParsersAction):
                         help='period to evaluate')
     parser.add_argument('--save_iters', default=1000, type=int,
                         help='period to save training state')
+    parser.add_argument('--keep_checkpoints', default=1, type=int,
+                        help='number of last training states to keep')
     parser.add_argument('--gpus', default=None, type=int, nargs='*',
                         help='gpu ids for training')
+    parser.add_argument('--cpu_workers', default=0, type=int,
+                        help='number of processes for training on cpu')
+    parser.add_argument('--backend', default=None, choices=['nccl', 'gloo'],
+                        help='distributed backend (nccl for gpu by default)')
+    parser.add_argument('--init_method', default='tcp://127.0.0.1:8000',
+                        help='rendezvous url (tcp://, file:// or env://)')
+    parser.add_argument('--world_size', default=None, type=int,
+                        help='total number of processes over the nodes')
+    parser.add_argument('--node_rank', default=0, type=int,
+                        help='rank of this node in multi-node training')
+    parser.add_argument('--threads', default=None, type=int,
+                        help='number of intra-op threads in each process')
+    parser.add_argument('--pin_threads', action='store_true',
+                        help='pin the threads of each process to its cores')
+    parser.add_argument('--shard_optimizer', action='store_true',
+                        help='partition optimizer states over the processes')
+    parser.add_argument('--comm_hook', default='none',
+                        choices=['none', 'fp16', 'bf16', 'powersgd'],
+                        help='gradient compression in distributed training')
+    parser.add_argument('--powersgd_rank', default=1, type=int,
+                        help='rank of low-rank gradients in powersgd hook')
+    parser.add_argument('--powersgd_start', default=1000, type=int,
+                        help='iterations before compressing with powersgd')
+    parser.add_argument('--peak_tflops', default=None, type=float,
+                        help='peak tflops of device to calculate mfu')
+    parser.add_argument('--profile', action='store_true',
+                        help='profile modules and steps in training')
+    parser.add_argument('--profile_start', default=10, type=int,
+                        help='number of steps before profiling')
+    parser.add_argument('--profile_steps', default=5, type=int,
+                        help='number of profiled steps')
+    parser.add_argument('--profile_trace', default='profile.json',
+                        help='chrome trace file of profiled steps')
     parser.add_argument('--use_amp', action='store_true',
                         help='use automatic mixed-precision in training')
+    parser.add_argument('--varlen', action='store_true',
+                        help='calculate non-pad tokens only in the model')
+    parser.add_argument('--teacher', default=None,
+                        help='trained teacher model checkpoint to distill')
+    parser.add_argument('--teacher_layers', default=12, type=int,
+                        help='number of decoder layers in teacher model')
+    parser.add_argument('--teacher_heads', default=16, type=int,
+                        help='number of multi-heads in teacher model')
+    parser.add_argument('--teacher_dims', default=1024, type=int,
+                        help='dimension of representation in teacher model')
+    parser.add_argument('--teacher_rate', default=4, type=int,
+                        help='increase rate of dimensionality in teacher')
+    parser.add_argument('--distill_temp', default=2.0, type=float,
+                        help='temperature of distillation logits')
+    parser.add_argument('--distill_alpha', default=0.5, type=float,
+                        help='weight of distillation loss against lm loss')
+    parser.add_argument('--distill_topk', default=None, type=int,
+                        help='number of teacher logits to distill')
+    parser.add_argument('--distill_cache', default=None,
+                        help='directory to cache top-k teacher logits')
 
     parser.set_defaults(func=_train_gpt2_model)
@@ -14,9 +14,9 @@ def _modify_objective(objective: Objective, optimizer: optim.Optimizer):
         loss = _old_objective_loss(*args, **kwargs)
 
         # Patch `loss.backward` to perform loss scaling.
-        def _modified_tensor_backward():
+        def _modified_tensor_backward(gradient=None):
             with amp.scale_loss(loss, optimizer) as scaled_loss:
-                torch.autograd.backward(scaled_loss)
+                torch.autograd.backward(scaled_loss, gradient)
         loss.backward = _modified_tensor_backward
 
         return loss
@@ -1,47 +1,82 @@
+import os
 import torch
+import resource
+import torch.optim as optim
 import torch.distributed as dist
 from torch.nn.parallel import DistributedDataParallel
+from torch.distributed.optim import ZeroRedundancyOptimizer
+from torch.distributed.algorithms.ddp_comm_hooks import default_hooks
+from torch.distributed.algorithms.ddp_comm_hooks import powerSGD_hook
 from ..data.serving import Dataset
 from ..misc import progress
 from ..misc.training import Trainer
-from ..misc.objective import Objective
-from typing import Optional, List
+from typing import Optional, List, Iterable, Type, Any, Dict
 
 
-def initialize(idx: int, gpus: List[int]):
+def initialize(idx: int,
+               world_size: int,
+               backend: str = 'nccl',
+               init_method: str = 'tcp://127.0.0.1:8000',
+               rank_offset: int = 0,
+               gpus: Optional[List[int]] = None,
+               threads: Optional[int] = None,
+               pin_threads: bool = False):
     # Store current distributing states.
-    global _current_idx
-    global _gpu_devices
+    global _current_rank
+    global _world_size
+    global _gpu_device
 
-    _current_idx = idx
-    _gpu_devices = gpus
+    _current_rank = rank_offset + idx
+    _world_size = world_size
+    _gpu_device = gpus[idx] if gpus else None
 
-    # Initialize distributed process environment.
-    torch.cuda.set_device(idx)
-    dist.init_process_group(backend='nccl',
-                            init_method='tcp://127.0.0.1:8000',
-                            world_size=len(gpus),
-                            rank=idx)
+    # Limit the intra-op threads of each process and pin them to separate
+    # cores to prevent the processes on the same node from oversubscribing.
+    if threads is not None:
+        torch.set_num_threads(threads)
+        if pin_threads and hasattr(os, 'sched_setaffinity'):
+            cores = sorted(os.sched_getaffinity(0))
+            os.sched_setaffinity(0, [cores[(idx * threads + i) % len(cores)]
+                                     for i in range(threads)])
+
+    # Initialize distributed process environment. The rendezvous is given by
+    # `init_method`, which can be `tcp://`, `file://` or `env://`.
+    if _gpu_device is not None:
+        torch.cuda.set_device(_gpu_device)
+    dist.init_process_group(backend=backend,
+                            init_method=init_method,
+                            world_size=world_size,
+                            rank=_current_rank)
 
     # Disable progress bar if current process is not a master.
-    if idx != 0:
+    if _current_rank != 0:
         progress.ProgressBar = lambda start, end, *_, **__: range(start, end)
 
 
-def _modify_dataset(dataset: Dataset, idx: int, gpus: List[int]):
+def shard_optimizer(params: Iterable[torch.Tensor],
+                    optimizer_class: Type[optim.Optimizer],
+                    **defaults: Any) -> ZeroRedundancyOptimizer:
+    # Each process keeps the optimizer states of its own partition of the
+    # parameters, and broadcasts the updated ones to the other processes.
+    return ZeroRedundancyOptimizer(list(params),
+                                   optimizer_class=optimizer_class,
+                                   **defaults)
+
+
+def _modify_dataset(dataset: Dataset, rank: int, world_size: int):
     def _modified_dataset_fetch(batch: Optional[int] = None,
                                 device: Optional[str] = None):
-        if batch is None or batch % len(gpus) != 0:
-            raise ValueError('batch size must be a multiple of total gpu '
+        if batch is None or batch % world_size != 0:
+            raise ValueError('batch size must be a multiple of total process '
                              'count.')
 
-        batch = batch // len(gpus)
+        batch = batch // world_size
 
-        # Skip sequences which is for other gpus and take the corresponding
-        # ones.
-        dataset.skip(idx * batch)
+        # Skip sequences which is for other processes and take the
+        # corresponding ones.
+        dataset.skip(rank * batch)
         data = _old_dataset_fetch(batch, device)
-        dataset.skip((len(gpus) - idx - 1) * batch)
+        dataset.skip((world_size - rank - 1) * batch)
 
         return data
 
@@ -50,56 +85,69 @@ def _modify_dataset(dataset: Dataset, idx: int, gpus: List[int]):
     dataset.fetch = _modified_dataset_fetch
 
 
-def _modify_objective(objective: Objective,  num_gpus: int):
-    def _modified_objective_loss(*args, **kwargs):
-        loss = _old_objective_loss(*args, **kwargs)
-
-        # Patch `loss.backward` to perform loss scaling.
-        def _modified_tensor_item():
-            rt = loss.clone()
-            dist.all_reduce(rt, op=dist.reduce_op.SUM)
-            return (rt / num_gpus).item()
-        loss.item = _modified_tensor_item
+def _modify_recordable(trainer: Trainer, world_size: int):
+    def _modified_reduce_metrics(values: torch.Tensor) -> torch.Tensor:
+        # Average the metrics over the processes with a single collective
+        # operation.
+        dist.all_reduce(values, op=dist.ReduceOp.SUM)
+        return values / world_size
 
-        return loss
-
-    # Modify `objective.loss` to return patched loss tensor.
-    _old_objective_loss = objective.loss
-    objective.loss = _modified_objective_loss
+    # Modify `trainer.reduce_metrics` to gather the metrics of every process.
+    trainer.reduce_metrics = _modified_reduce_metrics
 
 
 def apply(trainer: Trainer):
     # Use previously stored states.
-    global _current_idx
-    global _gpu_devices
+    global _current_rank
+    global _world_size
+    global _gpu_device
 
-    # Convert to the distributed components.
+    # Convert to the distributed components. On CPU, the model is replicated
+    # without device ids.
     trainer.model = DistributedDataParallel(
-        trainer.model, device_ids=[_gpu_devices[_current_idx]])
+        trainer.model,
+        device_ids=[_gpu_device] if _gpu_device is not None else None)
 
     trainer.train_objective.model = trainer.model
     trainer.eval_objective.model = trainer.model
 
-    _modify_objective(trainer.train_objective, len(_gpu_devices))
-    _modify_objective(trainer.eval_objective, len(_gpu_devices))
+    _modify_recordable(trainer, _world_size)
 
-    _modify_dataset(trainer.train_dataset, _current_idx, _gpu_devices)
-    _modify_dataset(trainer.eval_dataset, _current_idx, _gpu_devices)
+    _modify_dataset(trainer.train_dataset, _current_rank, _world_size)
+    _modify_dataset(trainer.eval_dataset, _current_rank, _world_size)
 
     # Modify `trainer.restore` to load training states to the corresponding
     # device memory.
+    map_location = (f'cuda:{_gpu_device}' if _gpu_device is not None
+                    else 'cpu')
     trainer.restore = lambda ckpt, _ = None, _old_restore = trainer.restore: \
-        _old_restore(ckpt, map_location=f'cuda:{_gpu_devices[_current_idx]}')
+        _old_restore(ckpt, map_location=map_location)
 
-    # Prevent saving the training states except for the master gpu process.
-    if _current_idx != 0:
+    # Prevent saving the training states except for the master process.
+    if _current_rank != 0:
         trainer.save = lambda *args, **kwargs: None
         trainer.preserve = lambda *args, **kwargs: None
 
+        if getattr(trainer, 'metrics_log', None) is not None:
+            trainer.metrics_log.write = lambda *args, **kwargs: None
+            trainer.metrics_log.load_state_dict = lambda *args, **kwargs: None
+
+    # Gather the sharded optimizer states to the master process before
+    # preserving the training states. Every process should take part in it.
+    # The consolidated states are in the same format as the unsharded ones,
+    # so they are resharded to the current processes on restore.
+    if isinstance(trainer.optimizer, ZeroRedundancyOptimizer):
+        def _modified_trainer_preserve(*args, **kwargs):
+            trainer.optimizer.consolidate_state_dict(to=0)
+            _old_trainer_preserve(*args, **kwargs)
+
+        _old_trainer_preserve = trainer.preserve
+        trainer.preserve = _modified_trainer_preserve
+
     # Patch to save `trainer.model.module` rather than `trainer.model` because
     # parameters in the model are wrapped with `DistributedDataParallel`
     # module.
-    if _current_idx == 0:
+    if _current_rank == 0:
         def _modified_trainer_save(checkpoint: str):
             # Replace to the original model.
             container = trainer.model
@@ -114,3 +162,125 @@ def apply(trainer: Trainer):
 
         _old_trainer_save = trainer.save
         trainer.save = _modified_trainer_save
+
+
+class _PowerSGDState(object):
+    # Error feedbacks and low-rank factors are preserved for each process,
+    # because the errors of the compression differ by the processes.
+    _STATES = ['iter', 'error_dict', 'p_memory_dict', 'q_memory_dict']
+
+    def __init__(self,
+                 state: powerSGD_hook.PowerSGDState,
+                 device: torch.device):
+        self.state = state
+        self.device = device
+        self.gathered = None
+
+    @staticmethod
+    def _move(states: Dict[str, Any], device: torch.device
+              ) -> Dict[str, Any]:
+        # The errors and the factors are the dictionaries of the tensors of
+        # each gradient bucket.
+        return {k: {i: t.to(device) for i, t in v.items()}
+                if isinstance(v, dict) else v for k, v in states.items()}
+
+    def gather(self):
+        global _current_rank
+        global _world_size
+
+        # Gather the states in host memory, so they are not deserialized to
+        # the devices of the other processes.
+        states = self._move({k: getattr(self.state, k)
+                             for k in self._STATES}, 'cpu')
+        self.gathered = [None] * _world_size if _current_rank == 0 else None
+        dist.gather_object(states, self.gathered, dst=0)
+
+    def state_dict(self) -> Dict[str, Any]:
+        return {'ranks': self.gathered}
+
+    def load_state_dict(self, state_dict: Dict[str, Any]):
+        global _current_rank
+        global _world_size
+
+        # The errors cannot be divided into different number of processes,
+        # so only the iteration is restored and the compression starts over.
+        states = state_dict['ranks']
+        if len(states) != _world_size:
+            states = [{'iter': states[0]['iter']}] * _world_size
+
+        # Move the tensors, which are restored in host memory, to the device
+        # of the model to add them to the gradients.
+        for k, v in self._move(states[_current_rank], self.device).items():
+            setattr(self.state, k, v)
+
+
+def register_comm_hook(trainer: Trainer,
+                       hook: str,
+                       powersgd_rank: int = 1,
+                       powersgd_start: int = 1000):
+    # Compress the gradients before all-reducing them.
+    if hook == 'fp16':
+        trainer.model.register_comm_hook(None,
+                                         default_hooks.fp16_compress_hook)
+    elif hook == 'bf16':
+        trainer.model.register_comm_hook(None,
+                                         default_hooks.bf16_compress_hook)
+    elif hook == 'powersgd':
+        # Approximate the gradient matrices by low-rank factors and add the
+        # errors of the approximation to the next gradients. The gradients
+        # are all-reduced without compression for the first iterations.
+        state = powerSGD_hook.PowerSGDState(
+            process_group=None, matrix_approximation_rank=powersgd_rank,
+            start_powerSGD_iter=powersgd_start, use_error_feedback=True,
+            warm_start=True)
+        trainer.model.register_comm_hook(state, powerSGD_hook.powerSGD_hook)
+
+        # Add `comm_hook` key to the trainer object to make the state of the
+        # hook preservable. Every process should gather its state before
+        # preserving the training states.
+        trainer.comm_hook = _PowerSGDState(
+            state, device=next(trainer.model.parameters()).device)
+
+        def _modified_trainer_preserve(*args, **kwargs):
+            trainer.comm_hook.gather()
+            _old_trainer_preserve(*args, **kwargs)
+
+            # The gathered states are already copied to the snapshot.
+            trainer.comm_hook.gathered = None
+
+        _old_trainer_preserve = trainer.preserve
+        trainer.preserve = _modified_trainer_preserve
+    elif hook != 'none':
+        raise ValueError(f'unknown communication hook: {hook}')
+
+
+def _optimizer_state_bytes(optimizer: optim.Optimizer) -> int:
+    # Count the states of the local optimizer if they are sharded.
+    optimizer = getattr(optimizer, 'optim', optimizer)
+    return sum(v.numel() * v.element_size()
+               for state in optimizer.state.values()
+               for v in state.values() if isinstance(v, torch.Tensor))
+
+
+def report_memory(trainer: Trainer):
+    # Use previously stored states.
+    global _current_rank
+    global _world_size
+
+    params = sum(p.numel() * p.element_size()
+                 for p in trainer.model.parameters())
+    if torch.cuda.is_available() and torch.cuda.is_initialized():
+        peak = torch.cuda.max_memory_allocated()
+    else:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    # Gather the memory usages of the processes to the master one.
+    usages = [None] * _world_size
+    dist.all_gather_object(
+        usages, (params, _optimizer_state_bytes(trainer.optimizer), peak))
+
+    if _current_rank == 0:
+        for rank, (params, states, peak) in enumerate(usages):
+            print(f'[memory] rank {rank}: parameters '
+                  f'{params / 2 ** 20:.1f}MB, optimizer states '
+                  f'{states / 2 ** 20:.1f}MB, peak {peak / 2 ** 20:.1f}MB')
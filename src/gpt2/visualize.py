@@ -1,14 +1,97 @@
+import os
+import time
 import torch
 import argparse
+import numpy as np
 import matplotlib.pyplot as plt
+from .misc.recording import MetricsLog
+from .misc.downsampling import lttb
+from typing import Optional, Dict, Tuple
 
+Metrics = Dict[str, Tuple[np.ndarray, np.ndarray]]
 
-def _visualize_metrics(args: argparse.Namespace):
-    ckpt = torch.load(args.checkpoint)
-    eval_steps, eval_metrics = zip(*ckpt['metrics']['eval/loss'])
-    train_steps, train_metrics = zip(*ckpt['metrics']['train/loss'])
 
-    plt.figure(figsize=(12, 8))
+def _read_metrics(metrics_log: MetricsLog,
+                  offsets: Optional[Dict[str, int]] = None) -> Metrics:
+    return {name: metrics_log.read(name,
+                                   stop=offsets[name] if offsets else None)
+            for name in (offsets or metrics_log.names())}
+
+
+def _load_metrics(checkpoint: str) -> Metrics:
+    # Read the metrics log next to the checkpoint without loading the model.
+    if os.path.isdir(f'{checkpoint}.metrics'):
+        return _read_metrics(MetricsLog(f'{checkpoint}.metrics'))
+
+    # Map the checkpoint file rather than reading the model parameters into
+    # memory if it is supported.
+    try:
+        ckpt = torch.load(checkpoint, map_location='cpu', mmap=True)
+    except (TypeError, RuntimeError):
+        ckpt = torch.load(checkpoint, map_location='cpu')
+
+    # Read the records written until the checkpoint is saved.
+    if 'metrics_log' in ckpt:
+        return _read_metrics(MetricsLog(ckpt['metrics_log']['directory']),
+                             offsets=ckpt['metrics_log']['offsets'])
+
+    # The old checkpoints contain the whole metrics.
+    return {name: tuple(np.array(v) for v in zip(*records))
+            for name, records in ckpt['metrics'].items() if records}
+
+
+def _downsample(metrics: Metrics, points: int) -> Metrics:
+    downsampled = {}
+    for name, (steps, values) in metrics.items():
+        indices = lttb(steps, values, points)
+        downsampled[name] = (steps[indices], values[indices])
+    return downsampled
+
+
+class _MetricsTail(object):
+    def __init__(self, metrics_log: MetricsLog, points: int):
+        self.metrics_log = metrics_log
+        self.points = points
+
+        self.offsets = {}
+        self.metrics = {}
+
+    def update(self) -> bool:
+        # Read the metrics from the start if the log is truncated or
+        # recreated, e.g. by a new training run.
+        names = self.metrics_log.names()
+        updated = any(self.offsets.get(name, 0) > self.metrics_log.size(name)
+                      for name in names)
+        if updated:
+            self.offsets, self.metrics = {}, {}
+
+        for name in names:
+            offset = self.offsets.get(name, 0)
+            steps, values = self.metrics_log.read(name, start=offset)
+            if not len(steps):
+                continue
+
+            self.offsets[name] = offset + len(steps)
+            if name in self.metrics:
+                steps = np.concatenate((self.metrics[name][0], steps))
+                values = np.concatenate((self.metrics[name][1], values))
+
+            # Downsample the kept points with the new ones when they are
+            # doubled, so the kept points are bounded by the target while the
+            # log grows.
+            if len(steps) > 2 * self.points:
+                indices = lttb(steps, values, self.points)
+                steps, values = steps[indices], values[indices]
+
+            self.metrics[name] = (steps, values)
+            updated = True
+
+        return updated
+
+
+def _plot_losses(metrics: Metrics):
+    eval_steps, eval_metrics = metrics['eval/loss']
+    train_steps, train_metrics = metrics['train/loss']
 
     plt.subplot(221)
     plt.plot(eval_steps, eval_metrics, label='evaluation')
@@ -16,7 +99,7 @@ def _visualize_metrics(args: argparse.Namespace):
     plt.title('Cross-Entropy Loss')
     plt.xlabel('Iterations')
     plt.ylabel('Loss')
-    plt.legend(loc='top right')
+    plt.legend(loc='upper right')
 
     plt.subplot(222)
     plt.plot(eval_steps, eval_metrics, label='evaluation')
@@ -25,14 +108,13 @@ def _visualize_metrics(args: argparse.Namespace):
     plt.title('Log-Scale Cross-Entropy Loss')
     plt.xlabel('Iterations (Log Scale)')
     plt.ylabel('Loss')
-    plt.legend(loc='top right')
+    plt.legend(loc='upper right')
 
     target_range_train = len(train_steps) * 9 // 10
     target_range_eval = len(eval_steps) * 9 // 10
-    min_loss = min(train_metrics[-target_range_train:]
-                   + eval_metrics[-target_range_eval:])
-    max_loss = max(train_metrics[-target_range_train:]
-                   + eval_metrics[-target_range_eval:])
+    target_metrics = np.concatenate((train_metrics[-target_range_train:],
+                                     eval_metrics[-target_range_eval:]))
+    min_loss, max_loss = target_metrics.min(), target_metrics.max()
 
     plt.subplot(223)
     plt.plot(eval_steps, eval_metrics, label='evaluation')
@@ -40,7 +122,7 @@ def _visualize_metrics(args: argparse.Namespace):
     plt.title('Loss')
     plt.xlabel('Iterations')
     plt.ylabel('Loss')
-    plt.legend(loc='top right')
+    plt.legend(loc='upper right')
     plt.ylim((min_loss - 0.1, max_loss + 0.1))
 
     target_range_train = len(train_steps) * 3 // 10
@@ -56,13 +138,102 @@ def _visualize_metrics(args: argparse.Namespace):
     plt.title('Loss')
     plt.xlabel('Iterations')
     plt.ylabel('Loss')
-    plt.legend(loc='top right')
+    plt.legend(loc='upper right')
+
+
+def _plot_throughput(metrics: Metrics):
+    plt.subplot(221)
+    for name, label in [('train/tokens_per_sec', 'all tokens'),
+                        ('train/real_tokens_per_sec', 'non-pad tokens')]:
+        plt.plot(*metrics[name], label=label)
+    plt.title('Throughput')
+    plt.xlabel('Iterations')
+    plt.ylabel('Tokens / Second')
+    plt.legend(loc='upper right')
 
-    plt.tight_layout()
+    # The phases are downsampled to the different steps, so they are
+    # interpolated to the steps of the first one to be stacked.
+    plt.subplot(222)
+    phases = ['data', 'forward', 'backward', 'optimizer']
+    steps = metrics['train/data_ms'][0]
+    plt.stackplot(steps,
+                  *[np.interp(steps, *metrics[f'train/{phase}_ms'])
+                    for phase in phases],
+                  labels=phases)
+    plt.title('Step Time')
+    plt.xlabel('Iterations')
+    plt.ylabel('Milliseconds')
+    plt.legend(loc='upper right')
+
+    plt.subplot(223)
+    plt.plot(*metrics['train/peak_memory_mb'])
+    plt.title('Peak Memory')
+    plt.xlabel('Iterations')
+    plt.ylabel('MB')
+
+    plt.subplot(224)
+    if 'train/mfu' in metrics:
+        steps, mfu = metrics['train/mfu']
+        plt.plot(steps, mfu * 100)
+        plt.title('Model FLOPs Utilization')
+        plt.ylabel('%')
+    else:
+        plt.plot(*metrics['train/tflops'])
+        plt.title('Model FLOPs')
+        plt.ylabel('TFLOPS')
+    plt.xlabel('Iterations')
+
+
+def _render(args: argparse.Namespace, metrics: Metrics):
+    # Plot at most the target number of points of each metric, so rendering
+    # takes the same time regardless of the length of training.
+    metrics = _downsample(metrics, args.points)
+
+    figures = [('losses', args.figure, _plot_losses)]
+    if args.throughput_figure and 'train/tokens_per_sec' in metrics:
+        figures.append(('throughput', args.throughput_figure,
+                        _plot_throughput))
+
+    for name, figure, plot in figures:
+        # Reuse the figure to redraw it while following the metrics.
+        plt.figure(name, figsize=(12, 8))
+        plt.clf()
+        plot(metrics)
+        plt.tight_layout()
+
+        if not args.interactive:
+            plt.savefig(figure)
+
+
+def _follow_metrics(args: argparse.Namespace):
+    # Read only the appended records of the metrics log at each refresh.
+    tail = _MetricsTail(MetricsLog(f'{args.checkpoint}.metrics'),
+                        points=args.points)
+    if args.interactive:
+        plt.ion()
+
+    try:
+        while True:
+            if (tail.update() and 'eval/loss' in tail.metrics
+                    and 'train/loss' in tail.metrics):
+                _render(args, tail.metrics)
+
+            if args.interactive:
+                plt.pause(args.interval)
+            else:
+                time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+def _visualize_metrics(args: argparse.Namespace):
+    if args.follow:
+        _follow_metrics(args)
+        return
+
+    _render(args, _load_metrics(args.checkpoint))
     if args.interactive:
         plt.show()
-    else:
-        plt.savefig(args.figure)
 
 
 def add_subparser(subparsers: argparse._SubParsersAction):
@@ -73,7 +244,15 @@ def add_subparser(subparsers: argparse._SubParsersAction):
                         help='figure image file path to save plot')
     parser.add_argument('--checkpoint', required=True,
                         help='checkpoint file path')
+    parser.add_argument('--throughput_figure', default=None,
+                        help='figure image file path to plot throughput')
     parser.add_argument('--interactive', action='store_true',
                         help='show interactive plot window')
+    parser.add_argument('--points', default=2000, type=int,
+                        help='maximum number of plotted points of metrics')
+    parser.add_argument('--follow', action='store_true',
+                        help='redraw the plot as new metrics are written')
+    parser.add_argument('--interval', default=10, type=float,
+                        help='seconds between refreshes in follow mode')
 
     parser.set_defaults(func=_visualize_metrics)
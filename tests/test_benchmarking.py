@@ -0,0 +1,29 @@
+from gpt2.misc.benchmarking import compare
+
+
+def test_compare_flags_regressions_by_direction():
+    baseline = {'model': {'tokens_per_sec': 100.0, 'forward_ms': 10.0},
+                'removed': {'tokens_per_sec': 1.0}}
+    results = {'model': {'tokens_per_sec': 85.0, 'forward_ms': 8.0,
+                         'new_ms': 1.0}}
+
+    # Lower throughput and higher latency are regressions, and the metrics
+    # which are not in the baseline are skipped.
+    assert compare(results, baseline, threshold=0.1) == [
+        ('model/tokens_per_sec', 100.0, 85.0, True),
+        ('model/forward_ms', 10.0, 8.0, False)]
+    assert not any(regressed for *_, regressed
+                   in compare(results, baseline, threshold=0.2))
+
+    results['model']['forward_ms'] = 12.0
+    assert compare(results, baseline, threshold=0.1)[1][-1]
+
+
+def test_compare_handles_zero_baseline():
+    baseline = {'model': {'tokens_per_sec': 0.0, 'forward_ms': 0.0,
+                          'backward_ms': 0.0}}
+    results = {'model': {'tokens_per_sec': 10.0, 'forward_ms': 1.0,
+                         'backward_ms': 0.0}}
+
+    assert [regressed for *_, regressed in compare(results, baseline)] == [
+        False, True, False]
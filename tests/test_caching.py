@@ -0,0 +1,64 @@
+import torch
+from gpt2.misc.caching import PrefixCache
+
+
+def _create_past(words, layers: int = 2, dims: int = 4):
+    # Create fake key-value pairs which store the token indices.
+    x = torch.tensor(words, dtype=torch.float).view(1, -1, 1).expand(-1, -1,
+                                                                       dims)
+    return [(x.clone(), x.clone()) for _ in range(layers)]
+
+
+def test_prefix_cache_finds_the_longest_prefix():
+    cache = PrefixCache(max_bytes=2 ** 20)
+    cache.insert([1, 2, 3, 4], _create_past([1, 2, 3, 4]))
+    cache.insert([1, 5], _create_past([1, 5]))
+
+    # Check if the longest matched prefix is sliced from the cached one.
+    length, past = cache.lookup([1, 2, 3, 7, 8])
+    assert length == 3
+    assert past[0][0].shape == (1, 3, 4)
+    assert (past[0][0][0, :, 0] == torch.tensor([1, 2, 3])).all()
+
+    length, past = cache.lookup([1, 5, 6])
+    assert length == 2
+    assert (past[1][1][0, :, 0] == torch.tensor([1, 5])).all()
+
+    # Test for unmatched words.
+    assert cache.lookup([9, 1, 2]) == (0, None)
+
+    # The prefix of the only first word is not a hit.
+    assert cache.lookup([1, 9]) == (0, None)
+
+    stats = cache.stats()
+    assert stats['hit_rate'] == 2 / 4
+    assert stats['saved_tokens'] == 5
+
+
+def test_prefix_cache_replaces_covered_prefixes():
+    cache = PrefixCache(max_bytes=2 ** 20)
+    cache.insert([1, 2], _create_past([1, 2]))
+    cache.insert([1, 2, 3], _create_past([1, 2, 3]))
+
+    # The shorter prefix is covered by the longer one.
+    assert list(cache.entries) == [(1, 2, 3)]
+
+    # Inserting already covered prefix should not create new entry.
+    cache.insert([1, 2], _create_past([1, 2]))
+    assert list(cache.entries) == [(1, 2, 3)]
+    assert cache.bytes == 2 * 2 * 3 * 4 * 4
+
+
+def test_prefix_cache_evicts_least_recently_used_prefixes():
+    # Each entry of 3 tokens occupies 192 bytes.
+    cache = PrefixCache(max_bytes=400)
+    cache.insert([1, 2, 3], _create_past([1, 2, 3]))
+    cache.insert([4, 5, 6], _create_past([4, 5, 6]))
+
+    # Use the first entry to make the second one least recently used.
+    cache.lookup([1, 2])
+    cache.insert([7, 8, 9], _create_past([7, 8, 9]))
+
+    assert list(cache.entries) == [(1, 2, 3), (7, 8, 9)]
+    assert cache.lookup([4, 5]) == (0, None)
+    assert cache.bytes == 2 * 192
@@ -0,0 +1,142 @@
+import torch
+import torch.optim as optim
+import torch.multiprocessing as mp
+from gpt2.modeling.transformer import Transformer
+from gpt2.misc.objective import LMObjective
+from gpt2.misc.training import Trainer
+from gpt2.utils import distributing
+
+
+class _FakeDataset(object):
+    def __init__(self, data):
+        self.data = data
+
+    def skip(self, count):
+        pass
+
+    def fetch(self, batch=None, device=None):
+        return self.data
+
+    def state_dict(self):
+        return {'data': self.data}
+
+
+def _create_trainer(optimizer_fn) -> Trainer:
+    torch.manual_seed(0)
+    model = Transformer(layers=2, pad_idx=0, words=50, seq_len=10, heads=2,
+                        dims=16, rate=4, dropout=0, bidirectional=False)
+    data = {'input': torch.randint(1, 50, (4, 9)),
+            'output': torch.randint(1, 50, (4, 9))}
+
+    optimizer = optimizer_fn(model.parameters())
+    scheduler = optim.lr_scheduler.LambdaLR(optimizer, lambda step: 1)
+    objective = LMObjective(model, pad_idx=0)
+
+    return Trainer(model, optimizer, scheduler, _FakeDataset(data),
+                   _FakeDataset(data), train_objective=objective,
+                   eval_objective=objective)
+
+
+def _sharded_worker(rank: int, init_method: str, checkpoint: str):
+    distributing.initialize(rank, 2, backend='gloo', init_method=init_method)
+
+    trainer = _create_trainer(lambda params: distributing.shard_optimizer(
+        params, optim.AdamW, lr=1e-2))
+    distributing.apply(trainer)
+
+    # Each process should keep the states of its own parameters only.
+    local_states = len(trainer.optimizer.optim.state)
+    for _ in range(3):
+        trainer.train(batch=2)
+    assert 0 < len(trainer.optimizer.optim.state) - local_states < 32
+
+    trainer.preserve(checkpoint)
+    trainer.wait()
+
+
+def test_sharded_optimizer_is_same_as_unsharded_one(tmp_path):
+    checkpoint = str(tmp_path / 'ckpt')
+    init_method = f'file://{tmp_path / "rendezvous"}'
+    mp.spawn(_sharded_worker, args=(init_method, checkpoint), nprocs=2)
+
+    # Every process trains the same batch, so the update should be same as
+    # the one of the single process.
+    trainer = _create_trainer(lambda params: optim.AdamW(params, lr=1e-2))
+    for _ in range(3):
+        trainer.train()
+
+    ckpt = torch.load(checkpoint)
+    # The model is preserved with its distributed wrapper.
+    for name, param in trainer.model.state_dict().items():
+        assert torch.allclose(ckpt['model'][f'module.{name}'], param,
+                              atol=1e-6)
+
+    # The consolidated states should be restored to the unsharded optimizer.
+    states = trainer.optimizer.state_dict()['state']
+    assert ckpt['optimizer']['state'].keys() == states.keys()
+    for idx, state in states.items():
+        assert torch.allclose(ckpt['optimizer']['state'][idx]['exp_avg'],
+                              state['exp_avg'], atol=1e-6)
+
+    trainer.optimizer.load_state_dict(ckpt['optimizer'])
+
+
+def _powersgd_worker(rank: int, init_method: str, checkpoint: str):
+    distributing.initialize(rank, 2, backend='gloo', init_method=init_method)
+
+    trainers = []
+    for _ in range(2):
+        trainer = _create_trainer(lambda params: optim.AdamW(params))
+        distributing.apply(trainer)
+        distributing.register_comm_hook(trainer, 'powersgd',
+                                        powersgd_start=2)
+        trainers.append(trainer)
+
+    # Train with different batches in each process, so the errors of the
+    # compression differ by the processes.
+    torch.manual_seed(rank)
+    trainers[0].train_dataset.data['output'].random_(1, 50)
+    for _ in range(4):
+        trainers[0].train(batch=2)
+
+    trainers[0].preserve(checkpoint)
+    trainers[0].wait()
+    torch.distributed.barrier()
+
+    # Each process should restore its own errors of the compression.
+    trainers[1].restore(checkpoint)
+
+    saved, restored = trainers[0].comm_hook.state, trainers[1].comm_hook.state
+    assert saved.error_dict and restored.iter == saved.iter
+    assert saved.error_dict.keys() == restored.error_dict.keys()
+    for idx, error in saved.error_dict.items():
+        assert torch.equal(restored.error_dict[idx], error)
+
+
+def test_powersgd_hook_state_is_preserved_for_each_process(tmp_path):
+    checkpoint = str(tmp_path / 'ckpt')
+    init_method = f'file://{tmp_path / "rendezvous"}'
+    mp.spawn(_powersgd_worker, args=(init_method, checkpoint), nprocs=2)
+
+    ckpt = torch.load(checkpoint)
+    assert len(ckpt['comm_hook']['ranks']) == 2
+
+
+def test_powersgd_hook_state_is_restored_to_model_device(monkeypatch):
+    monkeypatch.setattr(distributing, '_current_rank', 0, raising=False)
+    monkeypatch.setattr(distributing, '_world_size', 1, raising=False)
+
+    class _FakeState(object):
+        pass
+
+    # The tensors of the checkpoint are restored in host memory, and should
+    # be moved to the device of the model.
+    comm_hook = distributing._PowerSGDState(_FakeState(), device='meta')
+    comm_hook.load_state_dict({'ranks': [{
+        'iter': 3, 'error_dict': {0: torch.zeros(4)},
+        'p_memory_dict': {0: torch.zeros(2, 1)},
+        'q_memory_dict': {0: torch.zeros(2, 1)}}]})
+
+    assert comm_hook.state.iter == 3
+    for name in ['error_dict', 'p_memory_dict', 'q_memory_dict']:
+        assert getattr(comm_hook.state, name)[0].device.type == 'meta'
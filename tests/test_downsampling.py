@@ -0,0 +1,31 @@
+import numpy as np
+from gpt2.misc.downsampling import lttb
+
+
+def test_lttb_keeps_short_series():
+    x = np.arange(10)
+    assert (lttb(x, np.sin(x), 20) == x).all()
+
+
+def test_lttb_preserves_shape_of_series():
+    x = np.arange(100000)
+    y = np.sin(x / 5000)
+    y[31234] = 10
+
+    indices = lttb(x, y, 500)
+    assert len(indices) <= 500
+    assert indices[0] == 0 and indices[-1] == len(x) - 1
+    assert (np.diff(indices) > 0).all()
+
+    # The spike and the extrema should be selected.
+    assert 31234 in indices
+    assert abs(y[indices].min() + 1) < 1e-3
+    assert abs(y[indices][y[indices] < 10].max() - 1) < 1e-3
+
+
+def test_lttb_downsamples_by_range_of_steps():
+    # The dense points at the end should not take more buckets than the
+    # sparse points at the beginning.
+    x = np.concatenate((np.arange(0, 1000, 10), np.arange(1000, 2000)))
+    indices = lttb(x, np.cos(x / 100), 100)
+    assert abs((x[indices] < 1000).sum() - (x[indices] >= 1000).sum()) <= 2
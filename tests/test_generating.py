@@ -0,0 +1,227 @@
+import torch
+from unittest import mock
+from gpt2.data.vocabulary import Vocab
+from gpt2.data.tokenization import Tokenizer
+from gpt2.modeling.transformer import Transformer
+from gpt2.misc.generating import (Generator, BeamSearchGenerator,
+                                  SpeculativeGenerator)
+from gpt2.misc.sampling import Sampler
+from gpt2.misc.caching import PrefixCache
+
+
+_fake_vocab = '<unk>\nhello\nworld\n##s\n.'
+
+
+def _create_generator(seq_len: int = 16) -> Generator:
+    with mock.patch('builtins.open') as mock_open:
+        file_mock = mock_open.return_value.__enter__.return_value
+        file_mock.read.return_value = _fake_vocab
+        vocab = Vocab('')
+
+    tokenizer = Tokenizer(vocab, special_tokens=['<unk>'])
+    model = Transformer(layers=2, pad_idx=vocab.pad_idx, words=len(vocab),
+                        seq_len=seq_len, heads=2, dims=16, rate=4, dropout=0,
+                        bidirectional=False).eval()
+
+    return Generator(vocab, tokenizer, model, seq_len=seq_len, topk=4)
+
+
+def test_generator_samples_candidates_in_batch():
+    generator = _create_generator()
+    words = generator._encode_context('hello world')
+
+    # Check if every candidate is generated within the maximum length.
+    sequences, mean_log_probs = generator._sample(words, samples=8)
+    assert len(sequences) == 8
+    assert len(mean_log_probs) == 8
+
+    for sequence, mean_log_prob in zip(sequences, mean_log_probs):
+        assert 0 < len(sequence) <= 16 - len(words)
+        assert mean_log_prob <= 0
+
+        # Finished candidates should not generate tokens after end-of-sentence
+        # token.
+        if generator.vocab.eos_idx in sequence:
+            assert sequence.index(generator.vocab.eos_idx) == len(sequence) - 1
+
+
+def test_generator_chooses_the_best_candidate():
+    generator = _create_generator()
+
+    torch.manual_seed(0)
+    words = generator._encode_context('hello')
+    _, mean_log_probs = generator._sample(words, samples=8)
+
+    # Test if the candidate with the highest score is chosen.
+    torch.manual_seed(0)
+    _, log_prob = generator.generate('hello', samples=8)
+    assert log_prob == max(mean_log_probs)
+
+
+def test_generator_resumes_from_cached_prefix():
+    generator = _create_generator()
+    words = generator._encode_context('hello world hello')
+    expected, _ = generator._prefill(words)
+
+    # Check if the prediction from the cached prefix is same as the original.
+    generator.cache = PrefixCache(max_bytes=2 ** 20)
+    generator._prefill(words[:3])
+
+    logits, past = generator._prefill(words)
+    assert torch.allclose(logits, expected, atol=1e-5)
+    assert past[0][0].shape == (1, len(words), 16)
+    assert generator.cache.stats()['saved_tokens'] == 3
+
+
+def test_beam_search_generator_returns_nbest_hypotheses():
+    generator = _create_generator()
+    generator = BeamSearchGenerator(generator.vocab, generator.tokenizer,
+                                    generator.model, seq_len=16, beam_size=4)
+    words = generator._encode_context('hello world')
+
+    # Check if the hypotheses are sorted by their normalized scores.
+    hypotheses = generator._search(words)
+    assert 0 < len(hypotheses) <= 4
+
+    scores = [score for _, score in hypotheses]
+    assert scores == sorted(scores, reverse=True)
+
+    for sequence, _ in hypotheses:
+        assert 0 < len(sequence) <= 16 - len(words)
+
+    # Test if the best hypothesis is chosen.
+    nbest = generator.generate_nbest('hello world', nbest=2)
+    assert len(nbest) == min(2, len(hypotheses))
+    assert generator.generate('hello world') == nbest[0]
+
+
+def test_beam_search_with_single_beam_is_greedy():
+    torch.manual_seed(0)
+    generator = _create_generator()
+    beam_search = BeamSearchGenerator(generator.vocab, generator.tokenizer,
+                                      generator.model, seq_len=16,
+                                      beam_size=1)
+    generator.sampler = Sampler(greedy=True)
+
+    # Beam search with a single beam should follow the greedy path.
+    words = generator._encode_context('hello')
+    sequences, _ = generator._sample(words, samples=1)
+    assert beam_search._search(words)[0][0] == sequences[0]
+
+
+def test_speculative_generator_follows_target_model_greedily():
+    generator = _create_generator()
+    generator.sampler = Sampler(greedy=True)
+
+    draft = Transformer(layers=1, pad_idx=generator.vocab.pad_idx,
+                        words=len(generator.vocab), seq_len=16, heads=2,
+                        dims=8, rate=4, dropout=0, bidirectional=False).eval()
+    speculative = SpeculativeGenerator(
+        generator.vocab, generator.tokenizer, generator.model, draft,
+        seq_len=16, draft_tokens=3, sampler=Sampler(greedy=True))
+
+    # Greedy speculative decoding should generate the same words as the
+    # target model.
+    words = generator._encode_context('hello world')
+    sequences, _ = generator._sample(words, samples=1)
+    sequence, _ = speculative._speculate(words)
+    assert sequence == sequences[0]
+    assert speculative.stats['target_calls'] <= len(sequence)
+
+
+def test_speculative_generator_applies_penalties_of_target_sampler():
+    generator = _create_generator(seq_len=32)
+    sampler = Sampler(greedy=True, repetition_penalty=4.0,
+                      presence_penalty=2.0)
+    generator.sampler = sampler
+
+    draft = Transformer(layers=1, pad_idx=generator.vocab.pad_idx,
+                        words=len(generator.vocab), seq_len=32, heads=2,
+                        dims=8, rate=4, dropout=0, bidirectional=False).eval()
+    speculative = SpeculativeGenerator(
+        generator.vocab, generator.tokenizer, generator.model, draft,
+        seq_len=32, draft_tokens=3, sampler=sampler)
+
+    # The penalized greedy decoding should generate the same words as the
+    # target model with the same penalties.
+    words = generator._encode_context('hello world')
+    sequences, _ = generator._sample(words, samples=1)
+    sequence, _ = speculative._speculate(words)
+    assert sequence == sequences[0]
+
+
+def test_speculative_generator_accepts_proposals_from_same_model():
+    generator = _create_generator()
+    speculative = SpeculativeGenerator(
+        generator.vocab, generator.tokenizer, generator.model,
+        generator.model, seq_len=16, draft_tokens=4)
+
+    # Every proposal should be accepted if the draft is the target model.
+    sequence, mean_log_prob = speculative._speculate(
+        generator._encode_context('hello'), seed=0)
+    assert 0 < len(sequence) <= 15
+    assert mean_log_prob <= 0
+    assert speculative.stats['accepted'] == speculative.stats['proposed']
+
+
+def test_generator_streams_same_words_as_sampling():
+    generator = _create_generator()
+    words = generator._encode_context('hello world')
+    sequences, _ = generator._sample(words, samples=1, seed=0)
+
+    # Check if the streamed words and fragments compose the sampled sentence.
+    streamed = list(generator.stream('hello world', seed=0))
+    assert [word for word, _ in streamed] == sequences[0]
+    assert (generator._decode_words(words)
+            + ''.join(fragment for _, fragment in streamed)
+            == generator._decode_words(words + sequences[0]))
+
+
+def test_generator_prunes_hopeless_candidates():
+    generator = _create_generator()
+    words = generator._encode_context('hello world')
+    sequences, mean_log_probs = generator._sample(words, samples=8, seed=0)
+
+    # Every candidate except the best one is abandoned without any margin.
+    generator.prune_margin = 0
+    pruned, pruned_log_probs = generator._sample(words, samples=8, seed=0)
+
+    assert generator.stats['pruned'] > 0
+    for sequence, full in zip(pruned, sequences):
+        assert sequence == full[:len(sequence)]
+
+    # Abandoned candidates should never be chosen.
+    best = max(range(8), key=lambda i: pruned_log_probs[i])
+    assert pruned_log_probs[best] > float('-inf')
+    assert pruned[best] == sequences[best]
+
+
+def test_generator_samples_left_padded_batch():
+    generator = _create_generator()
+    contexts = [generator._encode_context(context)
+                for context in ['hello', 'hello world hello', 'worlds .']]
+
+    # Prevent the model from predicting padding tokens which are masked only
+    # in the unpadded inputs.
+    def _suppress_padding(module, inputs, outputs):
+        outputs[0][..., generator.vocab.pad_idx] = -1e4
+
+    generator.model.register_forward_hook(_suppress_padding)
+
+    # Check if each context in the batch is generated as it is alone.
+    sequences, mean_log_probs = generator._sample_batch(contexts,
+                                                        seeds=[0, 1, 2])
+    for i, words in enumerate(contexts):
+        expected, expected_log_probs = generator._sample(words, 1, seed=i)
+        assert sequences[i] == expected[0]
+        assert abs(mean_log_probs[i] - expected_log_probs[0]) < 1e-4
+
+
+def test_generator_generates_batch_of_encoded_contexts():
+    generator = _create_generator()
+    contexts = ['hello', 'hello world hello']
+
+    # The encoded contexts should be generated same as the sentences.
+    encoded = [generator._encode_context(context) for context in contexts]
+    assert (generator.generate_batch(encoded, seeds=[0, 1])
+            == generator.generate_batch(contexts, seeds=[0, 1]))
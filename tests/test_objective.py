@@ -1,4 +1,6 @@
-from gpt2.misc.objective import LMObjective
+import os
+from gpt2.misc.objective import LMObjective, DistillationObjective
+from gpt2.modeling.transformer import Transformer
 import torch
 import torch.nn as nn
 from typing import Tuple
@@ -16,3 +18,62 @@ def test_lm_objective_throws_errors():
 
     # Test if the objective throws any error.
     objective.loss(torch.zeros((10, 7, 100)), torch.randint(0, 100, (10, 7)))
+
+
+def test_distillation_objective_throws_errors():
+    # Create dummy DistillationObjective with full teacher logits.
+    objective = DistillationObjective(_dummy_model(), _dummy_model(),
+                                      pad_idx=0)
+
+    # Test if the objective throws any error.
+    objective.loss(torch.zeros((10, 7, 100)), torch.randint(0, 100, (10, 7)))
+
+
+def test_distillation_objective_matches_same_teacher(tmp_path):
+    # Create dummy DistillationObjective which caches top-k teacher logits.
+    objective = DistillationObjective(_dummy_model(), _dummy_model(),
+                                      pad_idx=0, alpha=1, topk=100,
+                                      cache_dir=str(tmp_path))
+
+    # The divergence between identical distributions should be zero.
+    inputs = torch.randn((10, 7, 100))
+    outputs = torch.randint(0, 100, (10, 7))
+    assert objective.loss(inputs, outputs).abs() < 1e-4
+
+    # Check if the cached teacher logits are reused.
+    cache_dir = tmp_path / os.listdir(tmp_path)[0]
+    assert len(list(cache_dir.iterdir())) == 1
+    assert objective.loss(inputs, outputs).abs() < 1e-2
+    assert len(list(cache_dir.iterdir())) == 1
+
+
+def test_distillation_objective_separates_caches_of_teachers(tmp_path):
+    def _create_objective(seed: int, topk: int) -> DistillationObjective:
+        torch.manual_seed(seed)
+        teacher = Transformer(layers=1, pad_idx=0, words=80, seq_len=16,
+                              heads=2, dims=16, rate=4, dropout=0,
+                              bidirectional=False)
+        return DistillationObjective(_dummy_model(), teacher, pad_idx=0,
+                                     topk=topk, cache_dir=str(tmp_path))
+
+    # The teachers with different weights or top-k should not share the
+    # cached logits, while the same teacher should.
+    cache_dirs = [_create_objective(seed, topk).cache_dir
+                  for seed, topk in [(0, 8), (1, 8), (0, 4), (0, 8)]]
+    assert len(set(cache_dirs[:3])) == 3
+    assert cache_dirs[0] == cache_dirs[3]
+
+
+def test_varlen_lm_objective_matches_padded_one():
+    # Create transformer model which is shared by the objectives.
+    model = Transformer(layers=2, pad_idx=0, words=80, seq_len=16, heads=2,
+                        dims=16, rate=4, dropout=0, bidirectional=False)
+
+    inputs = torch.randint(1, 80, (3, 10), dtype=torch.long)
+    inputs[1, 6:], inputs[2, 3:] = 0, 0
+    outputs = torch.cat((inputs[:, 1:], torch.zeros((3, 1)).long()), dim=1)
+
+    # Test if the variable-length mode calculates the same loss.
+    padded = LMObjective(model, pad_idx=0).loss(inputs, outputs)
+    packed = LMObjective(model, pad_idx=0, varlen=True).loss(inputs, outputs)
+    assert torch.allclose(padded, packed, atol=1e-5)
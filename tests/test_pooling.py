@@ -0,0 +1,50 @@
+import pytest
+from .test_generating import _create_generator
+from gpt2.misc.pooling import GeneratorPool
+
+
+def test_generator_pool_generates_same_sentences_as_generator():
+    generator = _create_generator()
+    batches = [(['hello', 'hello world'], [0, 1]),
+               (['world .'], [2]),
+               (['hello worlds', 'world', 'hello'], [3, 4, 5])]
+    expected = [generator.generate_batch(contexts, seeds)
+                for contexts, seeds in batches]
+    generated = generator.stats['generated_words']
+
+    # Check if the workers generate the batches in input order.
+    pool = GeneratorPool(generator, workers=2, threads=1)
+    assert pool.generate_batches(batches) == expected
+    assert generator.stats['generated_words'] == 2 * generated
+    pool.close()
+
+
+def test_generator_pool_raises_errors_of_workers():
+    generator = _create_generator()
+
+    def _modified_generate_batch(contexts, seeds=None):
+        if 'error' in contexts:
+            raise ValueError('invalid context.')
+        return _old_generate_batch(contexts, seeds)
+
+    _old_generate_batch = generator.generate_batch
+    generator.generate_batch = _modified_generate_batch
+
+    # The error in the worker should be raised in the parent process, and
+    # the workers should keep generating the next batches.
+    pool = GeneratorPool(generator, workers=2, threads=1)
+    with pytest.raises(ValueError):
+        pool.generate_batches([(['hello'], [0]), (['error'], [1])])
+
+    assert len(pool.generate_batches([(['hello'], [0])])) == 1
+    pool.close()
+
+
+def test_generator_pool_detects_dead_workers():
+    generator = _create_generator()
+    pool = GeneratorPool(generator, workers=1, threads=1)
+
+    pool.workers[0].kill()
+    pool.workers[0].join()
+    with pytest.raises(RuntimeError, match='exited unexpectedly'):
+        pool.generate_batches([(['hello'], [0])])
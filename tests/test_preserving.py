@@ -0,0 +1,76 @@
+import pytest
+import os
+import torch
+from gpt2.misc.preserving import Preservable
+
+
+class _dummy_preservable(Preservable):
+    def __init__(self):
+        self.iters = 0
+        self.weight = torch.zeros(4)
+        self._cache = torch.ones(4)
+
+
+def test_preservable_writes_snapshot_of_states(tmp_path):
+    checkpoint = str(tmp_path / 'ckpt')
+    obj = _dummy_preservable()
+
+    # Modify the states while the checkpoint is being written.
+    obj.preserve(checkpoint)
+    obj.weight += 1
+    obj.iters += 1
+    obj.wait()
+
+    ckpt = torch.load(checkpoint)
+    assert ckpt['iters'] == 0
+    assert (ckpt['weight'] == 0).all()
+
+    # Private attributes should not be preserved.
+    assert '_cache' not in ckpt
+    assert not any(k.startswith('_') for k in ckpt)
+    assert not os.path.exists(checkpoint + '.tmp')
+
+
+def test_preservable_keeps_last_checkpoints(tmp_path):
+    checkpoint = str(tmp_path / 'ckpt')
+    obj = _dummy_preservable()
+
+    for obj.iters in range(4):
+        obj.preserve(checkpoint, keep=3)
+    obj.wait()
+
+    # Check if the last three checkpoints are kept in order.
+    assert sorted(os.listdir(tmp_path)) == ['ckpt', 'ckpt.1', 'ckpt.2']
+    assert torch.load(checkpoint)['iters'] == 3
+    assert torch.load(checkpoint + '.2')['iters'] == 1
+    assert len(obj._preserve_stalls) == 4
+
+    # Restore the states from the older checkpoint.
+    obj.restore(checkpoint + '.1')
+    assert obj.iters == 2
+
+
+def test_preservable_keeps_checkpoint_while_rotating(tmp_path, monkeypatch):
+    checkpoint = str(tmp_path / 'ckpt')
+    obj = _dummy_preservable()
+    obj.iters = 0
+    obj.preserve(checkpoint, keep=2)
+    obj.wait()
+
+    # Emulate the crash before the new checkpoint replaces the current one.
+    def _modified_replace(src, dst):
+        if dst == checkpoint:
+            raise OSError('crashed')
+        _old_replace(src, dst)
+
+    _old_replace = os.replace
+    monkeypatch.setattr(os, 'replace', _modified_replace)
+
+    obj.iters = 1
+    obj.preserve(checkpoint, keep=2)
+    with pytest.raises(OSError):
+        obj.wait()
+
+    # The checkpoint path should still have the previous checkpoint.
+    assert torch.load(checkpoint)['iters'] == 0
+    assert torch.load(checkpoint + '.1')['iters'] == 0
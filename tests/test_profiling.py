@@ -0,0 +1,58 @@
+import json
+import torch
+import torch.optim as optim
+from gpt2.modeling.transformer import Transformer
+from gpt2.misc.objective import LMObjective
+from gpt2.misc.training import Trainer
+from gpt2.misc import profiling
+
+
+class _FakeDataset(object):
+    def __init__(self, data):
+        self.data = data
+
+    def fetch(self, batch=None, device=None):
+        return self.data
+
+
+def test_profiler_records_modules_in_window(tmp_path):
+    model = Transformer(layers=2, pad_idx=0, words=50, seq_len=10, heads=2,
+                        dims=16, rate=4, dropout=0, bidirectional=False)
+    data = {'input': torch.randint(1, 50, (2, 9)),
+            'output': torch.randint(1, 50, (2, 9))}
+
+    optimizer = optim.SGD(model.parameters(), lr=0.1)
+    scheduler = optim.lr_scheduler.LambdaLR(optimizer, lambda step: 1)
+    objective = LMObjective(model, pad_idx=0)
+    trainer = Trainer(model, optimizer, scheduler, _FakeDataset(data),
+                      _FakeDataset(data), train_objective=objective,
+                      eval_objective=objective)
+
+    trace_path = str(tmp_path / 'trace.json')
+    profiler = profiling.Profiler(model, start=1, steps=2,
+                                  trace_path=trace_path)
+    profiling.apply(trainer, profiler)
+
+    # The hooks should be installed only in the profiling window.
+    for _ in range(4):
+        trainer.train()
+        trainer.evaluate()
+        if profiler.step_idx in (1, 2):
+            assert profiler.handles
+        else:
+            assert not profiler.handles
+
+    calls = {(row['name'], row['phase']): row['calls']
+             for row in profiler.aggregate()}
+    for name in ['transformers.0', 'transformers.1.attn',
+                 'transformers.1.ff', 'token_embedding (projection)']:
+        assert calls[(name, 'forward')] == 2
+        assert calls[(name, 'backward')] == 2
+    for name in ['train', 'data', 'forward', 'backward', 'optimizer']:
+        assert calls[(name, 'step')] == 2
+
+    # The trace should be exported after the window.
+    with open(trace_path, 'r') as fp:
+        trace = json.load(fp)['traceEvents']
+    assert len(trace) == len(profiler.events)
+    assert all(event['ph'] == 'X' and event['dur'] >= 0 for event in trace)
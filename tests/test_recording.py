@@ -1,4 +1,5 @@
-from gpt2.misc.recording import Recordable, records
+import torch
+from gpt2.misc.recording import Recordable, MetricsLog, records
 
 
 class _dummy_recordable(Recordable):
@@ -46,3 +47,76 @@ def test_recorder_formats_string_well():
     # Check if formatted string is correct.
     obj.stamp(1)
     assert obj.format('{train_loss:.0f}/{eval_loss:.0f}') == '4/10'
+
+
+def test_recorder_records_tensor_metrics_well():
+    # Create dummy recordable object.
+    obj = _dummy_recordable()
+
+    # Record tensor metrics which require gradients, with python numbers.
+    loss = torch.tensor(2.0, requires_grad=True)
+    obj.train(loss * 1)
+    obj.train(loss * 2)
+    obj.train(6)
+    obj.evaluate(torch.tensor(10.0))
+
+    # Check if the tensor metrics are detached and averaged in `stamp`.
+    assert not obj.batch_metrics['train/loss'][0].requires_grad
+
+    obj.stamp(1)
+    assert obj.metrics == {'train/loss': [(1, 4)], 'eval/loss': [(1, 10)]}
+    assert isinstance(obj.metrics['train/loss'][0][1], float)
+
+
+def test_recorder_evaluates_callable_metrics_in_stamp():
+    # Create dummy recordable object.
+    obj = _dummy_recordable()
+
+    # Record deferred metrics which are evaluated only when stamping.
+    calls = []
+    obj.train(lambda: calls.append(1) or 2.0)
+    obj.train(4)
+    assert not calls
+
+    obj.stamp(1)
+    assert calls == [1]
+    assert obj.metrics == {'train/loss': [(1, 3)]}
+
+
+def test_recorder_writes_metrics_to_log(tmp_path):
+    obj = _dummy_recordable()
+    obj.metrics_log = MetricsLog(str(tmp_path / 'ckpt.metrics'))
+
+    for step in range(5):
+        obj.train(step)
+        obj.stamp(step)
+    obj.evaluate(10)
+    obj.stamp(4)
+
+    # Only the last metrics should be kept in memory.
+    assert obj.metrics == {'train/loss': [(4, 4)], 'eval/loss': [(4, 10)]}
+
+    steps, values = obj.metrics_log.read('train/loss')
+    assert steps.tolist() == [0, 1, 2, 3, 4]
+    assert values.tolist() == [0, 1, 2, 3, 4]
+    steps, values = obj.metrics_log.read('train/loss', start=3)
+    assert steps.tolist() == [3, 4]
+
+    # The log should be truncated to the state of the checkpoint.
+    state_dict = obj.metrics_log.state_dict()
+    assert state_dict['offsets'] == {'eval/loss': 1, 'train/loss': 5}
+
+    obj.train(5)
+    obj.stamp(5)
+    obj.metrics_log.load_state_dict(state_dict)
+    assert obj.metrics_log.read('train/loss')[0].tolist() == [0, 1, 2, 3, 4]
+
+    # The log of other directory should be copied to the current one.
+    other = MetricsLog(str(tmp_path / 'other.metrics'))
+    other.load_state_dict(state_dict)
+    assert other.names() == ['eval/loss', 'train/loss']
+    assert other.read('eval/loss')[1].tolist() == [10]
+
+    # The empty offsets should remove every record of the previous run.
+    other.load_state_dict({'directory': other.directory, 'offsets': {}})
+    assert len(other.read('train/loss')[0]) == 0
@@ -0,0 +1,59 @@
+import torch
+from gpt2.misc.sampling import Sampler
+
+
+def test_sampler_samples_from_top_candidates():
+    sampler = Sampler(temp=1, topk=2)
+
+    # Check if the sampled words are in top-k candidates.
+    logits = torch.tensor([[0, 5, 4, 1, 0], [3, 0, 0, 0, 2.9]])
+    for _ in range(10):
+        preds, log_probs = sampler(logits)
+        assert preds[0] in (1, 2)
+        assert preds[1] in (0, 4)
+
+    # The log-probabilities are calculated over the whole vocabulary.
+    expected = logits.log_softmax(-1).gather(-1, preds.unsqueeze(-1))
+    assert torch.allclose(log_probs, expected.squeeze(-1))
+
+
+def test_sampler_chooses_the_most_probable_word_greedily():
+    sampler = Sampler(temp=1, topk=None, greedy=True)
+
+    logits = torch.randn((8, 100))
+    preds, _ = sampler(logits)
+    assert (preds == logits.argmax(-1)).all()
+
+
+def test_sampler_removes_candidates_outside_of_nucleus():
+    sampler = Sampler(temp=1, topk=None, topp=0.5)
+
+    # Only the most probable word is in the nucleus.
+    logits = torch.tensor([[0, 0, 3, 0, 0]]).float()
+    for _ in range(10):
+        preds, _ = sampler(logits)
+        assert preds[0] == 2
+
+
+def test_sampler_penalizes_generated_words():
+    sampler = Sampler(temp=1, topk=None, greedy=True,
+                      repetition_penalty=2, presence_penalty=1)
+
+    # Appeared words should be penalized.
+    logits = torch.tensor([[4, 3, 0, 0], [4, 3, 0, 0]]).float()
+    history = torch.tensor([[0, 0], [3, 3]])
+
+    preds, _ = sampler(logits, history)
+    assert (preds == torch.tensor([1, 0])).all()
+
+
+def test_sampler_reproduces_with_generators():
+    sampler = Sampler(temp=1, topk=None)
+    logits = torch.zeros((4, 1000))
+
+    # Each row should depend on its own generator only.
+    preds_1, _ = sampler(logits, generators=[
+        torch.Generator().manual_seed(i) for i in range(4)])
+    preds_2, _ = sampler(logits[1:], generators=[
+        torch.Generator().manual_seed(i) for i in range(1, 4)])
+    assert (preds_1[1:] == preds_2).all()
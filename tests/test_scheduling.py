@@ -0,0 +1,106 @@
+import torch
+from unittest import mock
+from gpt2.data.vocabulary import Vocab
+from gpt2.modeling.transformer import Transformer
+from gpt2.misc.sampling import Sampler
+from gpt2.misc.scheduling import Scheduler, Request
+
+
+def _create_scheduler(max_batch: int = 4, max_waiting: int = 8
+                      ) -> Scheduler:
+    with mock.patch('builtins.open') as mock_open:
+        file_mock = mock_open.return_value.__enter__.return_value
+        file_mock.read.return_value = '<unk>\nhello\nworld\n##s\n.'
+        vocab = Vocab('')
+
+    model = Transformer(layers=2, pad_idx=vocab.pad_idx, words=len(vocab),
+                        seq_len=16, heads=2, dims=16, rate=4, dropout=0,
+                        bidirectional=False).eval()
+
+    return Scheduler(model, vocab, seq_len=16, max_batch=max_batch,
+                     max_waiting=max_waiting)
+
+
+def _generate_greedily(scheduler: Scheduler, words, max_words: int):
+    # Generate words one by one without batching.
+    generated = []
+    with torch.no_grad():
+        for _ in range(max_words):
+            # The scheduler masks only the left padding, so the generated
+            # padding tokens are not masked either.
+            x = torch.tensor([words + generated])
+            padding = torch.zeros_like(x, dtype=torch.bool)
+            logits = scheduler.model(x, padding=padding)[0]
+            pred = logits[0, -1].argmax().item()
+            generated.append(pred)
+
+            if (pred == scheduler.vocab.eos_idx
+                    or len(words) + len(generated) >= scheduler.seq_len):
+                break
+    return generated
+
+
+def test_scheduler_generates_requests_in_continuous_batch():
+    scheduler = _create_scheduler(max_batch=2)
+    bos = scheduler.vocab.bos_idx
+
+    finished = []
+    requests = [Request([bos, 4, 5, 6, 4], Sampler(greedy=True), 8,
+                        callback=finished.append),
+                Request([bos, 7], Sampler(greedy=True), 10,
+                        callback=finished.append),
+                Request([bos, 5, 5], Sampler(greedy=True), 3,
+                        callback=finished.append)]
+
+    for request in requests:
+        assert scheduler.submit(request)
+
+    # The batch should not exceed its maximum size.
+    while scheduler.step():
+        assert len(scheduler.running) <= 2
+
+    # Check if the requests are generated as same as unbatched decoding.
+    assert len(finished) == 3
+    for request in requests:
+        assert request.generated == _generate_greedily(
+            scheduler, request.words, request.max_words)
+
+
+def test_scheduler_rejects_requests_when_queue_is_full():
+    scheduler = _create_scheduler(max_waiting=2)
+    bos = scheduler.vocab.bos_idx
+
+    assert scheduler.submit(Request([bos], Sampler(), 4))
+    assert scheduler.submit(Request([bos], Sampler(), 4))
+    assert not scheduler.submit(Request([bos], Sampler(), 4))
+    assert scheduler.state()['rejected'] == 1
+
+    # Cancelled requests should be finished without generating words.
+    scheduler.waiting[0].cancel()
+    scheduler.step()
+    assert scheduler.state()['admitted'] == 1
+    assert scheduler.state()['waiting'] == 0
+
+
+def test_scheduler_fails_only_requests_with_invalid_sampler():
+    scheduler = _create_scheduler(max_batch=4)
+    bos = scheduler.vocab.bos_idx
+
+    finished = []
+    valid = Request([bos, 4], Sampler(greedy=True), 4,
+                    callback=finished.append)
+    invalid = Request([bos, 5], Sampler(temp='hot'), 4,
+                      callback=finished.append)
+    assert scheduler.submit(valid)
+    assert scheduler.submit(invalid)
+
+    while scheduler.step():
+        pass
+
+    # The invalid request should be finished with its error while the other
+    # one is generated.
+    assert isinstance(invalid.error, TypeError)
+    assert valid.error is None
+    assert valid.generated == _generate_greedily(scheduler, valid.words, 4)
+    assert len(finished) == 2
+    assert scheduler.state()['failed'] == 1
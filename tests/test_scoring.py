@@ -0,0 +1,75 @@
+import math
+import torch
+import pytest
+import torch.nn.functional as F
+from unittest import mock
+from gpt2.data.vocabulary import Vocab
+from gpt2.modeling.transformer import Transformer
+from gpt2.misc.scoring import Scorer
+
+
+_fake_vocab = '<unk>\nhello\nworld\n##s\n.'
+
+
+def _create_scorer(seq_len: int = 8, stride: int = 4) -> Scorer:
+    with mock.patch('builtins.open') as mock_open:
+        file_mock = mock_open.return_value.__enter__.return_value
+        file_mock.read.return_value = _fake_vocab
+        vocab = Vocab('')
+
+    model = Transformer(layers=2, pad_idx=vocab.pad_idx, words=len(vocab),
+                        seq_len=seq_len, heads=2, dims=16, rate=4, dropout=0,
+                        bidirectional=False).eval()
+    return Scorer(model, vocab, seq_len=seq_len, stride=stride, batch_size=3)
+
+
+def test_scorer_predicts_every_word_once():
+    scorer = _create_scorer(seq_len=8, stride=3)
+
+    for length in range(1, 30):
+        windows = scorer._windows(list(range(length)))
+        assert sum(scored for _, _, scored in windows) == length - 1
+
+        # Each window should be shorter than the maximum length and scored
+        # targets should have at least `seq_len - stride` words of context.
+        for i, (begin, end, scored) in enumerate(windows):
+            assert end - begin <= 8
+            assert i == 0 or end - scored - begin >= 8 - 3
+
+
+def test_scorer_rejects_non_positive_stride():
+    for stride in [0, -1]:
+        with pytest.raises(ValueError):
+            _create_scorer(stride=stride)
+
+
+def test_scorer_calculates_exact_likelihood_of_short_documents():
+    scorer = _create_scorer()
+    documents = [[0, 4, 5, 6, 1], [0, 5, 1], [0, 4, 4, 5, 6, 7, 4, 1]]
+
+    # Compare the scores with the negative log-likelihoods of the whole
+    # documents calculated individually.
+    for (nll, words), document in zip(scorer.score(documents), documents):
+        x = torch.tensor([document])
+        logits, _ = scorer.model(x[:, :-1], None)
+        expected = F.cross_entropy(logits[0], x[0, 1:], reduction='sum')
+
+        assert words == len(document) - 1
+        assert math.isclose(nll, expected.item(), rel_tol=1e-5)
+
+
+def test_scorer_scores_long_documents_with_strided_windows():
+    scorer = _create_scorer(seq_len=8, stride=4)
+    document = [0] + [4, 5, 6, 7] * 5 + [1]
+
+    # Check if the batched scores are same as the scores of each window.
+    (nll, words), = scorer.score([document])
+    expected = 0.0
+    for begin, end, scored in scorer._windows(document):
+        x = torch.tensor([document[begin:end + 1]])
+        logits, _ = scorer.model(x[:, :-1], None)
+        expected += F.cross_entropy(logits[0, -scored:], x[0, -scored:],
+                                    reduction='sum').item()
+
+    assert words == len(document) - 1
+    assert math.isclose(nll, expected, rel_tol=1e-5)
@@ -0,0 +1,115 @@
+import argparse
+import pytest
+import torch
+from gpt2.modeling.transformer import Transformer
+from gpt2.misc import serializing
+
+
+def test_tensor_file_round_trip(tmp_path):
+    path = str(tmp_path / 'ckpt.tensors')
+    tensors = {'weight': torch.randn(3, 5),
+               'half': torch.randn(7).half(),
+               'index': torch.arange(11),
+               'mask': torch.tensor([True, False, True]),
+               'empty': torch.zeros(0, 4)}
+    serializing.save_tensors(path, tensors, {'layers': 2, 'dims': 16})
+
+    assert serializing.is_tensor_file(path)
+    assert serializing.load_config(path) == {'layers': 2, 'dims': 16}
+
+    loaded, config = serializing.load_tensors(path)
+    assert config == {'layers': 2, 'dims': 16}
+    for name, tensor in tensors.items():
+        assert loaded[name].dtype == tensor.dtype
+        assert loaded[name].shape == tensor.shape
+        assert (loaded[name] == tensor).all()
+
+    # Every tensor should be aligned in the file.
+    with open(path, 'rb') as fp:
+        header, start = serializing._read_header(fp)
+    assert start % serializing._ALIGNMENT == 0
+    for entry in header['tensors'].values():
+        assert entry['offset'] % serializing._ALIGNMENT == 0
+
+
+def test_load_model_from_tensor_file_and_pickle(tmp_path):
+    model = Transformer(layers=2, pad_idx=0, words=50, seq_len=16, heads=2,
+                        dims=16, rate=4, dropout=0, bidirectional=False)
+    x = torch.randint(50, (2, 8))
+
+    pickle_path = str(tmp_path / 'ckpt.pth')
+    tensor_path = str(tmp_path / 'ckpt.tensors')
+    torch.save({'model': model.state_dict()}, pickle_path)
+    serializing.save_tensors(tensor_path, model.state_dict())
+
+    for path in [pickle_path, tensor_path]:
+        restored = Transformer(layers=2, pad_idx=0, words=50, seq_len=16,
+                               heads=2, dims=16, rate=4, dropout=0,
+                               bidirectional=False)
+        serializing.load_model(restored, path)
+
+        assert not serializing.is_tensor_file(pickle_path)
+        assert torch.allclose(model.eval()(x)[0], restored.eval()(x)[0])
+
+
+def test_infer_config_from_parameters():
+    model = Transformer(layers=3, pad_idx=0, words=50, seq_len=16, heads=2,
+                        dims=16, rate=2, dropout=0, bidirectional=False)
+
+    assert serializing.infer_config(model.state_dict(), heads=4) == {
+        'layers': 3, 'heads': 4, 'dims': 16, 'rate': 2, 'seq_len': 16,
+        'words': 50}
+    with pytest.raises(ValueError):
+        serializing.infer_config(model.state_dict(), heads=3)
+
+
+def test_load_model_copies_parameters_without_assign(tmp_path):
+    model = Transformer(layers=2, pad_idx=0, words=50, seq_len=16, heads=2,
+                        dims=16, rate=4, dropout=0, bidirectional=False)
+    tensor_path = str(tmp_path / 'ckpt.tensors')
+    serializing.save_tensors(tensor_path, model.state_dict())
+
+    restored = Transformer(layers=2, pad_idx=0, words=50, seq_len=16,
+                           heads=2, dims=16, rate=4, dropout=0,
+                           bidirectional=False)
+
+    # Emulate the old versions of pytorch which do not support `assign`.
+    def _modified_load_state_dict(state_dict, strict=True):
+        return _old_load_state_dict(state_dict, strict)
+
+    _old_load_state_dict = restored.load_state_dict
+    restored.load_state_dict = _modified_load_state_dict
+
+    serializing.load_model(restored, tensor_path)
+    for p1, p2 in zip(model.parameters(), restored.parameters()):
+        assert torch.equal(p1, p2)
+
+
+def test_update_args_keeps_shorter_sequence_length(tmp_path, capsys):
+    model = Transformer(layers=2, pad_idx=0, words=50, seq_len=16, heads=2,
+                        dims=16, rate=4, dropout=0, bidirectional=False)
+    tensor_path = str(tmp_path / 'ckpt.tensors')
+    serializing.save_tensors(
+        tensor_path, model.state_dict(),
+        serializing.infer_config(model.state_dict(), heads=2))
+
+    # The architecture is replaced while the shorter length is kept.
+    args = argparse.Namespace(checkpoint=tensor_path, layers=12, heads=2,
+                              dims=16, rate=4, seq_len=8)
+    serializing.update_args(args)
+    assert (args.layers, args.seq_len) == (2, 8)
+    assert '`layers`' in capsys.readouterr().err
+
+    args.seq_len = 32
+    serializing.update_args(args)
+    assert args.seq_len == 16
+    assert '`seq_len`' in capsys.readouterr().err
+
+    # The model of the shorter length uses the leading positions.
+    restored = Transformer(layers=2, pad_idx=0, words=50, seq_len=8,
+                           heads=2, dims=16, rate=4, dropout=0,
+                           bidirectional=False)
+    serializing.load_model(restored, tensor_path)
+
+    x = torch.randint(50, (2, 8))
+    assert torch.allclose(model.eval()(x)[0], restored.eval()(x)[0])
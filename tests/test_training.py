@@ -0,0 +1,130 @@
+import copy
+import torch
+import torch.optim as optim
+from gpt2.modeling.transformer import Transformer
+from gpt2.misc.objective import LMObjective
+from gpt2.misc.training import Trainer
+from gpt2.misc.recording import MetricsLog
+
+
+class _FakeDataset(object):
+    def __init__(self, data):
+        self.data = data
+
+    def fetch(self, batch=None, device=None):
+        return self.data
+
+
+def _create_trainer(model: Transformer, data) -> Trainer:
+    optimizer = optim.SGD(model.parameters(), lr=0.1)
+    scheduler = optim.lr_scheduler.LambdaLR(optimizer, lambda step: 1)
+    objective = LMObjective(model, pad_idx=0)
+
+    return Trainer(model, optimizer, scheduler, _FakeDataset(data),
+                   _FakeDataset(data), train_objective=objective,
+                   eval_objective=objective)
+
+
+def test_trainer_accumulates_gradients_of_micro_batches():
+    model = Transformer(layers=2, pad_idx=0, words=50, seq_len=10, heads=2,
+                        dims=16, rate=4, dropout=0, bidirectional=False)
+
+    # Create sequences which have different numbers of padding tokens.
+    inputs = torch.randint(1, 50, (4, 10))
+    inputs[0, 3:] = 0
+    inputs[1, 6:] = 0
+    inputs[3, 8:] = 0
+    data = {'input': inputs[:, :-1], 'output': inputs[:, 1:]}
+
+    full = _create_trainer(copy.deepcopy(model), data)
+    full.train(accumulate=1)
+
+    accumulated = _create_trainer(copy.deepcopy(model), data)
+    accumulated.train(accumulate=2)
+
+    # Check if the updated parameters and the recorded losses are same.
+    for p1, p2 in zip(full.model.parameters(),
+                      accumulated.model.parameters()):
+        assert torch.allclose(p1, p2, atol=1e-6)
+
+    assert abs(full.batch_metrics['train/loss'][0]
+               - accumulated.batch_metrics['train/loss'][0]) < 1e-5
+
+
+def test_trainer_records_throughput_metrics():
+    model = Transformer(layers=2, pad_idx=0, words=50, seq_len=10, heads=2,
+                        dims=16, rate=4, dropout=0, bidirectional=False)
+    inputs = torch.randint(1, 50, (4, 10))
+    inputs[0, 5:] = 0
+    data = {'input': inputs[:, :-1], 'output': inputs[:, 1:]}
+
+    trainer = _create_trainer(model, data)
+    trainer._peak_tflops = 1.0
+    trainer.train(accumulate=2)
+    trainer.stamp(0)
+
+    metrics = {k: v[0][1] for k, v in trainer.metrics.items()}
+
+    # Non-pad tokens should be counted separately from all tokens.
+    assert abs(metrics['train/real_tokens_per_sec']
+               / metrics['train/tokens_per_sec'] - 31 / 36) < 1e-6
+    assert abs(metrics['train/samples_per_sec']
+               / metrics['train/tokens_per_sec'] - 4 / 36) < 1e-6
+
+    # The step time should be split into the phases.
+    for phase in ['data', 'forward', 'backward', 'optimizer']:
+        assert metrics[f'train/{phase}_ms'] >= 0
+    assert metrics['train/forward_ms'] > 0 and metrics['train/mfu'] > 0
+    assert abs(metrics['train/mfu'] - metrics['train/tflops']) < 1e-9
+    assert metrics['train/peak_memory_mb'] > 0
+
+
+def test_trainer_does_not_transfer_to_host_in_training_step():
+    model = Transformer(layers=2, pad_idx=0, words=50, seq_len=10, heads=2,
+                        dims=16, rate=4, dropout=0, bidirectional=False)
+    inputs = torch.randint(1, 50, (4, 10))
+    inputs[0, 5:] = 0
+    data = {'input': inputs[:, :-1], 'output': inputs[:, 1:]}
+
+    trainer = _create_trainer(model, data)
+
+    # The metrics should be transferred only when they are stamped.
+    def _item(*args, **kwargs):
+        raise AssertionError('`item` is called in the training step.')
+
+    _old_item = torch.Tensor.item
+    torch.Tensor.item = _item
+    try:
+        for accumulate in [1, 2]:
+            trainer.train(accumulate=accumulate)
+    finally:
+        torch.Tensor.item = _old_item
+
+    trainer.stamp(0)
+    assert trainer.metrics['train/real_tokens_per_sec'][0][1] > 0
+
+
+def test_trainer_recreates_metrics_log_from_old_checkpoint(tmp_path):
+    model = Transformer(layers=2, pad_idx=0, words=50, seq_len=10, heads=2,
+                        dims=16, rate=4, dropout=0, bidirectional=False)
+    inputs = torch.randint(1, 50, (4, 10))
+    data = {'input': inputs[:, :-1], 'output': inputs[:, 1:]}
+
+    # Save the checkpoint of the old format which contains the whole metrics
+    # without the state of the metrics log.
+    checkpoint = str(tmp_path / 'ckpt.pth')
+    trainer = _create_trainer(model, data)
+    trainer.metrics = {'train/loss': [(0, 3.0), (1, 2.0)]}
+    trainer.save(checkpoint)
+
+    # Write the stale records of the earlier run to the log.
+    trainer.metrics_log = MetricsLog(f'{checkpoint}.metrics')
+    trainer.metrics_log.write(5, {'train/loss': 9.0, 'eval/loss': 9.0})
+
+    trainer.restore(checkpoint)
+    assert trainer.metrics_log.names() == ['eval/loss', 'train/loss']
+    assert len(trainer.metrics_log.read('eval/loss')[0]) == 0
+    steps, values = trainer.metrics_log.read('train/loss')
+    assert steps.tolist() == [0, 1]
+    assert values.tolist() == [3.0, 2.0]
+    assert trainer.metrics == {'train/loss': [(1, 2.0)]}
@@ -1,5 +1,6 @@
 import torch
 from gpt2.modeling.transformer import TransformerLayer, Transformer
+from gpt2.modeling.packing import Packing
 
 
 def test_the_shape_from_transformer_layer():
@@ -87,3 +88,70 @@ def test_the_shape_from_transformer_model():
     for p in past:
         assert p[0].shape == (10, 16)
         assert p[1].shape == (10, 16)
+
+
+def test_packed_transformer_model_matches_padded_one():
+    # Create transformer model.
+    model = Transformer(layers=2,
+                        pad_idx=0,
+                        words=80,
+                        seq_len=100,
+                        heads=2,
+                        dims=16,
+                        rate=4,
+                        bidirectional=False).eval()
+
+    # Create right-padded sequences of which lengths are different.
+    input_tensor = torch.randint(1, 80, (4, 12), dtype=torch.long)
+    for i, length in enumerate([12, 7, 3, 9]):
+        input_tensor[i, length:] = 0
+
+    real = input_tensor != 0
+    packing = Packing(real)
+    assert packing.width == 12
+
+    # Check if the packed outputs are equal to the padded ones at real
+    # tokens.
+    padded_output, _ = model(input_tensor)
+    packed_output, _ = model(input_tensor, packing=packing)
+    assert packed_output.shape == (31, 80)
+    assert torch.allclose(packed_output, padded_output[real], atol=1e-5)
+
+    # Test if packed tensors are restored to the padded layout.
+    unpacked = packing.unpack(packed_output)
+    assert unpacked.shape == (4, 12, 80)
+    assert (unpacked[~real] == 0).all()
+    assert (packing.pack(unpacked) == packed_output).all()
+
+
+def test_transformer_model_decodes_left_padded_sequences():
+    # Create transformer model.
+    model = Transformer(layers=2,
+                        pad_idx=0,
+                        words=80,
+                        seq_len=100,
+                        heads=2,
+                        dims=16,
+                        rate=4,
+                        bidirectional=False).eval()
+
+    # Calculate two sequences of which lengths are different separately.
+    seq_1 = torch.randint(1, 80, (6,), dtype=torch.long)
+    seq_2 = torch.randint(1, 80, (3,), dtype=torch.long)
+    expected_1, _ = model(seq_1)
+    expected_2, _ = model(seq_2)
+
+    # Calculate the left-padded sequences with their previous words.
+    input_tensor = torch.zeros((2, 5), dtype=torch.long)
+    input_tensor[0], input_tensor[1, 3:] = seq_1[:5], seq_2[:2]
+    padding = input_tensor == 0
+
+    _, past = model(input_tensor, padding=padding)
+
+    padding = torch.cat((padding, torch.zeros((2, 1)).bool()), dim=-1)
+    output_tensor, _ = model(torch.stack((seq_1[5:], seq_2[2:])), past,
+                             padding=padding)
+
+    # Check if the predictions of the last words are equal.
+    assert torch.allclose(output_tensor[0, -1], expected_1[-1], atol=1e-5)
+    assert torch.allclose(output_tensor[1, -1], expected_2[-1], atol=1e-5)
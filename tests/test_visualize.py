@@ -0,0 +1,43 @@
+import numpy as np
+from gpt2.misc.recording import MetricsLog
+from gpt2.visualize import _MetricsTail
+
+
+def test_metrics_tail_reads_appended_metrics_with_bounded_points(tmp_path):
+    metrics_log = MetricsLog(str(tmp_path / 'ckpt.metrics'))
+    tail = _MetricsTail(metrics_log, points=100)
+    assert not tail.update()
+
+    for chunk in range(10):
+        for step in range(chunk * 1000, (chunk + 1) * 1000):
+            metrics_log.write(step, {'train/loss': np.sin(step / 500)})
+
+        assert tail.update()
+        steps, values = tail.metrics['train/loss']
+        assert tail.offsets['train/loss'] == (chunk + 1) * 1000
+        assert len(steps) <= 200
+        assert steps[0] == 0 and steps[-1] == (chunk + 1) * 1000 - 1
+
+    # The kept points should cover the whole range of the steps.
+    assert (np.diff(steps) < 500).all()
+    assert not tail.update()
+
+
+def test_metrics_tail_reads_truncated_log_from_start(tmp_path):
+    metrics_log = MetricsLog(str(tmp_path / 'ckpt.metrics'))
+    tail = _MetricsTail(metrics_log, points=100)
+
+    for step in range(10):
+        metrics_log.write(step, {'train/loss': 1.0, 'eval/loss': 2.0})
+    assert tail.update()
+
+    # Emulate the fresh training run which truncates the log.
+    metrics_log.load_state_dict({'directory': metrics_log.directory,
+                                 'offsets': {}})
+    for step in range(3):
+        metrics_log.write(step, {'train/loss': 3.0})
+
+    assert tail.update()
+    assert tail.offsets == {'train/loss': 3}
+    assert tail.metrics['train/loss'][1].tolist() == [3.0, 3.0, 3.0]
+    assert 'eval/loss' not in tail.metrics